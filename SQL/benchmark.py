@@ -0,0 +1,787 @@
+import argparse
+import itertools
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from writebuffer import WriteBuffer
+import timeline
+import schema
+import search
+import storage
+import importer
+import trending
+import service
+from records import Tweet, User, USER_COLUMNS, fetch_records
+
+# The corpus generator is shared with the MongoDB benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.corpus import (WORDS, FIRST_NAMES, CITIES, SCALES, random_text, random_word, generate_tweets, hashtag_stream,
+                           corpus_size, user_record, follow_graph, generate_activity, hashtag_name, zipf_rank)
+from common.entities import hashtags, hashtag_keys
+from common.harness import Recorder, row_cost
+from common.querystats import from_environment
+from common.trending import Trending, timestamp
+
+def open_db(path, users=1000):
+    """
+    Function to create a benchmark database with the tweetbook tables and some users.
+
+    Arguments:
+    path (str): The path of the database file, it is recreated.
+    users (int): The number of users to create.
+
+    Returns:
+    connection (sqlite3.Connection): The open connection.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA foreign_keys=ON')
+    # Room for the indexes while loading millions of rows
+    connection.execute('PRAGMA cache_size=-262144')
+    schema.migrate(connection)
+    with connection:
+        connection.executemany('INSERT INTO users(usr,pwd,name,email,city,timezone) VALUES (?,?,?,?,?,?)',
+            [(u, 'pwd', 'user{}'.format(u), 'user{}@mail.com'.format(u), 'Edmonton', -7) for u in range(1, users + 1)])
+    return connection
+
+def populate(connection, users, tweets, follows, heavy, heavy_follows, retweets, seed=291):
+    """
+    Function to fill a benchmark database with tweets, follows and retweets.
+    Writers are picked with a power law so a few users write most tweets, and
+    the first heavy users each follow heavy_follows accounts.
+
+    Arguments:
+    connection (sqlite3.Connection): A connection from open_db.
+    users (int): The number of users in the database.
+    tweets (int): The number of tweets to write.
+    follows (int): The number of accounts every other user follows.
+    heavy (int): The number of users who follow heavy_follows accounts.
+    heavy_follows (int): The number of accounts each heavy user follows.
+    retweets (int): The number of retweets to write.
+    seed (int): Random seed.
+
+    Returns: None
+    """
+    rng = random.Random(seed)
+
+    def writer():
+        return min(users, int(rng.paretovariate(1.1)))
+
+    def tweet_rows():
+        for tid in range(1, tweets + 1):
+            text = random_text(rng)
+            for term in hashtags(text):
+                mentions.append((tid, term))
+            yield (tid, writer(), '2023-{:02d}-{:02d}'.format(rng.randint(1, 12), rng.randint(1, 28)), text, None)
+
+    mentions = []
+    with schema.bulk_load(connection), connection:
+        connection.executemany("INSERT INTO tweets(tid,writer,tdate,text,replyto) VALUES (?,?,?,?,?)", tweet_rows())
+        connection.executemany("INSERT OR IGNORE INTO hashtags(term) VALUES (?)", [(w,) for w in WORDS])
+        connection.executemany("INSERT INTO mentions(tid,term) VALUES (?,?)", mentions)
+        connection.executemany("INSERT OR IGNORE INTO follows(flwer,flwee,start_date) VALUES (?,?,'2023-01-01')",
+            ((usr, flwee) for usr in range(1, users + 1)
+             for flwee in rng.sample(range(1, users + 1), min(users, heavy_follows if usr <= heavy else follows))
+             if flwee != usr))
+        connection.executemany("INSERT OR IGNORE INTO retweets(usr,tid,rdate) VALUES (?,?,'2023-06-01')",
+            ((writer(), rng.randint(1, tweets)) for _ in range(retweets)))
+
+def compose_direct(connection, usr, text):
+    """
+    Function that writes a tweet the way compose_tweet originally did, as the benchmark baseline.
+    """
+    cursor = connection.cursor()
+    hashtags = re.findall(r"[#]\w+", text)
+    cursor.execute('SELECT MAX(tid) FROM tweets')
+    tid = (cursor.fetchone()[0] or 0) + 1
+    tdate = time.strftime("%Y-%m-%d")
+    cursor.execute("INSERT INTO tweets(tid,writer,tdate,text,replyto) VALUES (?,?,?,?,?)",(tid,usr,tdate,text,None))
+    for i in set(hashtags):
+        term = i[1:]
+        cursor.execute('REPLACE INTO hashtags(term) VALUES (?)',(term,))
+        cursor.execute('INSERT INTO mentions(tid,term) VALUES(?,?)',(tid,term,))
+    connection.commit()
+
+def bench_compose(args):
+    """
+    Function to compare the original per-tweet writes with the write-behind buffer.
+
+    Arguments:
+    args (Namespace): Parsed command-line arguments.
+
+    Returns: None
+    """
+    path = os.path.join(args.dir, 'bench_compose.db')
+
+    def run(name, setup, finish):
+        connection = open_db(path)
+        write = setup(connection)
+        rng = random.Random(args.seed)
+        start = time.perf_counter()
+        for i in range(args.n):
+            write(rng.randint(1, 1000), random_text(rng))
+        finish()
+        elapsed = time.perf_counter() - start
+        connection.close()
+        print('{:<26} {:>8} tweets {:>8.2f}s {:>10.0f} writes/s'.format(name, args.n, elapsed, args.n / elapsed))
+
+    run('direct (original)', lambda c: (lambda usr, text: compose_direct(c, usr, text)), lambda: None)
+    for size in args.sizes:
+        buffers = []
+        def setup(connection):
+            buffer = WriteBuffer(connection, max_tweets=size, max_delay=args.delay)
+            buffers.append(buffer)
+            tdate = time.strftime("%Y-%m-%d")
+            return lambda usr, text: buffer.add(buffer.next_tid(), usr, tdate, text, None,
+                                                hashtags(text))
+        run('buffered ({} / {}s)'.format(size, args.delay), setup, lambda: buffers[-1].flush())
+    os.remove(path)
+
+FEED_QUERY = """
+    SELECT tweets.*
+    FROM tweets
+    JOIN follows ON follows.flwee = tweets.writer
+    WHERE follows.flwer = ?
+    UNION
+    SELECT tweets.*
+    FROM tweets
+    JOIN retweets ON retweets.tid = tweets.tid
+    JOIN follows ON follows.flwee = retweets.usr
+    WHERE follows.flwer = ?
+    ORDER BY tweets.tdate DESC
+    LIMIT 5 OFFSET ?"""
+
+def bench_feed(args):
+    """
+    Function to compare the UNION feed query with the timeline table for users who follow thousands of accounts.
+
+    Arguments:
+    args (Namespace): Parsed command-line arguments.
+
+    Returns: None
+    """
+    path = os.path.join(args.dir, 'bench_feed.db')
+    connection = open_db(path, args.users)
+    populate(connection, args.users, args.tweets, args.follows, args.heavy, args.heavy_follows, args.retweets)
+
+    start = time.perf_counter()
+    timeline.ensure_timeline(connection)
+    rows = connection.execute('SELECT COUNT(*) FROM timeline').fetchone()[0]
+    print('timeline backfill: {} rows in {:.2f}s'.format(rows, time.perf_counter() - start))
+
+    cursor = connection.cursor()
+    for page in args.pages:
+        # Query path: OFFSET grows with the page number
+        start = time.perf_counter()
+        for usr in range(1, args.heavy + 1):
+            cursor.execute(FEED_QUERY, (usr, usr, (page - 1) * 5))
+            cursor.fetchall()
+        query_ms = (time.perf_counter() - start) * 1000 / args.heavy
+
+        # Timeline path: walk pages by key up to the same page, timing only the last one
+        total = 0
+        for usr in range(1, args.heavy + 1):
+            bound = None
+            for _ in range(page - 1):
+                timeline.feed_page(cursor, usr, bound)
+                last = cursor.fetchall()[-1]
+                bound = (last[2], last[0])
+            start = time.perf_counter()
+            timeline.feed_page(cursor, usr, bound)
+            cursor.fetchall()
+            total += time.perf_counter() - start
+        print('page {:>4}: query {:>9.2f} ms   timeline {:>7.3f} ms'.format(page, query_ms, total * 1000 / args.heavy))
+
+    # Cost of fan-out on write for the most followed writer
+    buffer = WriteBuffer(connection, max_tweets=args.compose)
+    buffer.after_write.append(timeline.fan_out_tweets)
+    start = time.perf_counter()
+    for _ in range(args.compose):
+        buffer.add(buffer.next_tid(), 1, '2024-01-01', 'fan out', None, [])
+    buffer.flush()
+    followers = connection.execute('SELECT COUNT(*) FROM follows WHERE flwee = 1').fetchone()[0]
+    print('compose with fan-out to {} followers: {:.0f} tweets/s'.format(
+        followers, args.compose / (time.perf_counter() - start)))
+    connection.close()
+    os.remove(path)
+
+def search_like(cursor, keywords, page_num):
+    """
+    Function that searches the way search_tweets originally did, one LIKE query per keyword, as the benchmark baseline.
+    """
+    tweetlist = []
+    offset = (page_num-1)*5
+    for i in keywords:
+        if i.startswith('#'):
+            cursor.execute("""
+                SELECT t1.* FROM tweets t1, mentions m1
+                WHERE m1.term LIKE ? AND m1.tid = t1.tid
+                ORDER BY tdate DESC LIMIT 5 OFFSET ?""", (i[1:], offset))
+        else:
+            cursor.execute("SELECT * FROM tweets WHERE text LIKE ? ORDER BY tdate DESC LIMIT 10 OFFSET ?",
+                ('%'+i+'%', offset))
+        result = cursor.fetchall()
+        tweetlist = result + list(set(tweetlist)-set(result))
+    return tweetlist
+
+def bench_search(args):
+    """
+    Function to compare the per-keyword LIKE search with the full-text index.
+
+    Arguments:
+    args (Namespace): Parsed command-line arguments.
+
+    Returns: None
+    """
+    path = os.path.join(args.dir, 'bench_search.db')
+    connection = open_db(path, args.users)
+    start = time.perf_counter()
+    populate(connection, args.users, args.tweets, 5, 0, 0, 0)
+    connection.execute('ANALYZE')
+    print('{} tweets loaded and indexed in {:.1f}s'.format(args.tweets, time.perf_counter() - start))
+
+    rng = random.Random(args.seed)
+    queries = []
+    for _ in range(args.queries):
+        words = [random_word(rng) for _ in range(rng.randint(1, 3))]
+        queries.append([('#' + w) if rng.random() < 0.3 else w for w in words])
+
+    cursor = connection.cursor()
+    for page in args.pages:
+        for name, run in (('LIKE per keyword', lambda kw: search_like(cursor, kw, page)),
+                          ('FTS5 MATCH', lambda kw: search.search_page(cursor, kw, page) and cursor.fetchall())):
+            samples = []
+            for keywords in queries:
+                start = time.perf_counter()
+                run(keywords)
+                samples.append((time.perf_counter() - start) * 1000)
+            samples.sort()
+            print('page {:>3} {:<18} p50 {:>9.2f} ms  p95 {:>9.2f} ms'.format(
+                page, name, samples[len(samples) // 2], samples[int(len(samples) * 0.95)]))
+    connection.close()
+    os.remove(path)
+
+def bench_import(args):
+    """
+    Function to compare importing the NDJSON corpus the way the application
+    writes (durable profile, live indexes and triggers, small transactions)
+    with the bulk importer settings.
+    The corpus is the same file the MongoDB load benchmark generates for the same -n and seed.
+
+    Arguments:
+    args (Namespace): Parsed command-line arguments.
+
+    Returns: None
+    """
+    corpus = os.path.join(args.dir, 'bench-{}.json'.format(args.n))
+    if not os.path.exists(corpus):
+        generate_tweets(corpus, args.n, args.seed)
+    path = os.path.join(args.dir, 'bench_import.db')
+
+    for name, profile, batch_size, deferred in (
+            ('live indexes, 1000/txn', 'durable', 1000, False),
+            ('bulk, {}/txn'.format(args.batch_size), 'bulk', args.batch_size, True)):
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        connection = storage.open_connection(path, profile)
+        schema.migrate(connection)
+        imported, errors, seconds = importer.import_file(connection, corpus, batch_size, resume=False, deferred=deferred)
+        start = time.perf_counter()
+        importer.finish_import(connection)
+        seconds += time.perf_counter() - start
+        connection.close()
+        print('{:<24} {:>8} docs {:>8.1f}s {:>9.0f} docs/s'.format(name, imported, seconds, imported / seconds))
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+# The exact trending list: hashtag uses since a date, counted from the base tables
+TRENDING_QUERY = """
+    SELECT LOWER(mentions.term) AS tag, COUNT(DISTINCT mentions.tid) AS uses
+    FROM tweets JOIN mentions ON mentions.tid = tweets.tid
+    WHERE tweets.tdate >= ?
+    GROUP BY LOWER(mentions.term)
+    ORDER BY uses DESC
+    LIMIT ?"""
+
+def bench_trending(args):
+    """
+    Function to compare the trending engine with an exact GROUP BY over the
+    tweets of the last day: time to count, save and load, latency of the top
+    list, and how close the estimated list is to the exact one.
+    The tweets span whole days, so the engine's window of the last 24 hours is
+    exactly the last date the GROUP BY filters on.
+
+    Arguments:
+    args (Namespace): Parsed command-line arguments.
+
+    Returns: None
+    """
+    path = os.path.join(args.dir, 'bench_trending.db')
+    connection = open_db(path, args.users)
+    rng = random.Random(args.seed)
+    events = list(hashtag_stream(args.n, args.days, args.tags, seed=args.seed))
+
+    def tweet_rows():
+        for tid, (when, tags) in enumerate(events, start=1):
+            for tag in tags:
+                mentions.append((tid, tag))
+            yield (tid, rng.randint(1, args.users), time.strftime('%Y-%m-%d', time.gmtime(when)),
+                   ' '.join('#' + tag for tag in tags), None)
+
+    mentions = []
+    with schema.bulk_load(connection), connection:
+        connection.executemany('INSERT INTO tweets(tid,writer,tdate,text,replyto) VALUES (?,?,?,?,?)', tweet_rows())
+        connection.executemany('INSERT OR IGNORE INTO hashtags(term) VALUES (?)', ((tag,) for _, tag in mentions))
+        connection.executemany('INSERT INTO mentions(tid,term) VALUES (?,?)', mentions)
+
+    engine = Trending()
+    start = time.perf_counter()
+    for when, tags in events:
+        engine.add(tags, when)
+    counted = time.perf_counter() - start
+    start = time.perf_counter()
+    with connection:
+        trending.save_trending(connection, engine)
+    saved = time.perf_counter() - start
+    start = time.perf_counter()
+    engine = trending.load_trending(connection)
+    loaded = time.perf_counter() - start
+    print('{} tweets over {} days, {} hashtags; {} buckets of {:.0f} KB'.format(
+        args.n, args.days, args.tags, len(engine.buckets), len(engine.total.to_bytes()) / 1024))
+    print('count {:.1f} us/tweet   save {:.1f} ms   load {:.1f} ms'.format(
+        counted / args.n * 1e6, saved * 1000, loaded * 1000))
+
+    since = time.strftime('%Y-%m-%d', time.gmtime(engine.window_start()))
+    for name, top, repeat in (
+            ('sketch + top-K', lambda: engine.top(args.top), args.repeat),
+            ('GROUP BY', lambda: connection.execute(TRENDING_QUERY, (since, args.top)).fetchall(), max(1, args.repeat // 100))):
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            top()
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        print('{:<16} p50 {:>10.3f} ms  p95 {:>10.3f} ms  ({} calls)'.format(
+            name, samples[len(samples) // 2], samples[int(len(samples) * 0.95)], repeat))
+
+    exact = connection.execute(TRENDING_QUERY, (since, args.top)).fetchall()
+    estimated = engine.top(args.top)
+    found = len({tag for tag, _ in estimated} & {tag for tag, _ in exact})
+    error = max(engine.count(tag) / uses - 1 for tag, uses in exact)
+    print('top {}: {} of {} hashtags match the exact list, counts at most {:.2%} high'.format(
+        args.top, found, len(exact), error))
+    connection.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def dict_rows(cursor):
+    """
+    Function that fetches rows as dictionaries keyed by column name, as the pages did before the records, as the benchmark baseline.
+    """
+    column_names = [col[0] for col in cursor.description]
+    return [dict(zip(column_names, row)) for row in cursor.fetchall()]
+
+def numbered_copies(rows):
+    """
+    Function that copies and numbers dictionary rows, as every page read from the cache did before the records.
+    """
+    rows = [dict(row) for row in rows]
+    for i, row in enumerate(rows, start=1):
+        row['num'] = i
+    return rows
+
+def bench_records(args):
+    """
+    Function to compare reading the rows of the page queries as dictionaries, as
+    they were before, with reading them as Tweet and User records: time, memory
+    kept and peak while reading, and memory blocks kept, per 10,000 rows.
+    The rows are read straight from the tables, so the numbers are per row and do
+    not depend on the page queries themselves.
+
+    Arguments:
+    args (Namespace): Parsed command-line arguments.
+
+    Returns: None
+    """
+    path = os.path.join(args.dir, 'bench_records.db')
+    connection = open_db(path, args.n)
+    rng = random.Random(args.seed)
+    with connection:
+        connection.executemany('INSERT INTO tweets(tid,writer,tdate,text,replyto) VALUES (?,?,?,?,?)',
+            ((tid, rng.randint(1, args.n), '2023-{:02d}-{:02d}'.format(rng.randint(1, 12), rng.randint(1, 28)),
+              random_text(rng), None) for tid in range(1, args.n + 1)))
+
+    tweets_sql = 'SELECT * FROM tweets'
+    users_sql = 'SELECT {} FROM users'.format(USER_COLUMNS)
+    variants = [
+        ('tweets', 'dicts', lambda: dict_rows(connection.execute(tweets_sql))),
+        ('tweets', 'dicts, copied and numbered', lambda: numbered_copies(dict_rows(connection.execute(tweets_sql)))),
+        ('tweets', 'Tweet records', lambda: fetch_records(connection.execute(tweets_sql), Tweet)),
+        ('users', 'dicts with pwd', lambda: dict_rows(connection.execute('SELECT * FROM users'))),
+        ('users', 'User records', lambda: fetch_records(connection.execute(users_sql), User)),
+    ]
+    print('{} tweets and {} users; per 10,000 rows:'.format(args.n, args.n))
+    print('{:<7} {:<27} {:>8} {:>10} {:>10} {:>8}'.format('table', 'rows as', 'ms', 'kept KB', 'peak KB', 'blocks'))
+    for table, name, build in variants:
+        cost = row_cost(build, args.n, args.repeat)
+        print('{:<7} {:<27} {:>8.2f} {:>10.1f} {:>10.1f} {:>8}'.format(
+            table, name, cost['ms'], cost['kept_kb'], cost['peak_kb'], cost['blocks']))
+    connection.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+# (writer profile, reader profile) pairs compared by the mixed benchmark
+MIXED_SETUPS = [
+    ('legacy', 'legacy'),
+    ('durable', 'durable'),
+    ('fast', 'fast'),
+    ('fast', 'readonly'),
+]
+
+def bench_mixed(args):
+    """
+    Function to compare storage profiles under a mixed load: one thread composing
+    tweets, each in its own transaction, while reader threads page through feeds.
+
+    Arguments:
+    args (Namespace): Parsed command-line arguments.
+
+    Returns: None
+    """
+    path = os.path.join(args.dir, 'bench_mixed.db')
+    connection = open_db(path, args.users)
+    populate(connection, args.users, args.tweets, args.follows, 0, 0, args.retweets)
+    connection.execute('ANALYZE')
+    connection.commit()
+    connection.close()
+
+    for writer_profile, reader_profile in MIXED_SETUPS:
+        # The writer sets the journal mode, which is kept in the database file
+        writer = storage.open_connection(path, writer_profile, check_same_thread=False)
+        readers = [storage.open_connection(path, reader_profile, check_same_thread=False) for _ in range(args.readers)]
+        stop = threading.Event()
+        writes = []
+        reads = [[] for _ in readers]
+        errors = []
+
+        def write_loop():
+            rng = random.Random(args.seed)
+            # A buffer of one commits every tweet on its own, the worst case for the journal
+            buffer = WriteBuffer(writer, max_tweets=1)
+            tdate = time.strftime("%Y-%m-%d")
+            while not stop.is_set():
+                text = random_text(rng)
+                start = time.perf_counter()
+                try:
+                    buffer.add(buffer.next_tid(), rng.randint(1, args.users), tdate, text, None,
+                               hashtags(text))
+                except sqlite3.OperationalError as e:
+                    buffer.tweets, buffer.hashtags, buffer.mentions, buffer.oldest = [], set(), [], None
+                    errors.append(str(e))
+                    continue
+                writes.append(time.perf_counter() - start)
+
+        def read_loop(connection, samples, seed):
+            rng = random.Random(seed)
+            cursor = connection.cursor()
+            while not stop.is_set():
+                usr = rng.randint(1, args.users)
+                start = time.perf_counter()
+                try:
+                    cursor.execute(FEED_QUERY, (usr, usr, 0))
+                    cursor.fetchall()
+                except sqlite3.OperationalError as e:
+                    errors.append(str(e))
+                    continue
+                samples.append(time.perf_counter() - start)
+
+        threads = [threading.Thread(target=write_loop)]
+        threads += [threading.Thread(target=read_loop, args=(c, reads[i], args.seed + i + 1)) for i, c in enumerate(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        for c in readers + [writer]:
+            c.close()
+
+        read_samples = sorted(itertools.chain.from_iterable(reads))
+        def p(samples, q):
+            return samples[min(len(samples) - 1, int(len(samples) * q))] * 1000 if samples else float('nan')
+        writes.sort()
+        print('{:<8} / {:<8} writes {:>7.0f}/s p95 {:>7.2f} ms   reads {:>7.0f}/s p95 {:>7.2f} ms   errors {}'.format(
+            writer_profile, reader_profile, len(writes) / args.seconds, p(writes, 0.95),
+            len(read_samples) / args.seconds, p(read_samples, 0.95), len(errors)))
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def remove_db(path):
+    """
+    Function to delete a database file and its WAL files, if they exist.
+    """
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def load_corpus(connection, tweets, users, follows, tags, seed=291, batch_size=50000):
+    """
+    Function to fill an empty database with a generated corpus: users, a
+    power-law follow graph and the tweets, replies and retweets of generate_activity.
+    Everything is streamed in batches, so the size is only limited by the disk;
+    the trending counts are saved as the importer does.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection, at the latest schema version.
+    tweets (int): The number of tweets.
+    users (int): The number of users.
+    follows (int): The mean number of accounts a user follows.
+    tags (int): The number of distinct hashtags.
+    seed (int): Random seed.
+    batch_size (int): The number of tweets per transaction.
+
+    Returns: None
+    """
+    def batches(rows):
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    engine = trending.load_trending(connection)
+    with schema.bulk_load(connection):
+        for batch in batches(user_record(usr) for usr in range(1, users + 1)):
+            with connection:
+                connection.executemany('INSERT INTO users(usr,pwd,name,email,city,timezone) VALUES (?,?,?,?,?,?)',
+                    [(user['id'], 'pwd', user['displayname'], user['username'] + '@mail.com', user['location'], -7)
+                     for user in batch])
+        for batch in batches(follow_graph(users, follows, seed)):
+            with connection:
+                connection.executemany("INSERT INTO follows(flwer,flwee,start_date) VALUES (?,?,'2021-03-01')", batch)
+
+        for batch in batches(generate_activity(tweets, users, tags, seed=seed)):
+            rows, terms, mentions, retweets = [], set(), [], []
+            for kind, item in batch:
+                if kind == 'retweet':
+                    retweets.append((item[0], item[1], item[2][:10]))
+                    continue
+                rows.append((item['id'], item['writer'], item['date'][:10], item['text'], item['replyto']))
+                for term in hashtags(item['text']):
+                    terms.add(term)
+                    mentions.append((item['id'], term))
+                engine.add(hashtag_keys(item['text']), timestamp(item['date']))
+            with connection:
+                connection.executemany('INSERT INTO tweets(tid,writer,tdate,text,replyto) VALUES (?,?,?,?,?)', rows)
+                connection.executemany('INSERT OR IGNORE INTO hashtags(term) VALUES (?)', [(term,) for term in terms])
+                connection.executemany('INSERT INTO mentions(tid,term) VALUES (?,?)', mentions)
+                connection.executemany('INSERT OR IGNORE INTO retweets(usr,tid,rdate) VALUES (?,?,?)', retweets)
+                trending.save_trending(connection, engine)
+
+def bench_suite(args):
+    """
+    Function to run every hot path of the application through the service
+    layer on a generated corpus, and report latency percentiles, throughput
+    and memory per scenario, optionally as JSON for comparing commits.
+    The SQL application has no top tweets or top users listing, so those
+    scenarios only exist in the MongoDB suite.
+
+    Arguments:
+    args (Namespace): Parsed command-line arguments.
+
+    Returns: None
+    """
+    tweets = args.tweets or SCALES[args.scale]
+    sizes = corpus_size(tweets)
+    users = args.users or sizes['users']
+    # Per-query timings and plans of the run when TWEETBOOK_QUERY_STATS is set; they slow every statement down
+    query_stats = from_environment()
+    recorder = Recorder({'backend': 'sqlite', 'sqlite': sqlite3.sqlite_version, 'tweets': tweets, 'users': users,
+                         'follows': args.follows, 'tags': sizes['tags'], 'ops': args.ops, 'pages': args.pages,
+                         'readers': args.readers, 'cache_mb': args.cache_mb, 'seed': args.seed,
+                         'trace_memory': args.trace_memory, 'query_stats': query_stats is not None},
+                        trace_memory=args.trace_memory)
+
+    # The generated database is kept and reused, since loading takes far longer than the
+    # queries; each run works on a copy, so the write scenarios do not change it
+    path = os.path.join(args.dir, 'bench_suite-{}-{}-{}.db'.format(tweets, users, args.seed))
+    work = path + '.run'
+    if args.rebuild or not os.path.exists(path):
+        remove_db(path)
+        connection = storage.open_connection(path, 'bulk')
+        schema.migrate(connection)
+        with recorder.scenario('load'):
+            recorder.time('load', load_corpus, connection, tweets, users, args.follows, sizes['tags'], args.seed,
+                          items=tweets)
+        with recorder.scenario('timeline'):
+            recorder.time('timeline', timeline.ensure_timeline, connection)
+        connection.close()
+    remove_db(work)
+    shutil.copyfile(path, work)
+
+    with recorder.scenario('open'):
+        pool = recorder.time('open', service.ConnectionPool, work, args.readers, 'fast', 'timeline', args.cache_mb,
+                             30.0, query_stats)
+
+    rng = random.Random(args.seed)
+    def some_user():
+        return zipf_rank(rng, users) + 1
+    def some_keywords():
+        return [('#' + hashtag_name(zipf_rank(rng, sizes['tags']))) if rng.random() < 0.3 else random_word(rng)
+                for _ in range(rng.randint(1, 2))]
+
+    def run(name, call, inputs):
+        with recorder.scenario(name):
+            for item in inputs:
+                call(item)
+
+    def read_feed(usr):
+        session = service.Session(usr)
+        for page_num in range(1, args.pages + 1):
+            recorder.time('feed_page', service.feed_page, pool, session, page_num)
+            if not service.has_next_feed_page(pool, session, page_num):
+                break
+
+    run('feed_page', read_feed, [rng.randint(1, users) for _ in range(args.ops)])
+    run('search_tweets', lambda keywords: recorder.time('search_tweets', service.search_tweets, pool, keywords, 1),
+        [some_keywords() for _ in range(args.ops)])
+    run('search_users', lambda keyword: recorder.time('search_users', service.search_users, pool, keyword, 1),
+        [rng.choice(FIRST_NAMES + [city.lower() for city in CITIES]) for _ in range(args.ops)])
+    run('user_profile', lambda usr: recorder.time('user_profile', service.user_profile, pool, usr),
+        [some_user() for _ in range(args.ops)])
+    run('user_tweets', lambda usr: recorder.time('user_tweets', service.user_tweets, pool, usr, 1),
+        [some_user() for _ in range(args.ops)])
+    run('followers', lambda usr: recorder.time('followers', service.followers, pool, usr),
+        [some_user() for _ in range(args.ops)])
+    run('tweet_stats', lambda tid: recorder.time('tweet_stats', service.tweet_stats, pool, tid),
+        [tweets - zipf_rank(rng, tweets) for _ in range(args.ops)])
+    run('top_hashtags', lambda n: recorder.time('top_hashtags', service.trending_hashtags, pool, n),
+        [10] * args.ops)
+
+    # Writes last, so the reads above see the corpus as generated
+    with recorder.scenario('compose'):
+        for _ in range(args.ops):
+            recorder.time('compose', service.compose, pool, service.Session(some_user()), random_text(rng))
+        with pool.write_lock:
+            pool.write_buffer.flush()
+    run('retweet', lambda usr: recorder.time('retweet', service.retweet, pool, service.Session(usr),
+                                             tweets - zipf_rank(rng, tweets)),
+        [rng.randint(1, users) for _ in range(args.ops)])
+    run('follow', lambda usr: recorder.time('follow', service.follow, pool, service.Session(usr), some_user()),
+        [rng.randint(1, users) for _ in range(args.ops)])
+    pool.close()
+
+    recorder.report()
+    if args.json:
+        recorder.save(args.json)
+    if query_stats is not None:
+        query_stats.save()
+    remove_db(work)
+    if not args.keep:
+        remove_db(path)
+
+def main():
+    """
+    Function to run one of the SQLite benchmarks.
+
+    Arguments: None
+
+    Returns: None
+    """
+    parser = argparse.ArgumentParser(description='Tweetbook SQLite benchmarks.')
+    parser.add_argument('--dir', default=tempfile.gettempdir(), help='directory for the scratch databases')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    compose = sub.add_parser('compose', help='sustained composed tweet writes per second')
+    compose.add_argument('-n', type=int, default=20000, help='tweets to compose')
+    compose.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000], help='buffer sizes to try')
+    compose.add_argument('--delay', type=float, default=1.0, help='buffer flush delay in seconds')
+    compose.add_argument('--seed', type=int, default=291)
+    compose.set_defaults(func=bench_compose)
+
+    feed = sub.add_parser('feed', help='UNION feed query vs fan-out timeline table')
+    feed.add_argument('--users', type=int, default=20000)
+    feed.add_argument('--tweets', type=int, default=500000)
+    feed.add_argument('--follows', type=int, default=20, help='accounts followed by ordinary users')
+    feed.add_argument('--heavy', type=int, default=20, help='users who follow thousands of accounts')
+    feed.add_argument('--heavy-follows', type=int, default=3000, help='accounts followed by each heavy user')
+    feed.add_argument('--retweets', type=int, default=100000)
+    feed.add_argument('--pages', type=int, nargs='+', default=[1, 10, 100])
+    feed.add_argument('--compose', type=int, default=1000, help='tweets composed to time the fan-out')
+    feed.set_defaults(func=bench_feed)
+
+    find = sub.add_parser('search', help='LIKE keyword search vs FTS5 full-text search')
+    find.add_argument('--users', type=int, default=10000)
+    find.add_argument('--tweets', type=int, default=1000000)
+    find.add_argument('--queries', type=int, default=20)
+    find.add_argument('--pages', type=int, nargs='+', default=[1, 20])
+    find.add_argument('--seed', type=int, default=291)
+    find.set_defaults(func=bench_search)
+
+    mixed = sub.add_parser('mixed', help='concurrent reads and writes under each storage profile')
+    mixed.add_argument('--users', type=int, default=5000)
+    mixed.add_argument('--tweets', type=int, default=200000)
+    mixed.add_argument('--follows', type=int, default=20)
+    mixed.add_argument('--retweets', type=int, default=20000)
+    mixed.add_argument('--readers', type=int, default=4, help='reader threads')
+    mixed.add_argument('--seconds', type=float, default=5.0, help='run time per profile')
+    mixed.add_argument('--seed', type=int, default=291)
+    mixed.set_defaults(func=bench_mixed)
+
+    load = sub.add_parser('import', help='NDJSON import with live indexes vs the bulk importer')
+    load.add_argument('-n', type=int, default=500000, help='tweets in the generated corpus')
+    load.add_argument('--batch-size', type=int, default=50000, help='documents per transaction for the bulk import')
+    load.add_argument('--seed', type=int, default=291)
+    load.set_defaults(func=bench_import)
+
+    trend = sub.add_parser('trending', help='trending engine vs exact GROUP BY over the last day')
+    trend.add_argument('--users', type=int, default=10000)
+    trend.add_argument('-n', type=int, default=1000000, help='tweets to generate')
+    trend.add_argument('--days', type=int, default=7, help='days the tweets span')
+    trend.add_argument('--tags', type=int, default=50000, help='distinct hashtags')
+    trend.add_argument('--top', type=int, default=10, help='hashtags to list')
+    trend.add_argument('--repeat', type=int, default=1000)
+    trend.add_argument('--seed', type=int, default=291)
+    trend.set_defaults(func=bench_trending)
+
+    rows = sub.add_parser('records', help='page rows as dictionaries vs Tweet and User records, per 10,000 rows')
+    rows.add_argument('-n', type=int, default=10000, help='tweets and users to read')
+    rows.add_argument('--repeat', type=int, default=5, help='timed reads per variant')
+    rows.add_argument('--seed', type=int, default=291)
+    rows.set_defaults(func=bench_records)
+
+    suite = sub.add_parser('suite', help='every hot path on a generated corpus, with percentiles, throughput and memory')
+    suite.add_argument('--scale', default='100k', choices=list(SCALES), help='corpus size in tweets')
+    suite.add_argument('--tweets', type=int, help='tweets to generate, instead of --scale')
+    suite.add_argument('--users', type=int, help='users to generate (default: one per 10 tweets)')
+    suite.add_argument('--follows', type=int, default=20, help='mean accounts followed per user')
+    suite.add_argument('--ops', type=int, default=1000, help='calls per scenario')
+    suite.add_argument('--pages', type=int, default=3, help='feed pages read per session')
+    suite.add_argument('--readers', type=int, default=0, help='read connections in the pool')
+    suite.add_argument('--cache-mb', type=float, default=0, help='query cache size, 0 to measure the queries themselves')
+    suite.add_argument('--trace-memory', action='store_true', help='measure the Python heap peak of each scenario (slower)')
+    suite.add_argument('--json', help='write the results to this file, - for standard output')
+    suite.add_argument('--keep', action='store_true', help='keep the generated database for the next run')
+    suite.add_argument('--rebuild', action='store_true', help='generate the database even if a kept one exists')
+    suite.add_argument('--seed', type=int, default=291)
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
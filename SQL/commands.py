@@ -0,0 +1,199 @@
+import argparse
+import os
+import sys
+
+import service
+from tweetbook import FEED_MODE, PROFILE, CACHE_MB, CACHE_TTL, QUERY_STATS
+
+# The command script runner is shared with the MongoDB side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.commands import run_commands
+
+class State:
+    """
+    What the commands of one script share: the database connections and the logged-in session.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+        self.session = None
+
+    def require_session(self):
+        """
+        Function to return the logged-in session, for the commands that act as a user.
+        """
+        if self.session is None:
+            raise ValueError('log in first')
+        return self.session
+
+def as_dicts(records):
+    """
+    Function to turn Tweet and User records into dictionaries, which are printed as JSON objects rather than lists.
+    """
+    return [record._asdict() for record in records]
+
+def login(state, usr, pwd):
+    """
+    Log in as a user; the following commands act as them.
+    """
+    session = service.login(state.pool, int(usr), pwd)
+    if session is None:
+        raise ValueError('wrong user ID or password')
+    state.session = session
+    return {'usr': session.usr}
+
+def signup(state, pwd, name, email, city, timezone):
+    """
+    Add a user and log in as them.
+    """
+    usr = service.signup(state.pool, pwd, name, email, city, timezone)
+    state.session = service.Session(usr)
+    return {'usr': usr}
+
+def feed(state, page=1):
+    """
+    One page of the logged-in user's home feed, newest first.
+    """
+    session = state.require_session()
+    page = int(page)
+    # The timeline feed is paged by key, so the pages before it are read first
+    while state.pool.feed_mode == 'timeline' and len(session.feed_bounds) < page:
+        known = len(session.feed_bounds)
+        service.feed_page(state.pool, session, known)
+        if len(session.feed_bounds) == known:
+            return []
+    return as_dicts(service.feed_page(state.pool, session, page))
+
+def tweet(state, tid):
+    """
+    The retweet and reply counts of a tweet.
+    """
+    retweets, replies = service.tweet_stats(state.pool, int(tid))
+    return {'tid': int(tid), 'retweets': retweets, 'replies': replies}
+
+def compose(state, text, replyto=None):
+    """
+    Write a tweet, or a reply to tweet replyto, as the logged-in user.
+    """
+    try:
+        tid = service.compose(state.pool, state.require_session(), text, None if replyto is None else int(replyto))
+    except LookupError as e:
+        raise ValueError(str(e))
+    return {'tid': tid}
+
+def retweet(state, tid):
+    """
+    Retweet a tweet as the logged-in user.
+    """
+    service.retweet(state.pool, state.require_session(), int(tid))
+    return {'tid': int(tid)}
+
+def follow(state, usr):
+    """
+    Make the logged-in user follow a user.
+    """
+    service.follow(state.pool, state.require_session(), int(usr))
+    return {'usr': int(usr)}
+
+def followers(state, usr=None):
+    """
+    The followers of a user, by default the logged-in one.
+    """
+    return as_dicts(service.followers(state.pool, state.require_session().usr if usr is None else int(usr)))
+
+def profile(state, usr):
+    """
+    A user's name and tweet, following and follower counts.
+    """
+    found = service.user_profile(state.pool, int(usr))
+    if found is None:
+        raise ValueError('there is no user {}'.format(usr))
+    return found
+
+def user_tweets(state, usr, page=1):
+    """
+    One page of a user's tweets, newest first.
+    """
+    return as_dicts(service.user_tweets(state.pool, int(usr), int(page)))
+
+def trending(state, n=10):
+    """
+    The hashtags used most over the last day, as [hashtag, count] pairs.
+    """
+    return service.trending_hashtags(state.pool, int(n))
+
+def search_tweets(state, *keywords, page=1):
+    """
+    One page of the tweets matching every keyword; #word matches the hashtag.
+    """
+    return as_dicts(service.search_tweets(state.pool, list(keywords), int(page)) or [])
+
+def search_users(state, keyword, page=1):
+    """
+    One page of the users whose name or city contains the keyword.
+    """
+    return as_dicts(service.search_users(state.pool, keyword.lower(), int(page)))
+
+def flush(state):
+    """
+    Write the buffered tweets now instead of within a second.
+    """
+    with state.pool.write_lock:
+        state.pool.write_buffer.flush()
+    return {}
+
+def query_stats(state):
+    """
+    Latency, rows, plans and slow statements of the queries run so far; needs TWEETBOOK_QUERY_STATS.
+    """
+    if state.pool.query_stats is None:
+        raise ValueError('query stats are off, set TWEETBOOK_QUERY_STATS to the file to write them to')
+    return state.pool.query_stats.snapshot()
+
+COMMANDS = {
+    'login': login,
+    'signup': signup,
+    'feed': feed,
+    'tweet': tweet,
+    'compose': compose,
+    'retweet': retweet,
+    'follow': follow,
+    'followers': followers,
+    'profile': profile,
+    'user_tweets': user_tweets,
+    'trending': trending,
+    'search_tweets': search_tweets,
+    'search_users': search_users,
+    'flush': flush,
+    'query_stats': query_stats,
+}
+
+def main():
+    """
+    Function to run a script of tweetbook commands without the menus and print one JSON line per command.
+    Usage: python3 commands.py <database> [script]   (the script is read from standard input if not given)
+
+    Arguments: None
+
+    Returns: None
+    """
+    parser = argparse.ArgumentParser(description='Run tweetbook commands from a script and print JSON lines.')
+    parser.add_argument('database')
+    parser.add_argument('script', nargs='?', help='file of commands, one per line (default: standard input)')
+    args = parser.parse_args()
+
+    pool = service.ConnectionPool(args.database, readers=0, profile=PROFILE, feed_mode=FEED_MODE,
+                                  cache_mb=CACHE_MB, cache_ttl=CACHE_TTL, query_stats=QUERY_STATS)
+    try:
+        if args.script:
+            with open(args.script) as script:
+                failed = run_commands(COMMANDS, State(pool), script)
+        else:
+            failed = run_commands(COMMANDS, State(pool), sys.stdin)
+    finally:
+        pool.close()
+        if QUERY_STATS is not None:
+            QUERY_STATS.save()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
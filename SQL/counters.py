@@ -0,0 +1,193 @@
+import contextlib
+import sqlite3
+import sys
+
+# Counts shown when a tweet or a user is opened, one row per tweet or user that has any
+COUNTER_TABLES = [
+    '''CREATE TABLE IF NOT EXISTS tweet_stats (
+        tid int,
+        retweets int NOT NULL DEFAULT 0,
+        replies int NOT NULL DEFAULT 0,
+        primary key (tid)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS user_stats (
+        usr int,
+        tweets int NOT NULL DEFAULT 0,
+        following int NOT NULL DEFAULT 0,
+        followers int NOT NULL DEFAULT 0,
+        primary key (usr)
+    ) WITHOUT ROWID''',
+]
+
+# Keep the counters in step with tweets, retweets and follows.
+# REPLACE INTO does not fire delete triggers, so writes to retweets and follows
+# that may hit an existing row have to use ON CONFLICT DO UPDATE instead.
+COUNTER_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS tweets_count_insert AFTER INSERT ON tweets BEGIN
+        INSERT INTO user_stats(usr, tweets) VALUES (new.writer, 1)
+            ON CONFLICT(usr) DO UPDATE SET tweets = tweets + 1;
+        INSERT INTO tweet_stats(tid, replies) SELECT new.replyto, 1 WHERE new.replyto IS NOT NULL
+            ON CONFLICT(tid) DO UPDATE SET replies = replies + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_count_delete AFTER DELETE ON tweets BEGIN
+        UPDATE user_stats SET tweets = tweets - 1 WHERE usr = old.writer;
+        UPDATE tweet_stats SET replies = replies - 1 WHERE tid = old.replyto;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_count_update AFTER UPDATE OF writer, replyto ON tweets BEGIN
+        UPDATE user_stats SET tweets = tweets - 1 WHERE usr = old.writer;
+        UPDATE tweet_stats SET replies = replies - 1 WHERE tid = old.replyto;
+        INSERT INTO user_stats(usr, tweets) VALUES (new.writer, 1)
+            ON CONFLICT(usr) DO UPDATE SET tweets = tweets + 1;
+        INSERT INTO tweet_stats(tid, replies) SELECT new.replyto, 1 WHERE new.replyto IS NOT NULL
+            ON CONFLICT(tid) DO UPDATE SET replies = replies + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS retweets_count_insert AFTER INSERT ON retweets BEGIN
+        INSERT INTO tweet_stats(tid, retweets) VALUES (new.tid, 1)
+            ON CONFLICT(tid) DO UPDATE SET retweets = retweets + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS retweets_count_delete AFTER DELETE ON retweets BEGIN
+        UPDATE tweet_stats SET retweets = retweets - 1 WHERE tid = old.tid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS follows_count_insert AFTER INSERT ON follows BEGIN
+        INSERT INTO user_stats(usr, following) VALUES (new.flwer, 1)
+            ON CONFLICT(usr) DO UPDATE SET following = following + 1;
+        INSERT INTO user_stats(usr, followers) VALUES (new.flwee, 1)
+            ON CONFLICT(usr) DO UPDATE SET followers = followers + 1;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS follows_count_delete AFTER DELETE ON follows BEGIN
+        UPDATE user_stats SET following = following - 1 WHERE usr = old.flwer;
+        UPDATE user_stats SET followers = followers - 1 WHERE usr = old.flwee;
+    END""",
+]
+
+TRIGGER_NAMES = ['tweets_count_insert', 'tweets_count_delete', 'tweets_count_update', 'retweets_count_insert',
+                 'retweets_count_delete', 'follows_count_insert', 'follows_count_delete']
+
+# The counters as they should be, computed from the base tables
+EXPECTED_TWEET_STATS = """
+    SELECT tid, SUM(retweets), SUM(replies) FROM (
+        SELECT tid, COUNT(*) AS retweets, 0 AS replies FROM retweets GROUP BY tid
+        UNION ALL
+        SELECT replyto, 0, COUNT(*) FROM tweets WHERE replyto IS NOT NULL GROUP BY replyto
+    ) GROUP BY tid"""
+
+EXPECTED_USER_STATS = """
+    SELECT usr, SUM(tweets), SUM(following), SUM(followers) FROM (
+        SELECT writer AS usr, COUNT(*) AS tweets, 0 AS following, 0 AS followers FROM tweets GROUP BY writer
+        UNION ALL
+        SELECT flwer, 0, COUNT(*), 0 FROM follows GROUP BY flwer
+        UNION ALL
+        SELECT flwee, 0, 0, COUNT(*) FROM follows GROUP BY flwee
+    ) GROUP BY usr"""
+
+REBUILD = [
+    'DELETE FROM tweet_stats',
+    'INSERT INTO tweet_stats(tid, retweets, replies)' + EXPECTED_TWEET_STATS,
+    'DELETE FROM user_stats',
+    'INSERT INTO user_stats(usr, tweets, following, followers)' + EXPECTED_USER_STATS,
+]
+
+def rebuild_counters(connection):
+    """
+    Function to recompute every counter from the base tables in one transaction.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    with connection:
+        for statement in REBUILD:
+            connection.execute(statement)
+
+def check_counters(connection):
+    """
+    Function to compare the counters with the base tables.
+    A missing row counts as all zeros.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns:
+    mismatches (dict): 'tweet_stats' and 'user_stats' -> sorted list of the tweet or user IDs whose counters are wrong.
+    """
+    mismatches = {}
+    for table, key, columns, expected in (
+            ('tweet_stats', 'tid', ['retweets', 'replies'], EXPECTED_TWEET_STATS),
+            ('user_stats', 'usr', ['tweets', 'following', 'followers'], EXPECTED_USER_STATS)):
+        # Table and column names are fixed above
+        stored = 'SELECT {}, {} FROM {} WHERE {}'.format(
+            key, ', '.join(columns), table, ' OR '.join(c + ' != 0' for c in columns))
+        rows = connection.execute("""
+            SELECT * FROM ({expected} EXCEPT {stored})
+            UNION
+            SELECT * FROM ({stored} EXCEPT {expected})""".format(expected=expected, stored=stored)).fetchall()
+        mismatches[table] = sorted({row[0] for row in rows})
+    return mismatches
+
+@contextlib.contextmanager
+def deferred_counters(connection):
+    """
+    Context manager for bulk loads into tweets, retweets and follows.
+    The counter triggers are dropped for the load and the counters rebuilt once at the end.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    connection.commit()
+    # Recorded in the meta table of the schema module, so a load that is killed is finished by migrate
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO meta(name, value) VALUES ('deferred_counters', datetime('now'))")
+        for name in TRIGGER_NAMES:
+            connection.execute('DROP TRIGGER IF EXISTS ' + name)
+    try:
+        yield
+    finally:
+        connection.commit()
+        restore_counters(connection)
+
+def restore_counters(connection):
+    """
+    Function to create the counter triggers dropped by deferred_counters and recompute the counters.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    with connection:
+        for statement in COUNTER_TRIGGERS:
+            connection.execute(statement)
+        for statement in REBUILD:
+            connection.execute(statement)
+        connection.execute("DELETE FROM meta WHERE name = 'deferred_counters'")
+
+def main():
+    """
+    Function to verify, and optionally rebuild, the counters from the command line.
+    Usage: python3 counters.py <database> [--rebuild]
+    Exits with status 1 if the counters are wrong and were not rebuilt.
+
+    Arguments: None
+
+    Returns: None
+    """
+    if len(sys.argv) < 2:
+        print('Usage: python3 counters.py <database> [--rebuild]')
+        sys.exit(2)
+    connection = sqlite3.connect(sys.argv[1])
+    mismatches = check_counters(connection)
+    for table, ids in mismatches.items():
+        print('{:<12} {}'.format(table, '{} wrong, e.g. {}'.format(len(ids), ids[:10]) if ids else 'ok'))
+    wrong = any(mismatches.values())
+    if wrong and '--rebuild' in sys.argv[2:]:
+        rebuild_counters(connection)
+        print('rebuilt; now {}'.format('ok' if not any(check_counters(connection).values()) else 'still wrong'))
+        wrong = False
+    connection.close()
+    sys.exit(1 if wrong else 0)
+
+if __name__ == "__main__":
+    main()
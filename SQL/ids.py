@@ -0,0 +1,68 @@
+import threading
+
+# Sequence name -> (table, column) whose IDs it hands out
+SEQUENCES = {
+    'usr': ('users', 'usr'),
+    'tid': ('tweets', 'tid'),
+}
+
+class IdAllocator:
+    """
+    Hands out IDs from blocks reserved in the sequences table.
+    Reserving a block is one UPDATE in its own short transaction, so writers in
+    other connections or processes always get different blocks, and the IDs
+    inside a block cost nothing to hand out. IDs from a block that is not used
+    up before the program exits are skipped, leaving gaps.
+
+    The reservation also moves the sequence past the largest ID in the table,
+    so rows inserted without the allocator (bulk loads) are never collided with.
+    """
+    def __init__(self, connection, name, block_size=100):
+        """
+        Arguments:
+        connection (sqlite3.Connection): The connection to reserve blocks through; it must not be inside a transaction when a block runs out.
+        name (str): A key of SEQUENCES.
+        block_size (int): Number of IDs reserved at a time.
+        """
+        self.connection = connection
+        self.name = name
+        self.block_size = block_size
+        self.table, self.column = SEQUENCES[name]
+        self.next_value = 0
+        self.end = 0
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Function to reserve the next block of IDs.
+
+        Arguments: None
+
+        Returns: None
+        """
+        # Table and column names come from SEQUENCES, not from input
+        with self.connection:
+            start = self.connection.execute("""
+                UPDATE sequences
+                SET next = MAX(next, (SELECT IFNULL(MAX({column}), 0) + 1 FROM {table})) + ?
+                WHERE name = ?
+                RETURNING next - ?""".format(table=self.table, column=self.column),
+                (self.block_size, self.name, self.block_size)).fetchone()[0]
+        self.next_value = start
+        self.end = start + self.block_size
+
+    def next(self):
+        """
+        Function to allocate an ID.
+
+        Arguments: None
+
+        Returns:
+        value (int): The new ID.
+        """
+        with self.lock:
+            if self.next_value >= self.end:
+                self.reserve()
+            value = self.next_value
+            self.next_value += 1
+            return value
@@ -0,0 +1,296 @@
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import sys
+import time
+
+import schema
+import storage
+import timeline
+import trending
+
+# The text analysis is shared with the MongoDB side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.entities import hashtags, normalize_hashtag
+from common.trending import timestamp
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+# Bytes read at a time when skipping compressed input up to a checkpoint
+SKIP_CHUNK = 1 << 20
+
+# Progress of each input file, saved in the same transaction as each batch,
+# so an interrupted import resumes exactly after the last committed batch
+CHECKPOINT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    path text,
+    offset int,
+    docs int,
+    primary key (path)
+);
+"""
+
+INSERTS = {
+    # A user seen first in mentionedUsers has no location yet; fill it in when their own tweet comes
+    'users': '''INSERT INTO users(usr,pwd,name,email,city,timezone) VALUES (?,NULL,?,NULL,?,NULL)
+                ON CONFLICT(usr) DO UPDATE SET name = IFNULL(excluded.name, name), city = IFNULL(excluded.city, city)''',
+    'tweets': 'INSERT OR IGNORE INTO tweets(tid,writer,tdate,text,replyto) VALUES (?,?,?,?,?)',
+    'hashtags': 'INSERT OR IGNORE INTO hashtags(term) VALUES (?)',
+    'mentions': 'INSERT OR IGNORE INTO mentions(tid,term) VALUES (?,?)',
+    'follows': 'INSERT OR IGNORE INTO follows(flwer,flwee,start_date) VALUES (?,?,?)',
+    'retweets': 'INSERT OR IGNORE INTO retweets(usr,tid,rdate) VALUES (?,?,?)',
+}
+
+class Batch:
+    """
+    Rows for every table, collected from a run of documents and written together.
+    """
+    def __init__(self):
+        self.rows = {table: [] for table in INSERTS}
+        self.hashtags = set()
+        # (tid, hashtags, timestamp) of the tweets to count for trending once written
+        self.trends = []
+        self.docs = 0
+
+    def add_user(self, user):
+        """
+        Function to queue a user from a tweet's user or mentionedUsers entry.
+        """
+        self.rows['users'].append((user['id'], user.get('displayname'), user.get('location')))
+
+    def add_tweet(self, doc, trend=False):
+        """
+        Function to normalize one tweet document, and the tweets it quotes or
+        retweets, into rows. The document is parsed into rows of its own first,
+        which are queued only once all of it has parsed, so a document that fails
+        part way leaves nothing behind to be committed.
+
+        Arguments:
+        doc (dict): A tweet as stored in the Mongo collection.
+        trend (bool): Whether to count the tweet's hashtags for trending. Quoted and retweeted tweets are not counted.
+
+        Returns:
+        tid (int): The tweet ID.
+        """
+        parsed = Batch()
+        tid, terms = parsed.parse_tweet(doc)
+        when = timestamp(doc['date']) if trend else None
+        for table, rows in parsed.rows.items():
+            self.rows[table].extend(rows)
+        self.hashtags |= parsed.hashtags
+        if trend:
+            self.trends.append((tid, {normalize_hashtag(term) for term in terms}, when))
+        return tid
+
+    def parse_tweet(self, doc):
+        """
+        Function to add the rows of a tweet document, and of the tweets it quotes or retweets, to this batch.
+
+        Arguments:
+        doc (dict): A tweet as stored in the Mongo collection.
+
+        Returns:
+        parsed (tuple): (tweet ID, hashtags of the tweet).
+        """
+        user = doc['user']
+        tid = doc['id']
+        tdate = doc['date'][:10]
+        self.add_user(user)
+
+        # A tweet in a thread is filed as a reply to the thread's first tweet
+        conversation = doc.get('conversationId')
+        replyto = conversation if conversation and conversation != tid else None
+        self.rows['tweets'].append((tid, user['id'], tdate, doc.get('content'), replyto))
+
+        terms = hashtags(doc.get('content'))
+        for term in terms:
+            self.hashtags.add(term)
+            self.rows['mentions'].append((tid, term))
+
+        # The dump has no follower lists; a user mentioning another is the closest thing to following them
+        for mentioned in doc.get('mentionedUsers') or []:
+            if mentioned.get('id') is not None and mentioned['id'] != user['id']:
+                self.add_user(mentioned)
+                self.rows['follows'].append((user['id'], mentioned['id'], tdate))
+
+        if doc.get('quotedTweet'):
+            self.parse_tweet(doc['quotedTweet'])
+        if doc.get('retweetedTweet'):
+            self.rows['retweets'].append((user['id'], self.parse_tweet(doc['retweetedTweet'])[0], tdate))
+        return tid, terms
+
+    def count_trends(self, connection, engine):
+        """
+        Function to count the hashtags of the batch's tweets that are not in the database yet.
+        It runs inside the caller's transaction, before the batch is written, so a tweet
+        loaded again by a restarted or overlapping import is not counted twice.
+
+        Arguments:
+        connection (sqlite3.Connection): The database connection.
+        engine (Trending): Where to count the hashtags.
+
+        Returns: None
+        """
+        if not self.trends:
+            return
+        tids = json.dumps([tid for tid, _, _ in self.trends])
+        seen = {tid for (tid,) in connection.execute(
+            'SELECT tid FROM tweets WHERE tid IN (SELECT value FROM json_each(?))', (tids,))}
+        for tid, terms, when in self.trends:
+            if tid not in seen:
+                seen.add(tid)
+                engine.add(terms, when)
+
+    def write(self, connection):
+        """
+        Function to write the queued rows with one executemany per table.
+        It runs inside the caller's transaction.
+        """
+        self.rows['hashtags'] = [(term,) for term in self.hashtags]
+        for table, statement in INSERTS.items():
+            connection.executemany(statement, self.rows[table])
+
+def open_input(path):
+    """
+    Function to open an NDJSON file for binary line-by-line reading; gzip is detected from the first bytes.
+
+    Arguments:
+    path (str): Path to the input file.
+
+    Returns:
+    file (file): A binary file object.
+    """
+    raw = open(path, 'rb')
+    if raw.peek(2)[:2] == GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    return raw
+
+def import_file(connection, path, batch_size=50000, resume=True, deferred=True, progress=None):
+    """
+    Function to load a Mongo NDJSON dump into the SQLite tables.
+    Documents are parsed in batches and each batch is written in one transaction
+    together with the checkpoint, so the import can be stopped at any point and
+    resumed with nothing lost or loaded twice. Call finish_import once every file is loaded.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection, at the latest schema version.
+    path (str): Path to the NDJSON file, plain or gzip.
+    batch_size (int): Number of documents per transaction.
+    resume (bool): Whether to continue from the checkpoint of an earlier import of the same path.
+    deferred (bool): Whether to build indexes, the full-text index and the counters once at the end.
+    progress (function): Called as progress(docs, seconds) after every batch, if given.
+
+    Returns:
+    stats (tuple): (documents imported by this call, lines that could not be parsed, seconds).
+    """
+    loads = orjson.loads if orjson is not None else json.loads
+    connection.executescript(CHECKPOINT_SCHEMA)
+    row = connection.execute('SELECT offset, docs FROM import_checkpoints WHERE path = ?', (path,)).fetchone()
+    offset, done = row if (row and resume) else (0, 0)
+
+    # Trending counts are saved with each batch, so a resumed import counts every tweet once
+    engine = trending.load_trending(connection)
+
+    start = time.perf_counter()
+    imported = errors = 0
+    with open_input(path) as stream, (schema.bulk_load(connection) if deferred else contextlib.nullcontext()):
+        # Compressed input cannot seek, so it is read up to the checkpoint instead
+        if offset and not isinstance(stream, gzip.GzipFile):
+            stream.seek(offset)
+        else:
+            skip = offset
+            while skip:
+                chunk = stream.read(min(skip, SKIP_CHUNK))
+                if not chunk:
+                    break
+                skip -= len(chunk)
+
+        batch = Batch()
+        for line in stream:
+            offset += len(line)
+            if not line.strip():
+                continue
+            try:
+                batch.add_tweet(loads(line), trend=True)
+            except (ValueError, KeyError, TypeError):
+                errors += 1
+                continue
+            batch.docs += 1
+            if batch.docs >= batch_size:
+                imported += _commit(connection, batch, path, offset, done + imported, engine)
+                batch = Batch()
+                if progress:
+                    progress(done + imported, time.perf_counter() - start)
+        imported += _commit(connection, batch, path, offset, done + imported, engine)
+    return imported, errors, time.perf_counter() - start
+
+def finish_import(connection):
+    """
+    Function to tidy up after every file of an import has been loaded.
+    It runs once at the end rather than per file, since a reply can come in a
+    file before the tweet it replies to.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    # Replies to tweets outside the dumps point nowhere; drop them so foreign keys hold
+    with connection:
+        connection.execute('UPDATE tweets SET replyto = NULL WHERE replyto IS NOT NULL AND replyto NOT IN (SELECT tid FROM tweets)')
+
+    # The feeds are rebuilt from scratch rather than fanned out row by row
+    with connection:
+        if timeline.exists(connection):
+            connection.execute('DELETE FROM timeline')
+            connection.execute(timeline.BACKFILL)
+
+def _commit(connection, batch, path, offset, done, engine):
+    """
+    Function to write a batch, its trending counts and move the checkpoint past it in one transaction.
+    """
+    with connection:
+        batch.count_trends(connection, engine)
+        batch.write(connection)
+        trending.save_trending(connection, engine)
+        connection.execute('INSERT OR REPLACE INTO import_checkpoints(path, offset, docs) VALUES (?,?,?)',
+                           (path, offset, done + batch.docs))
+    return batch.docs
+
+def main():
+    """
+    Function to import NDJSON tweet dumps into a tweetbook database from the command line.
+    Usage: python3 importer.py <database> <JSON path>... [--batch-size N] [--restart]
+
+    Arguments: None
+
+    Returns: None
+    """
+    parser = argparse.ArgumentParser(description='Load Mongo NDJSON tweet dumps into the tweetbook SQLite schema.')
+    parser.add_argument('database')
+    parser.add_argument('paths', nargs='+', help='NDJSON files, plain or gzip')
+    parser.add_argument('--batch-size', type=int, default=50000, help='documents per transaction')
+    parser.add_argument('--restart', action='store_true', help='ignore checkpoints and read every file from the start')
+    args = parser.parse_args()
+
+    connection = storage.open_connection(args.database, 'bulk')
+    schema.migrate(connection)
+
+    def progress(docs, seconds):
+        print('{:>10} docs {:>8.1f}s {:>10.0f} docs/s'.format(docs, seconds, docs / seconds), file=sys.stderr)
+
+    for path in args.paths:
+        imported, errors, seconds = import_file(connection, path, args.batch_size, not args.restart, progress=progress)
+        print('{}: {} docs in {:.1f}s ({:.0f} docs/s), {} parse errors'.format(
+            path, imported, seconds, imported / seconds if seconds else 0, errors))
+    finish_import(connection)
+    connection.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,264 @@
+import os
+import re
+import sqlite3
+import sys
+import time
+
+from schema import FULL_SCAN
+
+# The stats collection and export are shared with the MongoDB side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.querystats import caller_name
+
+# Statements that have a query plan worth reading
+EXPLAINED = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+# Plan lines that visit one table or index, e.g. 'SCAN u1', 'SEARCH tweets USING INDEX tweets_writer (writer=?)'
+STEP = re.compile(r'(SCAN|SEARCH) (\w+)(?: USING (?:COVERING )?INDEX (\w+)| USING (INTEGER )?PRIMARY KEY)?(?: \((.*)\))?$')
+
+def statement_kind(sql):
+    """
+    Function to find the kind of a statement from its first word, e.g. SELECT.
+    """
+    words = sql.split(None, 1)
+    return words[0].upper() if words else ''
+
+def table_stats(connection):
+    """
+    Function to read the row estimates ANALYZE saved in sqlite_stat1.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns:
+    stats (tuple): (table -> rows, index -> list of numbers: table rows, then rows per value of the first
+    column, of the first two columns and so on); both empty if the database was never analyzed.
+    """
+    tables, indexes = {}, {}
+    try:
+        rows = sqlite3.Cursor(connection).execute('SELECT tbl, idx, stat FROM sqlite_stat1').fetchall()
+    except sqlite3.OperationalError:
+        return tables, indexes
+    for tbl, idx, stat in rows:
+        numbers = [int(number) for number in stat.split() if number.isdigit()]
+        if numbers:
+            tables[tbl] = max(tables.get(tbl, 0), numbers[0])
+            if idx:
+                indexes[idx] = numbers
+    return tables, indexes
+
+def table_of(sql, name, tables):
+    """
+    Function to find the table behind a name in a query plan, which may be an alias such as u1.
+
+    Returns:
+    table (str): The table, or None if the name is not one of tables, e.g. a subquery.
+    """
+    if name in tables:
+        return name
+    match = re.search(r'(\w+)\s+(?:AS\s+)?{}\b'.format(re.escape(name)), sql, re.IGNORECASE)
+    return match.group(1) if match and match.group(1) in tables else None
+
+def step_rows(sql, detail, tables, indexes):
+    """
+    Function to estimate the rows one plan step visits each time it runs.
+    A scan visits the whole table; an index search visits the rows per value of
+    the columns it matches with '=', or a quarter of the table for a range, which
+    is what the planner assumes without better statistics.
+
+    Returns:
+    rows (int): The estimate, or None for steps it cannot tell, e.g. full-text searches.
+    """
+    match = STEP.match(detail)
+    if match is None:
+        return None
+    kind, name, index, rowid, constraint = match.groups()
+    if rowid and constraint and re.fullmatch(r'rowid=\?', constraint):
+        return 1
+    table = table_of(sql, name, tables)
+    if table is None:
+        return None
+    if kind == 'SEARCH' and not constraint:
+        # A search without a constraint is the MIN/MAX shortcut, which reads one end of the index
+        return 1
+    if 'PRIMARY KEY' in detail and not rowid:
+        # The primary key of a WITHOUT ROWID table is analyzed under the table's name
+        index = table if table in indexes else 'sqlite_autoindex_{}_1'.format(table)
+    if kind == 'SCAN':
+        return tables[table]
+    equal = len(re.findall(r'(?<![<>!])=', constraint))
+    numbers = indexes.get(index)
+    if equal and numbers and equal < len(numbers):
+        return numbers[equal]
+    return max(tables[table] // 4, 1)
+
+def explain(connection, sql, parameters):
+    """
+    Function to read the plan of a statement with EXPLAIN QUERY PLAN and estimate the rows it scans.
+    Nested loops multiply: each step runs once for every row of the steps before it.
+
+    Arguments:
+    connection (sqlite3.Connection): The connection the statement runs on.
+    sql (str): The statement.
+    parameters (tuple or dict): Its parameters.
+
+    Returns:
+    plan (dict): scanned (estimated rows visited, or None without sqlite_stat1), full_scans and detail.
+    """
+    cursor = sqlite3.Cursor(connection)
+    rows = cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    tables, indexes = table_stats(connection)
+    # Scans of subqueries and views are not full scans of a table
+    names = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    children = {}
+    for node, parent, _, detail in rows:
+        children.setdefault(parent, []).append((node, detail))
+
+    def estimate(parent):
+        total, loops = 0, 1
+        for node, detail in children.get(parent, ()):
+            visited = step_rows(sql, detail, tables, indexes)
+            if visited is not None:
+                loops *= max(visited, 1)
+                total += loops
+            elif node in children:
+                total += estimate(node)
+        return total
+
+    return {
+        'scanned': estimate(0) if tables else None,
+        'full_scans': [row[3] for row in rows if FULL_SCAN.match(row[3]) and table_of(sql, row[3].split()[1], names)],
+        'detail': [row[3] for row in rows],
+    }
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    A cursor that times every statement from execute to its last row and counts the rows.
+    A SELECT is recorded once it has been read to the end, or when the cursor runs
+    another statement, is closed or is freed.
+    """
+    # [name, op, sql, seconds so far, rows so far, plan] of the SELECT being read
+    pending = None
+
+    def finish(self):
+        """
+        Function to record the statement being read, if any.
+        """
+        pending, self.pending = self.pending, None
+        if pending is not None:
+            name, op, sql, seconds, rows, plan = pending
+            self.connection.query_stats.record(name, op, seconds, rows, sql, plan)
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        stats = self.connection.query_stats
+        name, op = caller_name(), statement_kind(sql)
+        plan = stats.plan(sql, lambda: explain(self.connection, sql, parameters)) if op in EXPLAINED else None
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        except sqlite3.Error:
+            stats.record(name, op, time.perf_counter() - start, 0, sql, plan, error=True)
+            raise
+        seconds = time.perf_counter() - start
+        if self.description is None:
+            stats.record(name, op, seconds, max(self.rowcount, 0), sql, plan)
+        else:
+            self.pending = [name, op, sql, seconds, 0, plan]
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        stats = self.connection.query_stats
+        name, op = caller_name(), statement_kind(sql)
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        except sqlite3.Error:
+            stats.record(name, op, time.perf_counter() - start, 0, sql, error=True)
+            raise
+        stats.record(name, op, time.perf_counter() - start, max(self.rowcount, 0), sql)
+        return self
+
+    def executescript(self, sql_script):
+        self.finish()
+        start = time.perf_counter()
+        super().executescript(sql_script)
+        self.connection.query_stats.record(caller_name(), 'SCRIPT', time.perf_counter() - start, 0, sql_script)
+        return self
+
+    def read(self, fetch, *args):
+        """
+        Function to run a fetch method and add its time and rows to the statement being read.
+        """
+        start = time.perf_counter()
+        result = fetch(*args)
+        if self.pending is not None:
+            self.pending[3] += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self.read(super().fetchone)
+        if row is None:
+            self.finish()
+        elif self.pending is not None:
+            self.pending[4] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self.read(super().fetchmany, size)
+        if self.pending is not None:
+            self.pending[4] += len(rows)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        rows = self.read(super().fetchall)
+        if self.pending is not None:
+            self.pending[4] += len(rows)
+        self.finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self.read(super().__next__)
+        except StopIteration:
+            self.finish()
+            raise
+        if self.pending is not None:
+            self.pending[4] += 1
+        return row
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self.finish()
+        except Exception:
+            pass
+
+class InstrumentedConnection(sqlite3.Connection):
+    """
+    A connection whose cursors record every statement in query_stats.
+    storage.open_connection uses it when query stats are on; otherwise connections
+    are plain sqlite3 ones and nothing is measured.
+    """
+    # The QueryStats the statements are recorded in
+    query_stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute would run the statement on a plain cursor
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
@@ -0,0 +1,153 @@
+import argparse
+import collections
+import concurrent.futures
+import os
+import random
+import tempfile
+import threading
+import time
+
+import benchmark
+import service
+
+def run_session(pool, usr, users, rng, pages, record):
+    """
+    Function to play one simulated user through the service layer: log in,
+    page through the feed, look at tweets and now and then write something.
+
+    Arguments:
+    pool (service.ConnectionPool): The shared connections.
+    usr (int): The user ID to log in as; benchmark users all have the password 'pwd'.
+    users (int): The largest user ID, for picking users to look at.
+    rng (random.Random): Random source for this session.
+    pages (int): The most feed pages to read.
+    record (function): Called as record(action, seconds) after every action.
+
+    Returns: None
+    """
+    def timed(action, f, *args):
+        start = time.perf_counter()
+        result = f(*args)
+        record(action, time.perf_counter() - start)
+        return result
+
+    session = timed('login', service.login, pool, usr, 'pwd')
+    for page_num in range(1, rng.randint(1, pages) + 1):
+        pool.flush_if_due()
+        data = timed('feed', service.feed_page, pool, session, page_num)
+        if data and rng.random() < 0.3:
+            tid = rng.choice(data).tid
+            timed('tweet_stats', service.tweet_stats, pool, tid)
+            if rng.random() < 0.1:
+                timed('retweet', service.retweet, pool, session, tid)
+            # Coming back from the tweet redraws the same feed page
+            timed('feed', service.feed_page, pool, session, page_num)
+        if rng.random() < 0.1:
+            timed('compose', service.compose, pool, session, benchmark.random_text(rng))
+        if not service.has_next_feed_page(pool, session, page_num):
+            break
+    if rng.random() < 0.2:
+        timed('search_tweets', service.search_tweets, pool, [benchmark.random_word(rng)], 1)
+    if rng.random() < 0.1:
+        timed('search_users', service.search_users, pool, 'user{}'.format(rng.randint(1, 99)), 1)
+    if rng.random() < 0.1:
+        flwee = rng.randint(1, users)
+        timed('user_profile', service.user_profile, pool, flwee)
+        if rng.random() < 0.2 and flwee != session.usr:
+            timed('follow', service.follow, pool, session, flwee)
+
+def drive(pool, sessions, threads, pages, seed):
+    """
+    Function to run many sessions at once on a pool of worker threads.
+
+    Arguments:
+    pool (service.ConnectionPool): The shared connections.
+    sessions (int): Number of sessions to simulate.
+    threads (int): Number of sessions running at the same time.
+    pages (int): The most feed pages each session reads.
+    seed (int): Random seed.
+
+    Returns:
+    result (tuple): (seconds, {action: sorted latencies in seconds}).
+    """
+    samples = collections.defaultdict(list)
+    lock = threading.Lock()
+    with pool.reader() as connection:
+        users = connection.execute('SELECT MAX(usr) FROM users').fetchone()[0]
+
+    def record(action, seconds):
+        with lock:
+            samples[action].append(seconds)
+
+    def one(i):
+        rng = random.Random(seed * 1000003 + i)
+        run_session(pool, rng.randint(1, users), users, rng, pages, record)
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        # list() re-raises the first error from a session
+        list(executor.map(one, range(sessions)))
+    elapsed = time.perf_counter() - start
+    return elapsed, {action: sorted(values) for action, values in samples.items()}
+
+def report(readers, cache_mb, elapsed, samples):
+    """
+    Function to print the throughput and latency percentiles of one run.
+    """
+    total = sum(len(values) for values in samples.values())
+    print('readers {:>2}, cache {:g} MB: {} actions in {:.2f}s, {:.0f} actions/s'.format(
+        readers, cache_mb, total, elapsed, total / elapsed))
+    for action in sorted(samples):
+        values = samples[action]
+        p = lambda q: values[min(len(values) - 1, int(len(values) * q))] * 1000
+        print('  {:<14} {:>7}  p50 {:>8.2f} ms  p95 {:>8.2f} ms  p99 {:>8.2f} ms'.format(
+            action, len(values), p(0.5), p(0.95), p(0.99)))
+
+def main():
+    """
+    Function to simulate thousands of tweetbook sessions against one database,
+    once for each number of read connections in the pool.
+
+    Arguments: None
+
+    Returns: None
+    """
+    parser = argparse.ArgumentParser(description='Drive many tweetbook sessions through the service layer.')
+    parser.add_argument('--db', help='existing database to use; by default a scratch database is generated')
+    parser.add_argument('--dir', default=tempfile.gettempdir(), help='directory for the scratch database')
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--tweets', type=int, default=200000)
+    parser.add_argument('--follows', type=int, default=20)
+    parser.add_argument('--retweets', type=int, default=20000)
+    parser.add_argument('--sessions', type=int, default=5000, help='sessions to simulate')
+    parser.add_argument('--threads', type=int, default=64, help='sessions running at the same time')
+    parser.add_argument('--pages', type=int, default=5, help='most feed pages read per session')
+    parser.add_argument('--readers', type=int, nargs='+', default=[0, 4], help='read connections in the pool')
+    parser.add_argument('--cache-mb', type=float, nargs='+', default=[0, 32], help='query cache sizes to try, 0 for none')
+    parser.add_argument('--profile', default='fast', help='storage profile of the write connection')
+    parser.add_argument('--feed', default='timeline', choices=['timeline', 'query'])
+    parser.add_argument('--seed', type=int, default=291)
+    args = parser.parse_args()
+
+    path = args.db
+    if path is None:
+        path = os.path.join(args.dir, 'bench_sessions.db')
+        connection = benchmark.open_db(path, args.users)
+        benchmark.populate(connection, args.users, args.tweets, args.follows, 0, 0, args.retweets, args.seed)
+        connection.close()
+
+    for readers in args.readers:
+        for cache_mb in args.cache_mb:
+            pool = service.ConnectionPool(path, readers, args.profile, args.feed, cache_mb=cache_mb)
+            elapsed, samples = drive(pool, args.sessions, args.threads, args.pages, args.seed)
+            pool.close()
+            report(readers, cache_mb, elapsed, samples)
+            print('  ' + pool.cache.summary())
+
+    if args.db is None:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+from collections import namedtuple
+
+# Columns that read a users row into a User, leaving out the password
+USER_COLUMNS = 'usr, name, email, city, timezone'
+
+class Tweet(namedtuple('Tweet', ['tid', 'writer', 'tdate', 'text', 'replyto'])):
+    """
+    A row of the tweets table. The fields are the table's columns in order, so a
+    SELECT tweets.* reads straight into it.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """
+        Function to build a Tweet from a row, for use as a cursor's row_factory.
+        """
+        return cls._make(row)
+
+class User(namedtuple('User', ['usr', 'name', 'email', 'city', 'timezone'])):
+    """
+    A row of the users table without the password, read with USER_COLUMNS.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, cursor, row):
+        """
+        Function to build a User from a row, for use as a cursor's row_factory.
+        """
+        return cls._make(row)
+
+def fetch_records(cursor, record):
+    """
+    Function to fetch the rows left on a cursor as records.
+    The cursor's row factory builds each record from the row as it is read, so no
+    dictionary is made per row; the records are tuples and can be shared as they are.
+
+    Arguments:
+    cursor (sqlite3.Cursor): A cursor that has run a query selecting the record's fields in order.
+    record (class): Tweet or User.
+
+    Returns:
+    data (list): One record per row.
+    """
+    cursor.row_factory = record.from_row
+    return cursor.fetchall()
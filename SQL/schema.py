@@ -0,0 +1,416 @@
+import contextlib
+import re
+import sqlite3
+import sys
+
+import timeline
+import counters
+import search
+import trending
+
+# Keep the full-text index in step with the tweets table
+FTS_TRIGGERS = [
+    """CREATE TRIGGER IF NOT EXISTS tweets_fts_insert AFTER INSERT ON tweets BEGIN
+        INSERT INTO tweets_fts(rowid, text) VALUES (new.tid, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_fts_delete AFTER DELETE ON tweets BEGIN
+        INSERT INTO tweets_fts(tweets_fts, rowid, text) VALUES ('delete', old.tid, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_fts_update AFTER UPDATE OF tid, text ON tweets BEGIN
+        INSERT INTO tweets_fts(tweets_fts, rowid, text) VALUES ('delete', old.tid, old.text);
+        INSERT INTO tweets_fts(rowid, text) VALUES (new.tid, new.text);
+    END""",
+]
+
+# Secondary indexes for the hot queries
+INDEXES = [
+    # A user's tweets newest first: flwer_action, the feed join on writer and its tweet count
+    'CREATE INDEX IF NOT EXISTS tweets_writer_tdate ON tweets(writer, tdate DESC)',
+    # Reply count in tweet_action
+    'CREATE INDEX IF NOT EXISTS tweets_replyto ON tweets(replyto)',
+    # Followers of a user: followers_page, flwer_action and the timeline fan-out
+    'CREATE INDEX IF NOT EXISTS follows_flwee_flwer ON follows(flwee, flwer)',
+    # Retweet count in tweet_action
+    'CREATE INDEX IF NOT EXISTS retweets_tid ON retweets(tid)',
+    # Hashtag search, which matches terms with a case-insensitive LIKE
+    'CREATE INDEX IF NOT EXISTS mentions_term ON mentions(term COLLATE NOCASE, tid)',
+]
+
+# Schema changes in the order they are applied. The version a database is at
+# is kept in PRAGMA user_version, so each step runs exactly once per database.
+# Step 1 uses IF NOT EXISTS so databases created before this module are adopted as they are.
+MIGRATIONS = [
+    (1, 'base tables', [
+        '''CREATE TABLE IF NOT EXISTS users (
+            usr int,
+            pwd text,
+            name text,
+            email text,
+            city text,
+            timezone float,
+            primary key (usr)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS follows (
+            flwer int,
+            flwee int,
+            start_date date,
+            primary key (flwer,flwee),
+            foreign key (flwer) references users,
+            foreign key (flwee) references users
+        )''',
+        '''CREATE TABLE IF NOT EXISTS tweets (
+            tid int,
+            writer int,
+            tdate date,
+            text text,
+            replyto int,
+            primary key (tid),
+            foreign key (writer) references users,
+            foreign key (replyto) references tweets
+        )''',
+        '''CREATE TABLE IF NOT EXISTS hashtags (
+            term text,
+            primary key (term)
+        )''',
+        '''CREATE TABLE IF NOT EXISTS mentions (
+            tid int,
+            term text,
+            primary key (tid,term),
+            foreign key (tid) references tweets,
+            foreign key (term) references hashtags
+        )''',
+        '''CREATE TABLE IF NOT EXISTS retweets (
+            usr int,
+            tid int,
+            rdate date,
+            primary key (usr,tid),
+            foreign key (usr) references users,
+            foreign key (tid) references tweets
+        )''',
+    ]),
+    (2, 'indexes for the hot queries', INDEXES),
+    (3, 'full-text index on tweet text', [
+        # External content table: the text stays in tweets, the index is keyed by tid.
+        # '#' is part of a token, so hashtags are indexed apart from plain words.
+        # Prefix indexes keep the keyword* queries from expanding every matching term.
+        """CREATE VIRTUAL TABLE IF NOT EXISTS tweets_fts USING fts5(
+            text, content='tweets', content_rowid='tid', tokenize="unicode61 tokenchars '#'", prefix='2 3'
+        )""",
+    ] + FTS_TRIGGERS + [
+        # Index the tweets that are already there
+        "INSERT INTO tweets_fts(tweets_fts) VALUES ('rebuild')",
+    ]),
+    (4, 'ID sequences', [
+        # Next free user and tweet ID, handed out in blocks by ids.IdAllocator
+        '''CREATE TABLE IF NOT EXISTS sequences (
+            name text,
+            next int,
+            primary key (name)
+        )''',
+        "INSERT OR IGNORE INTO sequences(name, next) SELECT 'usr', IFNULL(MAX(usr), 0) + 1 FROM users",
+        "INSERT OR IGNORE INTO sequences(name, next) SELECT 'tid', IFNULL(MAX(tid), 0) + 1 FROM tweets",
+    ]),
+    (5, 'tweet and user counters', counters.COUNTER_TABLES + counters.COUNTER_TRIGGERS + counters.REBUILD),
+    # Databases migrated to 5 before the update trigger existed get it here
+    (6, 'counter trigger for tweet updates', counters.COUNTER_TRIGGERS + counters.REBUILD),
+    (7, 'trending hashtag buckets', [trending.TRENDING_SCHEMA]),
+    (8, 'database state', [
+        # One row per build a bulk load has dropped and not made again yet, named
+        # after the context manager that dropped it, so migrate can finish it
+        '''CREATE TABLE IF NOT EXISTS meta (
+            name text,
+            value text,
+            primary key (name)
+        )''',
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# EXPLAIN QUERY PLAN lines that read a whole table or index; a full-text table is searched through its own index
+FULL_SCAN = re.compile(r'SCAN (?!CONSTANT ROW)(?!\w+ VIRTUAL TABLE)')
+# Plan lines for subqueries built by the query itself; reading one back is not a table scan
+SUBQUERY = re.compile(r'(?:MATERIALIZE|CO-ROUTINE) (\S+)')
+
+# The queries run on every page view, with sample parameters for EXPLAIN QUERY PLAN.
+# None of them may read a whole table. The keyword searches with a leading '%'
+# wildcard cannot use an index and are left out.
+HOT_QUERIES = {
+    'login': ('SELECT usr FROM users WHERE usr=? AND pwd=?', (1, 'pwd')),
+    'feed': ('''
+        SELECT tweets.*
+        FROM tweets
+        JOIN follows ON follows.flwee = tweets.writer
+        WHERE follows.flwer = ?
+        UNION
+        SELECT tweets.*
+        FROM tweets
+        JOIN retweets ON retweets.tid = tweets.tid
+        JOIN follows ON follows.flwee = retweets.usr
+        WHERE follows.flwer = ?
+        ORDER BY tweets.tdate DESC
+        LIMIT 5 OFFSET ?''', (1, 1, 0)),
+    'tweet_stats': ('SELECT retweets, replies FROM tweet_stats WHERE tid = ?', (1,)),
+    # The tweet a reply is composed to, see service.tweet_id
+    'reply_target': ('SELECT 1 FROM tweets WHERE tid = ?', (1,)),
+    'followers': ('''
+        SELECT u1.usr, u1.name, u1.email, u1.city, u1.timezone
+        FROM follows f1, users u1
+        WHERE f1.flwee = ?
+        AND f1.flwer = u1.usr''', (1,)),
+    'user_profile': ('''
+        SELECT users.name, user_stats.tweets, user_stats.following, user_stats.followers
+        FROM users LEFT JOIN user_stats ON user_stats.usr = users.usr
+        WHERE users.usr = ?''', (1,)),
+    'user_tweets': ('''
+        SELECT *
+        FROM tweets
+        WHERE writer = ?
+        ORDER BY tdate DESC
+        LIMIT 3 OFFSET ?''', (1, 0)),
+    # The full-text search, on a page inside the ranked window and on one past it
+    'search_tweets': search.search_query(search.match_expression(['farmers']), 1),
+    'search_tweets_past_window': search.search_query(search.match_expression(['farmers']), search.RANK_WINDOW),
+    'fan_out_tweet': ('SELECT flwer, ?, ? FROM follows WHERE flwee = ?', ('2023-01-01', 1, 1)),
+}
+
+# Feed queries that only exist once the timeline table has been created
+TIMELINE_QUERIES = {
+    'timeline_feed': timeline.feed_query(1),
+    'timeline_feed_next': timeline.feed_query(1, ('2023-01-01', 1)),
+    'fan_out_retweet': ('''
+        SELECT follows.flwer, tweets.tdate, tweets.tid
+        FROM follows, tweets
+        WHERE follows.flwee = ? AND tweets.tid = ?''', (1, 1)),
+}
+
+def schema_version(connection):
+    """
+    Function to read the schema version of a database.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns:
+    version (int): The last migration applied, 0 for a database this module has never touched.
+    """
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(connection, analyze=True):
+    """
+    Function to bring a database up to the latest schema version.
+    Each migration runs in its own transaction together with the version bump.
+    A bulk load that was stopped part way is then finished, see finish_deferred.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    analyze (bool): Whether to run ANALYZE after applying migrations, so the planner knows the index statistics.
+
+    Returns:
+    applied (list): The versions that were applied.
+    """
+    applied = []
+    current = schema_version(connection)
+    for version, _, statements in MIGRATIONS:
+        if version <= current:
+            continue
+        connection.commit()
+        connection.execute('BEGIN')
+        try:
+            for statement in statements:
+                connection.execute(statement)
+            # PRAGMA does not take parameters; version is a trusted int
+            connection.execute('PRAGMA user_version = {:d}'.format(version))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        applied.append(version)
+    finished = finish_deferred(connection)
+    if (applied or finished) and analyze:
+        connection.execute('ANALYZE')
+        connection.commit()
+    return applied
+
+def finish_deferred(connection):
+    """
+    Function to build again the indexes, full-text index and counters that a bulk load
+    dropped, if the load was stopped before it could. The meta table records what was
+    dropped, so a killed import leaves the database to be fixed by the next migrate.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection, at the latest schema version.
+
+    Returns:
+    finished (list): The names of the builds that were finished.
+    """
+    pending = {name for (name,) in connection.execute("SELECT name FROM meta WHERE name LIKE 'deferred_%'")}
+    finished = []
+    # The same order as at the end of a bulk load: the counters are rebuilt with the indexes there
+    for name, restore in (('deferred_indexes', restore_indexes), ('deferred_counters', counters.restore_counters),
+                          ('deferred_fts', restore_fts)):
+        if name in pending:
+            print('Finishing an interrupted bulk load: {}'.format(name), file=sys.stderr)
+            restore(connection)
+            finished.append(name)
+    return finished
+
+@contextlib.contextmanager
+def bulk_load(connection):
+    """
+    Context manager for bulk loads into tweets, retweets and follows: the
+    secondary indexes, the full-text index and the counters are built once at
+    the end instead of being kept up to date row by row.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    # Finished in reverse order: the indexes come back first so rebuilding the
+    # counters can use them, then the full-text index, then the statistics
+    with deferred_fts(connection), counters.deferred_counters(connection), deferred_indexes(connection):
+        yield
+    connection.execute('ANALYZE')
+    connection.commit()
+
+@contextlib.contextmanager
+def deferred_indexes(connection):
+    """
+    Context manager that drops the secondary indexes for a bulk load and creates them again at the end.
+    Sorting the rows once to build an index is much faster than inserting into it row by row.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    connection.commit()
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO meta(name, value) VALUES ('deferred_indexes', datetime('now'))")
+        for statement in INDEXES:
+            connection.execute('DROP INDEX IF EXISTS ' + re.search(r'EXISTS (\w+)', statement).group(1))
+    try:
+        yield
+    finally:
+        connection.commit()
+        restore_indexes(connection)
+
+def restore_indexes(connection):
+    """
+    Function to create the secondary indexes dropped by deferred_indexes.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    with connection:
+        for statement in INDEXES:
+            connection.execute(statement)
+        connection.execute("DELETE FROM meta WHERE name = 'deferred_indexes'")
+
+@contextlib.contextmanager
+def deferred_fts(connection):
+    """
+    Context manager for bulk loads into tweets.
+    Updating the full-text index row by row is much slower than building it in
+    one go, so the sync triggers are dropped for the load and the index is
+    rebuilt once at the end.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    connection.commit()
+    with connection:
+        connection.execute("INSERT OR REPLACE INTO meta(name, value) VALUES ('deferred_fts', datetime('now'))")
+        for name in ('tweets_fts_insert', 'tweets_fts_delete', 'tweets_fts_update'):
+            connection.execute('DROP TRIGGER IF EXISTS ' + name)
+    try:
+        yield
+    finally:
+        connection.commit()
+        restore_fts(connection)
+
+def restore_fts(connection):
+    """
+    Function to create the sync triggers dropped by deferred_fts and rebuild the full-text index.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    with connection:
+        for statement in FTS_TRIGGERS:
+            connection.execute(statement)
+        connection.execute("INSERT INTO tweets_fts(tweets_fts) VALUES ('rebuild')")
+        connection.execute("DELETE FROM meta WHERE name = 'deferred_fts'")
+
+def full_scans(connection, sql, params):
+    """
+    Function to find the tables a query reads in full.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    sql (str): The query.
+    params (tuple): Parameters for the query.
+
+    Returns:
+    scans (list): The EXPLAIN QUERY PLAN lines that scan a whole table or index.
+    """
+    plan = connection.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+    subqueries = {match.group(1) for match in (SUBQUERY.match(row[3]) for row in plan) if match}
+    return [row[3] for row in plan if FULL_SCAN.match(row[3]) and row[3].split()[1] not in subqueries]
+
+def check_query_plans(connection, queries=None):
+    """
+    Function to check that none of the hot queries falls back to a full scan.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    queries (dict): name -> (sql, params); defaults to HOT_QUERIES, plus TIMELINE_QUERIES if the timeline table exists.
+
+    Returns:
+    failures (dict): name -> list of scan lines, for every query that scans.
+    """
+    if queries is None:
+        queries = dict(HOT_QUERIES)
+        if timeline.exists(connection):
+            queries.update(TIMELINE_QUERIES)
+    failures = {}
+    for name, (sql, params) in queries.items():
+        scans = full_scans(connection, sql, params)
+        if scans:
+            failures[name] = scans
+    return failures
+
+def main():
+    """
+    Function to migrate a database and check the hot query plans from the command line.
+    Usage: python3 schema.py <database> [--check]
+    Exits with status 1 if --check finds a query that does a full scan.
+
+    Arguments: None
+
+    Returns: None
+    """
+    if len(sys.argv) < 2:
+        print('Usage: python3 schema.py <database> [--check]')
+        sys.exit(2)
+    connection = sqlite3.connect(sys.argv[1])
+    applied = migrate(connection)
+    print('schema version {} (applied: {})'.format(schema_version(connection), applied or 'none'))
+    if '--check' in sys.argv[2:]:
+        failures = check_query_plans(connection)
+        names = list(HOT_QUERIES) + (list(TIMELINE_QUERIES) if timeline.exists(connection) else [])
+        for name in names:
+            print('{:<26} {}'.format(name, 'FULL SCAN: ' + '; '.join(failures[name]) if name in failures else 'ok'))
+        connection.close()
+        sys.exit(1 if failures else 0)
+    connection.close()
+
+if __name__ == "__main__":
+    main()
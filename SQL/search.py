@@ -0,0 +1,92 @@
+# Number of newest matching tweets that are ranked by relevance. Scoring every match
+# of a very common word takes longer than the rest of the search, so only this many
+# are scored; tweet IDs grow over time, so these are the most recent matches.
+RANK_WINDOW = 1000
+
+def match_expression(keywords):
+    """
+    Function to turn search keywords into an FTS5 MATCH expression.
+    A tweet matches if it contains any of the keywords, like the old per-keyword LIKE searches.
+    Plain keywords match words and hashtags starting with them; '#' keywords only match that hashtag.
+
+    Arguments:
+    keywords (list): The keywords entered by the user.
+
+    Returns:
+    expression (str): The MATCH expression, or None if there is nothing to search for.
+    """
+    terms = []
+    for keyword in keywords:
+        # A keyword of punctuation only tokenizes to an empty phrase, which would match every tweet
+        if not has_token(keyword):
+            continue
+        # Double quotes are escaped by doubling them inside an FTS5 string
+        word = keyword.replace('"', '""')
+        if word.startswith('#'):
+            terms.append('"{}"'.format(word))
+        else:
+            terms.append('"{0}" * OR "#{0}" *'.format(word))
+    return ' OR '.join(terms) or None
+
+def has_token(keyword):
+    """
+    Function to tell whether a keyword holds any letter or digit, the characters the
+    unicode61 tokenizer keeps in a token besides '#'.
+
+    Arguments:
+    keyword (str): A keyword entered by the user.
+
+    Returns:
+    found (bool): True if the keyword has something to search for.
+    """
+    return any(character.isalnum() for character in keyword)
+
+def search_page(cursor, keywords, page_num, page_size=5):
+    """
+    Function to read one page of tweets matching the keywords, best matches first.
+    All keywords are answered by a single query on the full-text index.
+    The RANK_WINDOW newest matches come first, ranked among themselves; pages past
+    them rank the older matches as well and list them after.
+
+    Arguments:
+    cursor (sqlite3.Cursor): The cursor to run the query on; the rows are left on it.
+    keywords (list): The keywords entered by the user.
+    page_num (int): The page to read, starting at 1.
+    page_size (int): Number of tweets per page.
+
+    Returns:
+    found (bool): False if the keywords held nothing to search for.
+    """
+    expression = match_expression(keywords)
+    if expression is None:
+        return False
+    cursor.execute(*search_query(expression, page_num, page_size))
+    return True
+
+def search_query(expression, page_num, page_size=5):
+    """
+    Function to build the query search_page runs, also checked by schema.check_query_plans.
+
+    Arguments:
+    expression (str): The MATCH expression, see match_expression.
+    page_num (int): The page to read, starting at 1.
+    page_size (int): Number of tweets per page.
+
+    Returns:
+    query (tuple): (sql, params).
+    """
+    offset = (max(page_num, 1) - 1) * page_size
+    # The lowest rowid of the RANK_WINDOW newest matches
+    window = "(SELECT MIN(rowid) FROM (SELECT rowid FROM tweets_fts WHERE tweets_fts MATCH ?1 ORDER BY rowid DESC LIMIT ?2))"
+    if offset + page_size <= RANK_WINDOW:
+        # The rowid bound is applied inside the index, so only the newest matches are ranked
+        hits = "SELECT rowid, 1 AS newest, rank FROM tweets_fts WHERE tweets_fts MATCH ?1 AND rowid >= {} ORDER BY rank"
+    else:
+        # Every match is ranked, but the newest ones still come first, as on the earlier pages
+        hits = "SELECT rowid, rowid >= {} AS newest, rank FROM tweets_fts WHERE tweets_fts MATCH ?1 ORDER BY newest DESC, rank"
+    # Rank and page inside the full-text index first, so only the tweets on the page are joined
+    return ("""
+        SELECT tweets.*
+        FROM ({} LIMIT ?3 OFFSET ?4) AS hits
+        JOIN tweets ON tweets.tid = hits.rowid
+        ORDER BY hits.newest DESC, hits.rank""".format(hits.format(window)), (expression, RANK_WINDOW, page_size, offset))
@@ -0,0 +1,566 @@
+import contextlib
+import os
+import queue
+import sys
+import threading
+import time
+
+from writebuffer import WriteBuffer
+from ids import IdAllocator
+import timeline
+import schema
+import search
+import storage
+import trending
+from records import Tweet, User, USER_COLUMNS, fetch_records
+
+# The text analysis is shared with the MongoDB side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.entities import hashtags, hashtag_keys
+from common.cache import QueryCache, query_key
+
+class ConnectionPool:
+    """
+    Connections to one tweetbook database shared by many sessions.
+    SQLite allows a single writer at a time, so there is one write connection
+    behind a lock, which also owns the write buffer, and a queue of read-only
+    connections that WAL mode lets run while the writer commits.
+    With readers=0 every query goes through the write connection, as it did
+    when the program kept one global connection.
+    The results of the page queries are kept in a query cache until a write
+    changes them or their TTL runs out (TTL covers writes from other processes).
+    """
+    def __init__(self, path, readers=4, profile=storage.DEFAULT_PROFILE, feed_mode='timeline', cache_mb=32, cache_ttl=30.0,
+                 query_stats=None):
+        """
+        Arguments:
+        path (str): The path to the SQLite database file.
+        readers (int): Number of read-only connections.
+        profile (str): The storage profile of the write connection.
+        feed_mode (str): 'timeline' to read the home feed from the timeline table, 'query' to compute it.
+        cache_mb (float): Memory cap of the query cache in MB, 0 to turn it off.
+        cache_ttl (float): Seconds a cached result is served for.
+        query_stats (QueryStats): Where every connection records its statements, or None to measure nothing.
+        """
+        self.feed_mode = feed_mode
+        self.query_stats = query_stats
+        self.write_connection = storage.open_connection(path, profile, check_same_thread=False, query_stats=query_stats)
+        self.write_lock = threading.RLock()
+
+        # Create any missing tables and indexes before the readers open
+        schema.migrate(self.write_connection)
+        self.write_buffer = WriteBuffer(self.write_connection)
+        self.user_ids = IdAllocator(self.write_connection, 'usr', block_size=10)
+
+        # Build the timeline table if the feed is read from it, and keep it up to date whenever it exists
+        if feed_mode == 'timeline':
+            timeline.ensure_timeline(self.write_connection)
+        self.timeline_ready = timeline.exists(self.write_connection)
+        if self.timeline_ready:
+            self.write_buffer.after_write.append(timeline.fan_out_tweets)
+
+        # Hashtag counts for the trending list, saved in the same transaction as the composed tweets
+        self.trending = trending.load_trending(self.write_connection)
+        self.write_buffer.after_write.append(self.record_trending)
+
+        # Page query results, dropped when the tweets that change them are written
+        self.cache = QueryCache(int(cache_mb * 1024 * 1024), cache_ttl)
+        self.write_buffer.after_flush.append(self.invalidate_tweets)
+
+        self.readers = queue.Queue()
+        for _ in range(readers):
+            self.readers.put(storage.open_connection(path, 'readonly', check_same_thread=False, query_stats=query_stats))
+        self.reader_count = readers
+
+    @contextlib.contextmanager
+    def reader(self):
+        """
+        Context manager that lends a connection for reading, waiting for a free one.
+        """
+        if self.reader_count == 0:
+            with self.write_lock:
+                yield self.write_connection
+            return
+        connection = self.readers.get()
+        try:
+            yield connection
+        finally:
+            self.readers.put(connection)
+
+    @contextlib.contextmanager
+    def writer(self):
+        """
+        Context manager that holds the write connection for one transaction.
+        """
+        with self.write_lock:
+            with self.write_connection:
+                yield self.write_connection
+
+    def record_trending(self, connection, tweets):
+        """
+        Function to count the hashtags of newly written tweets and save the trending counts.
+        It is called inside the transaction that inserts the tweets; the tweets are
+        counted at the time of the flush, which is at most a second after they were composed.
+
+        Arguments:
+        connection (sqlite3.Connection): The write connection.
+        tweets (list): (tid, writer, tdate, text, replyto) tuples of the new tweets.
+
+        Returns: None
+        """
+        now = time.time()
+        for tweet in tweets:
+            self.trending.add(hashtag_keys(tweet[3]), now)
+        trending.save_trending(connection, self.trending)
+
+    def feed_tags(self, connection, usrs):
+        """
+        Function to find the cache tags of the feeds that show what some users write or retweet.
+
+        Arguments:
+        connection (sqlite3.Connection): The connection to read the follows through.
+        usrs (iterable): The user IDs.
+
+        Returns:
+        tags (list): A ('feed', usr) tag for every follower.
+        """
+        usrs = list(usrs)
+        rows = connection.execute('SELECT DISTINCT flwer FROM follows WHERE flwee IN ({})'.format(
+            ','.join('?' * len(usrs))), usrs).fetchall()
+        return [('feed', str(row[0])) for row in rows]
+
+    def invalidate_tweets(self, tweets):
+        """
+        Function to drop the cached results that newly written tweets change: their
+        writers' profiles and tweets, the reply counts of the tweets they reply to,
+        the feeds of the writers' followers and every tweet search.
+        It is called once the tweets are committed.
+
+        Arguments:
+        tweets (list): (tid, writer, tdate, text, replyto) tuples of the new tweets.
+
+        Returns: None
+        """
+        writers = {tweet[1] for tweet in tweets}
+        tags = [('tweets',)] + [('user', str(writer)) for writer in writers]
+        tags += [('tweet', str(tweet[4])) for tweet in tweets if tweet[4] is not None]
+        with self.write_lock:
+            tags += self.feed_tags(self.write_connection, writers)
+        self.cache.invalidate(*tags)
+
+    def flush_if_due(self):
+        """
+        Function to write out composed tweets that have waited long enough.
+
+        Arguments: None
+
+        Returns: None
+        """
+        with self.write_lock:
+            self.write_buffer.flush_if_due()
+
+    def close(self):
+        """
+        Function to flush the write buffer and close every connection.
+
+        Arguments: None
+
+        Returns: None
+        """
+        with self.write_lock:
+            self.write_buffer.flush()
+            self.write_connection.close()
+        for _ in range(self.reader_count):
+            self.readers.get().close()
+
+class Session:
+    """
+    The state of one logged-in user: who they are and where they are in their feed.
+    """
+    def __init__(self, usr):
+        """
+        Arguments:
+        usr (int): The user ID of the logged-in user.
+        """
+        self.usr = usr
+        # (tdate, tid) of the last tweet on each feed page before the current one, for the timeline feed
+        self.feed_bounds = [None]
+
+def cached_rows(pool, tags, query, params, load):
+    """
+    Function to read rows through the pool's query cache.
+    The rows are records, which cannot be changed, so the cached list is returned as it is.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    tags (list): Tags that a write can invalidate the rows by.
+    query (str): The SQL text, or a name for a query built elsewhere.
+    params (tuple): Everything else the rows depend on.
+    load (function): Runs the query and returns the rows as records.
+
+    Returns:
+    data (list): The rows as records.
+    """
+    return pool.cache.get(query_key(query, *params), load, tags)
+
+def login(pool, usr, pwd):
+    """
+    Function to check a user ID and password and start a session.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    usr (str): The user ID entered.
+    pwd (str): The password entered.
+
+    Returns:
+    session (Session): The new session, or None if there is no user with that ID and password.
+    """
+    with pool.reader() as connection:
+        row = connection.execute('SELECT usr FROM users WHERE usr=? AND pwd=?', (usr, pwd)).fetchone()
+    return Session(row[0]) if row else None
+
+def signup(pool, pwd, name, email, city, timezone):
+    """
+    Function to add a new user.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    pwd (str): The password.
+    name (str): The name.
+    email (str): The email address.
+    city (str): The city.
+    timezone (str): The timezone.
+
+    Returns:
+    usr (int): The user ID of the new user.
+    """
+    with pool.write_lock:
+        # Allocate before the insert transaction; a new block is reserved in its own
+        usr = pool.user_ids.next()
+    with pool.writer() as connection:
+        connection.execute('INSERT INTO users(usr,pwd,name,email,city,timezone) VALUES (?,?,?,?,?,?)',
+                           (usr, pwd, name, email, city, timezone))
+    # A profile looked up before the user existed is cached as None
+    pool.cache.invalidate(('users',), ('user', str(usr)))
+    return usr
+
+def feed_page(pool, session, page_num, page_size=5):
+    """
+    Function to read one page of the session user's home feed: tweets from the
+    users they follow, plus tweets those users retweeted, newest first.
+    The timeline feed is paged by key, so pages must be read in order from page 1;
+    the bounds are kept on the session.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    session (Session): The logged-in session.
+    page_num (int): The page number, starting at 1.
+    page_size (int): Number of tweets per page.
+
+    Returns:
+    data (list): The tweets on the page as Tweet records.
+    """
+    bound = session.feed_bounds[page_num-1] if pool.feed_mode == 'timeline' else None
+
+    def load():
+        with pool.reader() as connection:
+            cursor = connection.cursor()
+            if pool.feed_mode == 'timeline':
+                # Read the page from the timeline table, starting after the last tweet of the previous page
+                timeline.feed_page(cursor, session.usr, bound, page_size)
+            else:
+                cursor.execute("""
+                    SELECT tweets.*
+                    FROM tweets
+                    JOIN follows ON follows.flwee = tweets.writer
+                    WHERE follows.flwer = ?
+                    UNION
+                    SELECT tweets.*
+                    FROM tweets
+                    JOIN retweets ON retweets.tid = tweets.tid
+                    JOIN follows ON follows.flwee = retweets.usr
+                    WHERE follows.flwer = ?
+                    ORDER BY tweets.tdate DESC
+                    LIMIT ? OFFSET ?""", (session.usr, session.usr, page_size, (page_num-1)*page_size))
+            return fetch_records(cursor, Tweet)
+
+    data = cached_rows(pool, [('feed', str(session.usr))], 'feed', (pool.feed_mode, session.usr, bound, page_num, page_size), load)
+
+    # Remember where the next page starts
+    if pool.feed_mode == 'timeline' and len(data) == page_size:
+        del session.feed_bounds[page_num:]
+        session.feed_bounds.append((data[-1].tdate, data[-1].tid))
+    return data
+
+def has_next_feed_page(pool, session, page_num):
+    """
+    Function to tell whether the feed can be paged past page_num.
+    The query feed always can; the timeline feed only if the page was full.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    session (Session): The logged-in session.
+    page_num (int): The current page number.
+
+    Returns:
+    more (bool): False if page_num is known to be the last page.
+    """
+    return pool.feed_mode != 'timeline' or len(session.feed_bounds) > page_num
+
+def tweet_stats(pool, tid):
+    """
+    Function to count the retweets of and replies to a tweet.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    tid (int): The tweet ID.
+
+    Returns:
+    stats (tuple): (retweets, replies).
+    """
+    def load():
+        with pool.reader() as connection:
+            # Kept up to date by triggers; a tweet with no row has no retweets or replies
+            row = connection.execute('SELECT retweets, replies FROM tweet_stats WHERE tid = ?', (tid,)).fetchone()
+        return row if row else (0, 0)
+
+    return pool.cache.get(query_key('tweet_stats', tid), load, [('tweet', str(tid))])
+
+def compose(pool, session, text, replyto=None):
+    """
+    Function to write a tweet or a reply for the session user.
+    The tweet is queued in the write buffer and written in bulk. A LookupError is
+    raised if replyto is not the ID of a tweet.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    session (Session): The logged-in session.
+    text (str): The text of the tweet.
+    replyto (int): The tweet ID to reply to, or None for a new tweet.
+
+    Returns:
+    tid (int): The ID of the new tweet.
+    """
+    tdate = time.strftime("%Y-%m-%d")
+    with pool.write_lock:
+        # Checked here, since a reply to a missing tweet would fail when the buffer writes it
+        if replyto is not None:
+            replyto = tweet_id(pool, replyto)
+        tid = pool.write_buffer.next_tid()
+        pool.write_buffer.add(tid, session.usr, tdate, text, replyto, hashtags(text))
+    return tid
+
+def tweet_id(pool, tid):
+    """
+    Function to check a tweet ID entered by a user against the tweets written and those still in
+    the write buffer. It is called with the write lock held, and raises a LookupError if there is no such tweet.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    tid (int or str): The tweet ID.
+
+    Returns:
+    tid (int): The tweet ID as an integer.
+    """
+    try:
+        tid = int(tid)
+    except (TypeError, ValueError):
+        raise LookupError('there is no tweet {}'.format(tid))
+    if not pool.write_buffer.has_tweet(tid) and pool.write_connection.execute(
+            'SELECT 1 FROM tweets WHERE tid = ?', (tid,)).fetchone() is None:
+        raise LookupError('there is no tweet {}'.format(tid))
+    return tid
+
+def retweet(pool, session, tid):
+    """
+    Function to retweet a tweet as the session user.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    session (Session): The logged-in session.
+    tid (int): The tweet ID to retweet.
+
+    Returns: None
+    """
+    rdate = time.strftime("%Y-%m-%d")
+    with pool.writer() as connection:
+        # An upsert rather than REPLACE, which would bypass the counter triggers
+        connection.execute('''
+            INSERT INTO retweets(usr,tid,rdate) VALUES (?,?,?)
+            ON CONFLICT(usr,tid) DO UPDATE SET rdate = excluded.rdate''', (session.usr, tid, rdate))
+        # Add the tweet to the feeds of the user's followers
+        if pool.timeline_ready:
+            timeline.fan_out_retweet(connection, session.usr, tid)
+        tags = pool.feed_tags(connection, [session.usr])
+    # The retweet count and the feeds of the user's followers changed
+    pool.cache.invalidate(('tweet', str(tid)), *tags)
+
+def followers(pool, usr):
+    """
+    Function to list the followers of a user.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    usr (int): The user ID.
+
+    Returns:
+    data (list): The followers as User records.
+    """
+    sql = """
+        SELECT {}
+        FROM follows f1, users u1
+        WHERE f1.flwee = ?
+        AND f1.flwer = u1.usr""".format(', '.join('u1.' + column for column in USER_COLUMNS.split(', ')))
+
+    def load():
+        with pool.reader() as connection:
+            return fetch_records(connection.execute(sql, (usr,)), User)
+
+    return cached_rows(pool, [('followers', str(usr))], sql, (usr,), load)
+
+def user_profile(pool, usr):
+    """
+    Function to read a user's name and tweet, following and follower counts.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    usr (int): The user ID.
+
+    Returns:
+    profile (dict): usr, name, tweets, following and followers, or None if there is no such user.
+    """
+    def load():
+        with pool.reader() as connection:
+            # The counts are kept up to date by triggers; a user with no row has none of anything
+            row = connection.execute('''
+                SELECT users.name, user_stats.tweets, user_stats.following, user_stats.followers
+                FROM users LEFT JOIN user_stats ON user_stats.usr = users.usr
+                WHERE users.usr = ?''', (usr,)).fetchone()
+        if row is None:
+            return None
+        name, tweets, following, followers = row
+        return {'usr': usr, 'name': name, 'tweets': tweets or 0, 'following': following or 0, 'followers': followers or 0}
+
+    profile = pool.cache.get(query_key('user_profile', usr), load, [('user', str(usr))])
+    return None if profile is None else dict(profile)
+
+def user_tweets(pool, usr, page_num, page_size=3):
+    """
+    Function to read one page of a user's tweets, newest first.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    usr (int): The user ID.
+    page_num (int): The page number, starting at 1.
+    page_size (int): Number of tweets per page.
+
+    Returns:
+    data (list): The tweets as Tweet records.
+    """
+    sql = """
+        SELECT *
+        FROM tweets
+        WHERE writer = ?
+        ORDER BY tdate DESC
+        LIMIT ? OFFSET ?"""
+    params = (usr, page_size, (page_num-1)*page_size)
+
+    def load():
+        with pool.reader() as connection:
+            return fetch_records(connection.execute(sql, params), Tweet)
+
+    return cached_rows(pool, [('user', str(usr))], sql, params, load)
+
+def follow(pool, session, flwee):
+    """
+    Function to make the session user follow another user.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    session (Session): The logged-in session.
+    flwee (int): The user ID to follow.
+
+    Returns: None
+    """
+    start_date = time.strftime("%Y-%m-%d")
+    with pool.writer() as connection:
+        # An upsert rather than REPLACE, which would bypass the counter triggers
+        connection.execute('''
+            INSERT INTO follows(flwer,flwee,start_date) VALUES (?,?,?)
+            ON CONFLICT(flwer,flwee) DO UPDATE SET start_date = excluded.start_date''', (session.usr, flwee, start_date))
+        # Add the followed user's tweets and retweets to the user's feed
+        if pool.timeline_ready:
+            timeline.fan_out_follow(connection, session.usr, flwee)
+    # The user's feed and following count, and the followed user's followers, changed
+    pool.cache.invalidate(('feed', str(session.usr)), ('user', str(session.usr)),
+                          ('user', str(flwee)), ('followers', str(flwee)))
+
+def trending_hashtags(pool, n=10):
+    """
+    Function to list the hashtags used most over the last day of tweets.
+    The list is read from memory; counts saved by other processes are picked up
+    when the pool opens and whenever this process saves to the same hour.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    n (int): Number of hashtags to list.
+
+    Returns:
+    data (list): (hashtag, estimated count) pairs, most used first.
+    """
+    return pool.trending.top(n)
+
+def search_tweets(pool, keywords, page_num):
+    """
+    Function to run one page of a ranked full-text search for tweets.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    keywords (list): The keywords; a keyword starting with '#' matches the hashtag.
+    page_num (int): The page number, starting at 1.
+
+    Returns:
+    data (list): The matching tweets as Tweet records, or None if the keywords have nothing to search for.
+    """
+    def load():
+        with pool.reader() as connection:
+            cursor = connection.cursor()
+            if not search.search_page(cursor, keywords, page_num):
+                return None
+            return fetch_records(cursor, Tweet)
+
+    # Every new tweet may match, so all searches are dropped when tweets are written
+    return pool.cache.get(query_key('search_tweets', keywords, page_num), load, [('tweets',)])
+
+def search_users(pool, keyword, page_num):
+    """
+    Function to search users whose name or city contains a keyword, names first and shortest first.
+
+    Arguments:
+    pool (ConnectionPool): The database connections.
+    keyword (str): The keyword, in lower case.
+    page_num (int): The page number, starting at 1.
+
+    Returns:
+    data (list): The matching users as User records.
+    """
+    pattern = '%'+keyword+'%'
+    sql = '''
+        SELECT {}
+        FROM users
+        WHERE LOWER(name) LIKE ? OR LOWER(city) LIKE ?
+        ORDER BY
+        CASE
+            WHEN LOWER(name) LIKE ? THEN 0
+            ELSE 1
+        END,
+        LENGTH(name) ASC,
+        LENGTH(city) ASC
+        LIMIT 5 OFFSET ?'''.format(USER_COLUMNS)
+    params = (pattern, pattern, pattern, (page_num-1)*5)
+
+    def load():
+        with pool.reader() as connection:
+            return fetch_records(connection.execute(sql, params), User)
+
+    return cached_rows(pool, [('users',)], sql, params, load)
@@ -0,0 +1,94 @@
+import sqlite3
+
+import instrument
+
+# Connection settings, by profile.
+# durable: WAL so readers and the writer do not block each other, fsync on every commit.
+# fast: WAL with synchronous=NORMAL; a crash of the program loses nothing, a power
+#       cut can lose the last few commits but never corrupts the database.
+# readonly: for read replicas and reporting; writes are refused.
+# bulk: for importers only; no fsync and no foreign key checks. A crash of the
+#       program keeps every committed batch, a power cut can corrupt the file.
+PROFILES = {
+    'durable': {
+        'journal_mode': 'WAL',
+        'synchronous': 'FULL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'fast': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -262144,
+        'mmap_size': 1073741824,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'readonly': {
+        'query_only': 'ON',
+        'cache_size': -65536,
+        'mmap_size': 1073741824,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+    'bulk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'cache_size': -1048576,
+        'mmap_size': 1073741824,
+        'temp_store': 'MEMORY',
+        'foreign_keys': 'OFF',
+        'wal_autocheckpoint': 100000,
+    },
+    # The settings sqlite3.connect used before, for comparison in the benchmark
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+    },
+}
+
+DEFAULT_PROFILE = 'durable'
+
+def apply_profile(connection, profile):
+    """
+    Function to apply the PRAGMA settings of a profile to an open connection.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    profile (str): A key of PROFILES.
+
+    Returns: None
+    """
+    for name, value in PROFILES[profile].items():
+        # PRAGMA does not take parameters; names and values come from PROFILES
+        connection.execute('PRAGMA {} = {}'.format(name, value))
+
+def open_connection(path, profile=DEFAULT_PROFILE, check_same_thread=True, query_stats=None):
+    """
+    Function to open a connection to the database with the settings of a profile.
+    Foreign keys are always enforced.
+
+    Arguments:
+    path (str): The path to the SQLite database file.
+    profile (str): A key of PROFILES.
+    check_same_thread (bool): Passed to sqlite3.connect; False lets a pool hand the connection between threads.
+    query_stats (QueryStats): Where to record the time, rows and plan of every statement, or None for a plain connection.
+
+    Returns:
+    connection (sqlite3.Connection): The open connection.
+    """
+    if profile not in PROFILES:
+        raise ValueError('unknown storage profile {!r}, expected one of {}'.format(profile, ', '.join(PROFILES)))
+    # Statements are only wrapped when they are measured, so plain connections cost nothing extra
+    factory = sqlite3.Connection if query_stats is None else instrument.InstrumentedConnection
+    if profile == 'readonly':
+        connection = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True, check_same_thread=check_same_thread, factory=factory)
+    else:
+        connection = sqlite3.connect(path, check_same_thread=check_same_thread, factory=factory)
+    if query_stats is not None:
+        connection.query_stats = query_stats
+    connection.execute('PRAGMA foreign_keys=ON')
+    apply_profile(connection, profile)
+    return connection
@@ -0,0 +1,21 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+# The modules are scripts that import each other by name, as when they are run from SQL/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import schema
+
+@pytest.fixture
+def connection(tmp_path):
+    """
+    A new database file brought up to the latest schema version.
+    """
+    connection = sqlite3.connect(str(tmp_path / 'tweetbook.db'))
+    connection.execute('PRAGMA foreign_keys=ON')
+    schema.migrate(connection)
+    yield connection
+    connection.close()
@@ -0,0 +1,39 @@
+import counters
+
+def counts(connection):
+    return (connection.execute('SELECT * FROM tweet_stats WHERE retweets OR replies ORDER BY tid').fetchall(),
+            connection.execute('SELECT * FROM user_stats WHERE tweets OR following OR followers ORDER BY usr').fetchall())
+
+def test_triggers_keep_counters_equal_to_a_rebuild(connection):
+    statements = [
+        'INSERT INTO users(usr) VALUES (1), (2), (3)',
+        "INSERT INTO tweets(tid, writer, tdate, text, replyto) VALUES (1, 1, '2023-01-01', 'first', NULL)",
+        "INSERT INTO tweets(tid, writer, tdate, text, replyto) VALUES (2, 2, '2023-01-02', 'reply', 1)",
+        "INSERT INTO tweets(tid, writer, tdate, text, replyto) VALUES (3, 3, '2023-01-02', 'reply', 1)",
+        "INSERT INTO retweets(usr, tid, rdate) VALUES (2, 1, '2023-01-03'), (3, 1, '2023-01-03'), (1, 2, '2023-01-03')",
+        # Retweeting again must not count twice
+        "INSERT INTO retweets(usr, tid, rdate) VALUES (2, 1, '2023-01-04') ON CONFLICT(usr, tid) DO UPDATE SET rdate = excluded.rdate",
+        "INSERT INTO follows(flwer, flwee, start_date) VALUES (1, 2, '2023-01-01'), (3, 2, '2023-01-01'), (2, 1, '2023-01-01')",
+        'DELETE FROM retweets WHERE usr = 3 OR tid = 2',
+        'DELETE FROM follows WHERE flwer = 3',
+        # Moving a reply and handing a tweet to another writer
+        'UPDATE tweets SET replyto = 2, writer = 1 WHERE tid = 3',
+        'DELETE FROM tweets WHERE tid = 3',
+    ]
+    for statement in statements:
+        with connection:
+            connection.execute(statement)
+        assert counters.check_counters(connection) == {'tweet_stats': [], 'user_stats': []}, statement
+
+    maintained = counts(connection)
+    counters.rebuild_counters(connection)
+    assert counts(connection) == maintained
+
+def test_wrong_counter_is_reported(connection):
+    with connection:
+        connection.execute('INSERT INTO users(usr) VALUES (1)')
+        connection.execute("INSERT INTO tweets(tid, writer, tdate, text) VALUES (1, 1, '2023-01-01', 'first')")
+        connection.execute('UPDATE user_stats SET tweets = 5 WHERE usr = 1')
+    assert counters.check_counters(connection) == {'tweet_stats': [], 'user_stats': [1]}
+    counters.rebuild_counters(connection)
+    assert counters.check_counters(connection) == {'tweet_stats': [], 'user_stats': []}
@@ -0,0 +1,35 @@
+import sqlite3
+
+from ids import IdAllocator
+
+def test_ids_come_from_reserved_blocks(connection):
+    allocator = IdAllocator(connection, 'tid', block_size=3)
+    assert [allocator.next() for _ in range(7)] == [1, 2, 3, 4, 5, 6, 7]
+    # Three blocks were taken, so the sequence is past the whole third one
+    assert connection.execute("SELECT next FROM sequences WHERE name = 'tid'").fetchone() == (10,)
+
+def test_two_allocators_never_share_an_id(connection, tmp_path):
+    other = sqlite3.connect(str(tmp_path / 'tweetbook.db'))
+    first = IdAllocator(connection, 'tid', block_size=4)
+    second = IdAllocator(other, 'tid', block_size=4)
+    made = []
+    for _ in range(10):
+        made += [first.next(), second.next(), second.next()]
+    other.close()
+    assert len(set(made)) == len(made)
+
+def test_reserve_skips_ids_written_without_the_allocator(connection):
+    allocator = IdAllocator(connection, 'tid', block_size=5)
+    assert allocator.next() == 1
+    # Another program writes straight into the table, past the reserved block
+    with connection:
+        connection.execute('INSERT INTO users(usr) VALUES (1)')
+        connection.execute("INSERT INTO tweets(tid, writer, tdate, text) VALUES (50, 1, '2023-01-01', 'direct')")
+    assert [allocator.next() for _ in range(4)] == [2, 3, 4, 5]
+    assert allocator.next() == 51
+
+def test_user_ids_have_their_own_sequence(connection):
+    with connection:
+        connection.execute('INSERT INTO users(usr) VALUES (7)')
+    assert IdAllocator(connection, 'usr').next() == 8
+    assert IdAllocator(connection, 'tid').next() == 1
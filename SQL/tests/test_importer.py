@@ -0,0 +1,81 @@
+import gzip
+import json
+
+import pytest
+
+import importer
+import trending
+
+def tweet(tid, content='#farmersprotest', conversation=None):
+    return {'id': tid, 'date': '2021-03-30T03:{:02}:00+00:00'.format(tid % 60), 'content': content,
+            'conversationId': conversation or tid, 'user': {'id': 100 + tid % 3, 'displayname': 'user'}}
+
+def dump(path, docs, compress=False):
+    """
+    Writes documents as NDJSON; a string is written as it is, for lines that do not parse.
+    """
+    data = ''.join((doc if isinstance(doc, str) else json.dumps(doc)) + '\n' for doc in docs).encode()
+    with (gzip.open if compress else open)(str(path), 'wb') as f:
+        f.write(data)
+    return str(path)
+
+@pytest.fixture
+def connection(connection):
+    # The importer runs on a bulk connection, which does not check foreign keys
+    connection.execute('PRAGMA foreign_keys=OFF')
+    return connection
+
+def tids(connection):
+    return [tid for (tid,) in connection.execute('SELECT tid FROM tweets ORDER BY tid')]
+
+def trend_count(connection):
+    return trending.load_trending(connection).count('farmersprotest')
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_import_resumes_after_the_last_batch(connection, tmp_path, compress):
+    path = dump(tmp_path / 'dump.json', [tweet(tid) for tid in range(1, 8)], compress)
+
+    # Stop after the second batch, as if the import was killed while parsing the third
+    class Stop(Exception):
+        pass
+
+    def progress(docs, seconds):
+        if docs == 4:
+            raise Stop()
+    with pytest.raises(Stop):
+        importer.import_file(connection, path, batch_size=2, progress=progress)
+    assert tids(connection) == [1, 2, 3, 4]
+
+    imported, errors, _ = importer.import_file(connection, path, batch_size=2)
+    assert (imported, errors) == (3, 0)
+    assert tids(connection) == list(range(1, 8))
+    assert connection.execute('SELECT docs FROM import_checkpoints').fetchone() == (7,)
+    assert trend_count(connection) == 7
+
+    # Everything is loaded, so running it again reads nothing
+    assert importer.import_file(connection, path, batch_size=2)[0] == 0
+
+def test_document_that_fails_to_parse_leaves_nothing(connection, tmp_path):
+    # The second document's quoted tweet has no user, so the document is dropped after its own row was parsed
+    broken = dict(tweet(2), quotedTweet={'id': 20, 'date': '2021-03-30T03:00:00+00:00'})
+    path = dump(tmp_path / 'dump.json', [tweet(1), broken, 'not json', tweet(3)])
+    imported, errors, _ = importer.import_file(connection, path)
+    assert (imported, errors) == (2, 2)
+    assert tids(connection) == [1, 3]
+    assert connection.execute('SELECT COUNT(*) FROM mentions').fetchone() == (2,)
+
+def test_restart_counts_each_tweet_for_trending_once(connection, tmp_path):
+    path = dump(tmp_path / 'dump.json', [tweet(tid) for tid in range(1, 6)])
+    importer.import_file(connection, path, batch_size=2)
+    importer.import_file(connection, path, batch_size=2, resume=False)
+    assert tids(connection) == [1, 2, 3, 4, 5]
+    assert trend_count(connection) == 5
+
+def test_reply_to_a_tweet_in_a_later_file_is_kept(connection, tmp_path):
+    replies = dump(tmp_path / 'replies.json', [tweet(2, 'reply', conversation=1), tweet(3, 'lost', conversation=99)])
+    parents = dump(tmp_path / 'parents.json', [tweet(1, 'parent')])
+    for path in (replies, parents):
+        importer.import_file(connection, path)
+    importer.finish_import(connection)
+    assert connection.execute('SELECT tid, replyto FROM tweets ORDER BY tid').fetchall() == [(1, None), (2, 1), (3, None)]
+    assert connection.execute('PRAGMA foreign_key_check').fetchall() == []
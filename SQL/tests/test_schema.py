@@ -0,0 +1,56 @@
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+
+import schema
+import timeline
+
+def test_migrate_reaches_latest_version(connection):
+    assert schema.schema_version(connection) == schema.SCHEMA_VERSION
+    # Migrating again applies nothing
+    assert schema.migrate(connection) == []
+
+def test_hot_queries_use_indexes(connection):
+    timeline.ensure_timeline(connection)
+    queries = dict(schema.HOT_QUERIES, **schema.TIMELINE_QUERIES)
+    assert schema.check_query_plans(connection, queries) == {}
+
+def test_full_scan_is_reported(connection):
+    # No index covers the tweet text, so the check must flag this one
+    failures = schema.check_query_plans(connection, {'by_text': ('SELECT * FROM tweets WHERE text = ?', ('x',))})
+    assert list(failures) == ['by_text']
+    assert failures['by_text'][0].startswith('SCAN tweets')
+
+def test_killed_bulk_load_is_finished_by_migrate(tmp_path):
+    path = str(tmp_path / 'killed.db')
+    # Drop everything for a bulk load, write a tweet and die before anything is built again
+    subprocess.run([sys.executable, '-c', """
+import os, sqlite3, sys
+sys.path.insert(0, sys.argv[2])
+import schema
+connection = sqlite3.connect(sys.argv[1])
+schema.migrate(connection)
+load = schema.bulk_load(connection)
+load.__enter__()
+connection.execute("INSERT INTO users(usr) VALUES (1)")
+connection.execute("INSERT INTO tweets(tid, writer, tdate, text) VALUES (1, 1, '2023-01-01', 'after the kill')")
+connection.commit()
+os._exit(0)
+""", path, os.path.dirname(schema.__file__)], check=True)
+
+    connection = sqlite3.connect(path)
+    assert connection.execute('SELECT COUNT(*) FROM meta').fetchone()[0] == 3
+    schema.migrate(connection)
+    assert connection.execute('SELECT COUNT(*) FROM meta').fetchone()[0] == 0
+    indexes = {name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+    assert {re.search(r'EXISTS (\w+)', statement).group(1) for statement in schema.INDEXES} <= indexes
+    assert connection.execute("SELECT rowid FROM tweets_fts WHERE tweets_fts MATCH 'kill'").fetchall() == [(1,)]
+    assert connection.execute('SELECT tweets FROM user_stats WHERE usr = 1').fetchone() == (1,)
+    # The triggers are back: a new tweet is indexed and counted as it is written
+    with connection:
+        connection.execute("INSERT INTO tweets(tid, writer, tdate, text) VALUES (2, 1, '2023-01-02', 'live again')")
+    assert connection.execute("SELECT rowid FROM tweets_fts WHERE tweets_fts MATCH 'live'").fetchall() == [(2,)]
+    assert connection.execute('SELECT tweets FROM user_stats WHERE usr = 1').fetchone() == (2,)
+    connection.close()
@@ -0,0 +1,95 @@
+import atexit
+import sqlite3
+
+import pytest
+
+from writebuffer import WriteBuffer
+
+@pytest.fixture
+def buffer(connection):
+    """
+    A buffer that flushes on every call to flush_if_due, with one user to write as.
+    """
+    with connection:
+        connection.execute('INSERT INTO users(usr) VALUES (1)')
+    buffer = WriteBuffer(connection, max_tweets=100, max_delay=0)
+    buffer.flushes = []
+    buffer.after_flush.append(buffer.flushes.append)
+    yield buffer
+    # The connection is closed before the program exits
+    atexit.unregister(buffer.flush)
+
+def queue(buffer, tid, terms=()):
+    buffer.tweets.append((tid, 1, '2023-01-01', 'tweet {}'.format(tid), None))
+    for term in terms:
+        buffer.hashtags.add(term)
+        buffer.mentions.append((tid, term))
+    buffer.oldest = 0.0
+
+def stored(connection):
+    return [tid for (tid,) in connection.execute('SELECT tid FROM tweets ORDER BY tid')]
+
+def test_flush_writes_one_batch(connection, buffer):
+    queue(buffer, 1, ['a'])
+    buffer.add(2, 1, '2023-01-01', 'two', None, ['a', 'b'])
+    assert stored(connection) == [1, 2]
+    assert connection.execute('SELECT tid, term FROM mentions ORDER BY tid, term').fetchall() == [(1, 'a'), (2, 'a'), (2, 'b')]
+    assert [[tweet[0] for tweet in tweets] for tweets in buffer.flushes] == [[1, 2]]
+    assert buffer.tweets == [] and buffer.flushed == 2
+
+def test_tweet_breaking_a_constraint_is_dropped_alone(connection, buffer):
+    queue(buffer, 1)
+    buffer.flush()
+    for tid in (2, 1, 3):
+        queue(buffer, tid, ['t{}'.format(tid)])
+    buffer.flush()
+    assert stored(connection) == [1, 2, 3]
+    assert [tweet[0] for tweet, _ in buffer.rejected] == [1]
+    assert [tweet[0] for tweet in buffer.flushes[-1]] == [2, 3]
+    assert connection.execute('SELECT term FROM mentions ORDER BY term').fetchall() == [('t2',), ('t3',)]
+    assert buffer.tweets == []
+
+def test_locked_database_keeps_the_tweets_for_the_next_flush(connection, buffer, monkeypatch, capsys):
+    write = buffer.write
+
+    def locked(tweets, hashtags, mentions):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(buffer, 'write', locked)
+    queue(buffer, 1, ['a'])
+    queue(buffer, 2)
+    buffer.flush_if_due()
+    assert 'will retry' in capsys.readouterr().err
+    assert stored(connection) == [] and buffer.flushes == []
+    assert [tweet[0] for tweet in buffer.tweets] == [1, 2] and buffer.mentions == [(1, 'a')]
+
+    monkeypatch.setattr(buffer, 'write', write)
+    buffer.flush_if_due()
+    assert stored(connection) == [1, 2]
+    assert [[tweet[0] for tweet in tweets] for tweets in buffer.flushes] == [[1, 2]]
+    assert buffer.tweets == [] and buffer.rejected == []
+
+def test_lock_while_writing_one_at_a_time_keeps_the_rest(connection, buffer, monkeypatch):
+    queue(buffer, 2)
+    buffer.flush()
+    write = buffer.write
+
+    # The batch fails on the duplicate, then the database locks before tweet 4 is written
+    def locks_at_four(tweets, hashtags, mentions):
+        if len(tweets) == 1 and tweets[0][0] == 4:
+            raise sqlite3.OperationalError('database is locked')
+        write(tweets, hashtags, mentions)
+    monkeypatch.setattr(buffer, 'write', locks_at_four)
+    for tid in (3, 2, 4, 5):
+        queue(buffer, tid, ['t{}'.format(tid)])
+    with pytest.raises(sqlite3.OperationalError):
+        buffer.flush()
+    assert stored(connection) == [2, 3]
+    assert [tweet[0] for tweet in buffer.flushes[-1]] == [3]
+    assert [tweet[0] for tweet, _ in buffer.rejected] == [2]
+    assert [tweet[0] for tweet in buffer.tweets] == [4, 5]
+    assert buffer.mentions == [(4, 't4'), (5, 't5')] and buffer.hashtags == {'t4', 't5'}
+
+    monkeypatch.setattr(buffer, 'write', write)
+    buffer.flush()
+    assert stored(connection) == [2, 3, 4, 5]
+    assert buffer.flushed == 4
@@ -0,0 +1,148 @@
+# One row per tweet in each follower's home feed, kept in feed order by the primary key
+TIMELINE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS timeline (
+    flwer int,
+    tdate date,
+    tid int,
+    primary key (flwer, tdate, tid)
+) WITHOUT ROWID;
+"""
+
+# The feed of every user as tweet_page used to compute it: tweets written by
+# the users they follow, plus tweets those users retweeted
+BACKFILL = """
+INSERT OR IGNORE INTO timeline(flwer, tdate, tid)
+SELECT follows.flwer, tweets.tdate, tweets.tid
+FROM tweets
+JOIN follows ON follows.flwee = tweets.writer
+UNION
+SELECT follows.flwer, tweets.tdate, tweets.tid
+FROM tweets
+JOIN retweets ON retweets.tid = tweets.tid
+JOIN follows ON follows.flwee = retweets.usr
+"""
+
+def exists(connection):
+    """
+    Function to check whether the timeline table has been created.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns:
+    found (bool): True if the table exists.
+    """
+    row = connection.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='timeline'").fetchone()
+    return row is not None
+
+def ensure_timeline(connection):
+    """
+    Function to create the timeline table and fill it from the existing tweets, follows and retweets.
+    It only does the backfill the first time, when the table does not exist yet.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+
+    Returns: None
+    """
+    if exists(connection):
+        return
+    with connection:
+        connection.executescript(TIMELINE_SCHEMA)
+        connection.execute(BACKFILL)
+
+def fan_out_tweets(connection, tweets):
+    """
+    Function to add new tweets to the feed of every follower of their writers.
+    It is called inside the transaction that inserts the tweets.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    tweets (list): (tid, writer, tdate, text, replyto) tuples of the new tweets.
+
+    Returns: None
+    """
+    connection.executemany(
+        'INSERT OR IGNORE INTO timeline(flwer, tdate, tid) SELECT flwer, ?, ? FROM follows WHERE flwee = ?',
+        [(tdate, tid, writer) for tid, writer, tdate, _, _ in tweets])
+
+def fan_out_retweet(connection, usr, tid):
+    """
+    Function to add a retweeted tweet to the feed of every follower of the user who retweeted it.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    usr (int): The user ID of the user who retweeted.
+    tid (int): The tweet ID of the retweeted tweet.
+
+    Returns: None
+    """
+    connection.execute("""
+        INSERT OR IGNORE INTO timeline(flwer, tdate, tid)
+        SELECT follows.flwer, tweets.tdate, tweets.tid
+        FROM follows, tweets
+        WHERE follows.flwee = ? AND tweets.tid = ?""", (usr, tid))
+
+def fan_out_follow(connection, flwer, flwee):
+    """
+    Function to add the tweets and retweets of a newly followed user to the follower's feed.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    flwer (int): The user ID of the follower.
+    flwee (int): The user ID of the user being followed.
+
+    Returns: None
+    """
+    connection.execute("""
+        INSERT OR IGNORE INTO timeline(flwer, tdate, tid)
+        SELECT ?, tdate, tid FROM tweets WHERE writer = ?
+        UNION
+        SELECT ?, tweets.tdate, tweets.tid
+        FROM retweets JOIN tweets ON tweets.tid = retweets.tid
+        WHERE retweets.usr = ?""", (flwer, flwee, flwer, flwee))
+
+def feed_page(cursor, usr, bound=None, limit=5):
+    """
+    Function to read one page of a user's feed from the timeline table.
+    Pages are found by key instead of OFFSET: bound is the (tdate, tid) of the
+    last tweet on the previous page, so every page costs the same to read.
+
+    Arguments:
+    cursor (sqlite3.Cursor): The cursor to run the query on; the rows are left on it.
+    usr (int): The user ID of the logged-in user.
+    bound (tuple): (tdate, tid) of the last tweet on the previous page, or None for the first page.
+    limit (int): Number of tweets per page.
+
+    Returns: None
+    """
+    cursor.execute(*feed_query(usr, bound, limit))
+
+def feed_query(usr, bound=None, limit=5):
+    """
+    Function to build the query feed_page runs, also checked by schema.check_query_plans.
+
+    Arguments:
+    usr (int): The user ID of the logged-in user.
+    bound (tuple): (tdate, tid) of the last tweet on the previous page, or None for the first page.
+    limit (int): Number of tweets per page.
+
+    Returns:
+    query (tuple): (sql, params).
+    """
+    if bound is None:
+        return ("""
+            SELECT tweets.*
+            FROM timeline
+            JOIN tweets ON tweets.tid = timeline.tid
+            WHERE timeline.flwer = ?
+            ORDER BY timeline.tdate DESC, timeline.tid DESC
+            LIMIT ?""", (usr, limit))
+    return ("""
+        SELECT tweets.*
+        FROM timeline
+        JOIN tweets ON tweets.tid = timeline.tid
+        WHERE timeline.flwer = ?
+        AND (timeline.tdate, timeline.tid) < (?, ?)
+        ORDER BY timeline.tdate DESC, timeline.tid DESC
+        LIMIT ?""", (usr, bound[0], bound[1], limit))
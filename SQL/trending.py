@@ -0,0 +1,78 @@
+import json
+import os
+import sqlite3
+import sys
+
+# The trending engine is shared with the MongoDB side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.trending import Trending
+
+# One row per time bucket of the trending window: its Count-Min sketch and its top hashtags as JSON
+TRENDING_SCHEMA = '''CREATE TABLE IF NOT EXISTS trending_buckets (
+    start int,
+    sketch blob,
+    top text,
+    primary key (start)
+)'''
+
+def load_trending(connection, engine=None):
+    """
+    Function to read the saved trending buckets.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    engine (Trending): The engine to load into, or None for a new one with the default settings.
+
+    Returns:
+    engine (Trending): The loaded engine.
+    """
+    if engine is None:
+        engine = Trending()
+    rows = connection.execute('SELECT start, sketch, top FROM trending_buckets').fetchall()
+    engine.load((start, {'sketch': sketch, 'top': json.loads(top)}) for start, sketch, top in rows)
+    return engine
+
+def save_trending(connection, engine):
+    """
+    Function to add the counts made since the last save to the saved buckets and drop the ones that left the window.
+    It runs inside the caller's transaction, which must already hold the write lock
+    (have written something) so no other writer changes a bucket between reading and writing it.
+
+    Arguments:
+    connection (sqlite3.Connection): The database connection.
+    engine (Trending): The engine.
+
+    Returns: None
+    """
+    def read_bucket(start):
+        row = connection.execute('SELECT sketch, top FROM trending_buckets WHERE start = ?', (start,)).fetchone()
+        return None if row is None else {'sketch': row[0], 'top': json.loads(row[1])}
+
+    def write_bucket(start, record, previous):
+        connection.execute('INSERT OR REPLACE INTO trending_buckets(start, sketch, top) VALUES (?,?,?)',
+                           (start, record['sketch'], json.dumps(record['top'])))
+        return True
+
+    if engine.save(read_bucket, write_bucket):
+        connection.execute('DELETE FROM trending_buckets WHERE start < ?', (engine.window_start(),))
+
+def main():
+    """
+    Function to print the trending hashtags of a database from the command line.
+    Usage: python3 trending.py <database> [n]
+
+    Arguments: None
+
+    Returns: None
+    """
+    if len(sys.argv) < 2:
+        print('Usage: python3 trending.py <database> [n]')
+        sys.exit(2)
+    connection = sqlite3.connect(sys.argv[1])
+    engine = load_trending(connection)
+    for rank, (tag, count) in enumerate(engine.top(int(sys.argv[2]) if len(sys.argv) > 2 else 10), start=1):
+        print('{:>3} #{:<30} {:>8}'.format(rank, tag, count))
+    connection.close()
+
+if __name__ == "__main__":
+    main()
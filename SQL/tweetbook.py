@@ -1,12 +1,32 @@
-import sqlite3
-import time
-import re
 import os
+import sys
 import getpass
 
-# Global variables for database connection and cursor
-connection = None
-cursor = None
+import service
+import storage
+
+# The query stats are shared with the MongoDB side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.querystats import from_environment
+
+# Global pool of database connections; the page functions run queries through the service module
+pool = None
+
+# Where the home feed is read from: 'timeline' for the fan-out table,
+# 'query' to compute it from tweets, follows and retweets on every page
+FEED_MODE = os.environ.get('TWEETBOOK_FEED', 'timeline')
+
+# Connection settings from storage.PROFILES: 'durable' fsyncs every commit,
+# 'fast' trades the last few commits on power loss for much cheaper writes
+PROFILE = os.environ.get('TWEETBOOK_PROFILE', storage.DEFAULT_PROFILE)
+
+# Memory cap in MB (0 turns the cache off) and TTL in seconds of the query result cache
+CACHE_MB = float(os.environ.get('TWEETBOOK_CACHE_MB', 32))
+CACHE_TTL = float(os.environ.get('TWEETBOOK_CACHE_TTL', 30))
+
+# Latency histograms, row counts, plans and slow statements of every query, written on exit
+# to the file TWEETBOOK_QUERY_STATS names; None, measuring nothing, when it is not set
+QUERY_STATS = from_environment()
 
 def connect(path):
     """
@@ -18,24 +38,29 @@ def connect(path):
 
     Returns: None
     """
-    global connection, cursor
+    global pool
 
-    connection = sqlite3.connect(path)
-    cursor = connection.cursor()
-    cursor.execute(' PRAGMA foreign_keys=ON; ')
-    connection.commit()
+    # One user per process needs no read connections besides the writer.
+    # The pool opens in WAL mode with the PRAGMAs of the chosen profile,
+    # creates any missing tables and indexes, and sets up the timeline.
+    pool = service.ConnectionPool(path, readers=0, profile=PROFILE, feed_mode=FEED_MODE, cache_mb=CACHE_MB, cache_ttl=CACHE_TTL,
+                                  query_stats=QUERY_STATS)
     return
 
 def clear():
     """
     Function to clear the console.
-    It uses the 'cls' command for Windows and 'clear' for other operating systems.
+    It writes the ANSI escape codes that clear the screen and move the cursor home,
+    rather than starting a shell to run 'clear' on every redraw. Nothing is written
+    when the output is not a terminal, so piped output stays clean.
 
     Arguments: None
 
     Returns: None
     """
-    os.system('cls' if os.name=='nt' else 'clear')
+    if sys.stdout.isatty():
+        sys.stdout.write('\033[H\033[2J\033[3J')
+        sys.stdout.flush()
 
 def landing_page():
     """
@@ -69,7 +94,7 @@ def landing_page():
             output = login_page()
             
         # After logging in, show tweets page    
-        output = tweet_page(output[0])
+        output = tweet_page(output)
     elif landing_input == "s":
         return signup_page()
     elif landing_input == "x":
@@ -87,16 +112,11 @@ def login_page():
     Arguments: None
 
     Returns:
-    output (tuple): A tuple containing the user ID and password if they are found in the database, None otherwise.
+    output (Session): The session of the user if the user ID and password are found in the database, None otherwise.
     """
-
-    global connection,cursor
     usr = input('Enter your user ID:')
     pwd = getpass.getpass('Enter your password: ')
-    cursor.execute('SELECT usr,pwd FROM users WHERE usr=? AND pwd=?',(usr,pwd))
-    output = cursor.fetchone()
-    connection.commit()
-    return output
+    return service.login(pool, usr, pwd)
 
 def signup_page():
     """
@@ -108,73 +128,44 @@ def signup_page():
     Returns:
     landing_page (function): Calls the landing_page function after successfully signing up a new user.
     """
-
-    global connection,cursor
     print('Firstly, we would like some personal information.')
     name = input('Please enter your name:')
     email = input('Please enter your email:')
     city = input('Please enter your city:')
     timezone = input('Please enter your timezone:')
     pwd = input('Please enter your password:')
-    cursor.execute('SELECT MAX(usr) FROM users')
-    usr = cursor.fetchone()[0] + 1
-    cursor.execute('INSERT INTO users(usr,pwd,name,email,city,timezone) VALUES (?,?,?,?,?,?)',(usr,pwd,name,email,city,timezone))
-    connection.commit()
+    service.signup(pool, pwd, name, email, city, timezone)
     return landing_page()
 
-def tweet_page(usr):
+def tweet_page(session):
     """
     Main page function after user login.
     It provides multiple functionalities for the user to interact with tweets.
 
     Arguments:
-    usr (str): The user ID of the logged-in user.
+    session (Session): The session of the logged-in user.
 
     Returns:
-    data (list): A list of dictionaries containing the tweets displayed on the page.
+    data (list): The tweets as Tweet records.
     """
-    global connection,cursor
-
     # Initialize page number and user input
     page_num = 1
     tweet_input = ''
 
     while (tweet_input != 'x'):
+        # Write out composed tweets that have waited long enough
+        pool.flush_if_due()
+
         clear()
         print('      TWEETBOOK.PY')
         print('************************')
 
-        # Calculate the offset for pagination
-        offset = (page_num-1)*5
-
-        # Execute the SQL query to fetch tweets from followed users and retweets
-        cursor.execute("""
-            SELECT tweets.*
-            FROM tweets
-            JOIN follows ON follows.flwee = tweets.writer
-            WHERE follows.flwer = ?
-            UNION
-            SELECT tweets.*
-            FROM tweets
-            JOIN retweets ON retweets.tid = tweets.tid
-            JOIN follows ON follows.flwee = retweets.usr
-            WHERE follows.flwer = ?
-            ORDER BY tweets.tdate DESC
-            LIMIT 5 OFFSET ?""", (usr,usr,offset))
-        connection.commit()
-
-        # Fetch the results and convert them into a list of dictionaries
-        desc = cursor.description
-        column_names = [col[0] for col in desc]
-        data = [dict(zip(column_names, row))  
-            for row in cursor.fetchall()]
-
-        # Print the results
-        for i, row in enumerate(data, start=1):
-            row['num'] = i
-
-        for row in data:
-            print(row['num'], ": ", row['text'])
+        # Fetch the tweets from followed users and retweets as a list of Tweet records
+        data = service.feed_page(pool, session, page_num)
+
+        # Print the results, numbered from 1
+        for num, row in enumerate(data, start=1):
+            print(num, ": ", row.text)
         
         print("P: Previous <--  --> N: Next")
         print('************************')
@@ -183,57 +174,54 @@ def tweet_page(usr):
         print("To pay respects to your followers, press F")
         print("To search for users, press U")
         print("To search for Tweets, press T")
+        print("To see trending hashtags, press H")
         print("To log out, press X")
         tweet_input = input('Input:').lower()
 
         # Perform an action based on the user's input
         if (tweet_input == 'n'):
-            page_num += 1
+            # The timeline feed stops at its last page
+            if service.has_next_feed_page(pool, session, page_num):
+                page_num += 1
         elif (tweet_input == 'p'):
+            if pool.feed_mode == 'timeline' and page_num == 1:
+                continue
             page_num -= 1
         elif (tweet_input == 'c'):
-            compose_tweet(usr,None)
+            compose_tweet(session,None)
         elif (tweet_input == 'f'):
-            followers_page(usr)
+            followers_page(session)
         elif (tweet_input == 'u'):
-            search_users(usr)
+            search_users(session)
         elif (tweet_input == 't'):
-            search_tweets(usr)
+            search_tweets(session)
+        elif (tweet_input == 'h'):
+            trending_page(session)
         elif (tweet_input.isdigit() and int(tweet_input)<=len(data)):
-            tweet_action(data[int(tweet_input)-1].get('tid'),usr)
+            tweet_action(data[int(tweet_input)-1].tid,session)
     return data
 
-def tweet_action(tid,usr):
+def tweet_action(tid,session):
     """
     Function to perform actions on a tweet.
     It provides options for the user to go back, reply to or retweet a tweet.
 
     Arguments:
     tid (str): The tweet ID of the selected tweet.
-    usr (str): The user ID of the logged-in user.
+    session (Session): The session of the logged-in user.
 
     Returns: None
     """
-    global connection, cursor
-
     # Clear the console
     clear()
 
-    # Execute the SQL query to get the number of retweets
-    cursor.execute('SELECT COUNT(*) FROM retweets r1 WHERE r1.tid = ?',(tid,))
-    rt_stats = cursor.fetchone()[0]
-
-    # Execute the SQL query to get the number of replies
-    cursor.execute('SELECT COUNT(*) FROM tweets t1 WHERE t1.replyto = ?',(tid,))
-    rp_stats = cursor.fetchone()[0]
+    # Get the number of retweets and replies
+    rt_stats, rp_stats = service.tweet_stats(pool, tid)
     
     while (True):
         # Print the tweet stats
         print('This tweet has',rt_stats,'retweets and',rp_stats,'replies')
 
-        # Commit any changes to the database
-        connection.commit()
-
         print("Hit X to go back, R to reply and RT to retweet")
         stat_input = input('Input:').lower()
 
@@ -241,33 +229,27 @@ def tweet_action(tid,usr):
         if (stat_input == 'x'):
             break
         elif (stat_input == 'r'):
-            compose_tweet(usr,tid)
+            compose_tweet(session,tid)
             clear()
         elif (stat_input == 'rt'):
             clear()
             input('Retweeted tweet! Press any key to continue')
             clear()
 
-            # Get the current date
-            rdate = time.strftime("%Y-%m-%d")
-
-            # Execute the SQL query to insert a new retweet
-            cursor.execute('REPLACE INTO retweets(usr,tid,rdate) VALUES (?,?,?)',(usr,tid,rdate))
-
-            # Commit any changes to the database
-            connection.commit()
+            # Insert the retweet and add the tweet to the feeds of the user's followers
+            service.retweet(pool, session, tid)
         else:
             clear()
             input("Please Enter from the given options, press any key to continue")
             clear()
     return
 
-def compose_tweet(usr,replyto):
+def compose_tweet(session,replyto):
     """
     Function to compose a tweet or reply to a tweet.
 
     Arguments:
-    usr (str): The user ID of the logged-in user.
+    session (Session): The session of the logged-in user.
     replyto (str): The tweet ID of the tweet to reply to. If None, a new tweet is composed.
 
     Returns: None
@@ -281,45 +263,23 @@ def compose_tweet(usr,replyto):
     else:
         text = input("Write out your reply:")
 
-    # Find all hashtags in the text
-    hashtags = re.findall("[#]\w+", text)
-
-    # Get a new tweet ID
-    cursor.execute('SELECT MAX(tid) FROM tweets')
-    tid = cursor.fetchone()[0] + 1
-
-    # Get the current date
-    tdate = time.strftime("%Y-%m-%d")
-
-    # Insert the new tweet or reply into the database
-    cursor.execute("INSERT INTO tweets(tid,writer,tdate,text,replyto) VALUES (?,?,?,?,?)",(tid,usr,tdate,text,replyto))
-    
-    # Handle the hashtags
-    for i in hashtags:
-        term = i[1:]
-        print(term)
-
-        # Insert the hashtag into the database
-        cursor.execute('REPLACE INTO hashtags(term) VALUES (?)',(term,))
-
-        # Insert the mention into the database
-        cursor.execute('INSERT INTO mentions(tid,term) VALUES(?,?)',(tid,term,))       
-
-    # Commit any changes to the database
-    connection.commit()
+    # Queue the new tweet or reply and its hashtags, they are written in bulk by the buffer
+    try:
+        service.compose(pool, session, text, replyto)
+    except LookupError as e:
+        input('Cannot reply: {}. Press any key to continue'.format(e))
     return
 
-def followers_page(usr):
+def followers_page(session):
     """
     Function to display the followers page.
     It provides options for the user to perform actions on a follower or exit the page.
 
     Arguments:
-    usr (str): The user ID of the logged-in user.
+    session (Session): The session of the logged-in user.
 
     Returns: None
     """
-    global connection,cursor
     flwer_input = ''
 
     while (flwer_input != 'x'):
@@ -330,28 +290,11 @@ def followers_page(usr):
         print('************************')
 
         # Get the followers of the user
-        cursor.execute("""
-            SELECT u1.*
-            FROM follows f1, users u1
-            WHERE f1.flwee = ?
-            AND f1.flwer = u1.usr""", (usr,))
-
-        # Commit any changes to the database
-        connection.commit()
-        
-        # Get the column names and the data
-        desc = cursor.description
-        column_names = [col[0] for col in desc]
-        data = [dict(zip(column_names, row))  
-            for row in cursor.fetchall()]
+        data = service.followers(pool, session.usr)
 
-        # Add a number to each row
-        for i, row in enumerate(data, start=1):
-            row['num'] = i
-
-        # Print the followers
-        for row in data:
-            print(row['num'], ": ", row['name'] ,"- ", row['usr'])
+        # Print the followers, numbered from 1
+        for num, row in enumerate(data, start=1):
+            print(num, ": ", row.name ,"- ", row.usr)
 
         print('************************')
         print("To perform an action on a follower, enter a number corresponding to that follower")
@@ -362,38 +305,27 @@ def followers_page(usr):
 
         # Perform an action based on the user's input
         if (flwer_input.isdigit() and int(flwer_input)<=len(data)):
-            flwer_action(data[int(flwer_input)-1].get('usr'),usr)
+            flwer_action(data[int(flwer_input)-1].usr,session)
     return
 
-def flwer_action(flwer,usr):
+def flwer_action(flwer,session):
     """
     Function to perform actions on a follower.
     It provides options for the user to go back, follow the follower, or navigate through the follower's tweets.
 
     Arguments:
     flwer (str): The user ID of the selected follower.
-    usr (str): The user ID of the logged-in user.
+    session (Session): The session of the logged-in user.
 
     Returns: None
     """
-    global connection, cursor
     page_num = 1
 
-    # Get the number of tweets from the follower
-    cursor.execute('SELECT COUNT(*) FROM tweets WHERE writer = ?',(flwer,))
-    tweet_count = cursor.fetchone()[0]
-
-    # Get the number of users the follower is following
-    cursor.execute('SELECT COUNT(*) FROM follows WHERE flwer = ?',(flwer,))
-    following_count = cursor.fetchone()[0]
-
-    # Get the number of followers of the follower
-    cursor.execute('SELECT COUNT(*) FROM follows WHERE flwee = ?',(flwer,))
-    follower_count = cursor.fetchone()[0]
-
-    # Get the name of the follower
-    cursor.execute('SELECT name FROM users WHERE usr = ?',(flwer,))
-    follower_name = cursor.fetchone()[0]
+    # Get the name and the tweet, following and follower counts of the follower
+    profile = service.user_profile(pool, flwer)
+    if profile is None:
+        input('There is no user {}. Press any key to continue'.format(flwer))
+        return
 
     fa_input = ''
 
@@ -403,32 +335,14 @@ def flwer_action(flwer,usr):
 
         print('      TWEETBOOK.PY')
         print('************************')
-        print("User ID: ", flwer,' Username: ', follower_name, ' Tweets: ', tweet_count, ' Following: ', following_count, ' Followers: ', follower_count)
-
-        offset = (page_num - 1)*3
-        cursor.execute("""
-            SELECT text
-            FROM tweets
-            WHERE writer = ?
-            ORDER BY tdate DESC
-            LIMIT 3 OFFSET ?""", (flwer,offset))
-
-        # Commit any changes to the database
-        connection.commit()
-        
-        # Get the column names and the data
-        desc = cursor.description
-        column_names = [col[0] for col in desc]
-        data = [dict(zip(column_names, row))  
-            for row in cursor.fetchall()]
+        print("User ID: ", flwer,' Username: ', profile['name'], ' Tweets: ', profile['tweets'], ' Following: ', profile['following'], ' Followers: ', profile['followers'])
 
-        # Add a number to each row
-        for i, row in enumerate(data, start=1):
-            row['num'] = i
+        # Get the page of the follower's tweets
+        data = service.user_tweets(pool, flwer, page_num)
 
-        # Print the tweets
-        for row in data:
-            print(row['num'], ": ", row['text'])
+        # Print the tweets, numbered from 1
+        for num, row in enumerate(data, start=1):
+            print(num, ": ", row.text)
 
         print("P: Previous <--  --> N: Next")
         print('************************')
@@ -439,67 +353,76 @@ def flwer_action(flwer,usr):
 
         # Perform an action based on the user's input
         if (fa_input == 'f'):
-            start_date = time.strftime("%Y-%m-%d")
-            cursor.execute('REPLACE INTO follows(flwer,flwee,start_date) VALUES (?,?,?)',(usr,flwer,start_date))
-
-            # Commit any changes to the database
-            connection.commit()
+            # Insert the follow and add the followed user's tweets and retweets to the user's feed
+            service.follow(pool, session, flwer)
 
             input("You are now following this user, please hit any key to continue")
         elif (fa_input == 'n'):
             page_num += 1
         elif (fa_input == 'p'):
             page_num -= 1
+    return
+
+def trending_page(session):
+    """
+    Function to display the hashtags used most over the last day.
+    It provides options for the user to go back or search the tweets with one of the hashtags.
 
-    # Commit any changes to the database
-    connection.commit()
+    Arguments:
+    session (Session): The session of the logged-in user.
+
+    Returns: None
+    """
+    trend_input = ''
+
+    while (trend_input != 'x'):
+        # Count composed tweets that have waited long enough
+        pool.flush_if_due()
+
+        clear()
+        print('      TWEETBOOK.PY')
+        print('************************')
+
+        # Read the top hashtags from the in-memory trending counts
+        data = service.trending_hashtags(pool, 10)
+
+        for i, (tag, count) in enumerate(data, start=1):
+            print(i, ": #", tag, " - ", count, " tweets", sep='')
+
+        print('************************')
+        print("To search for the tweets with a hashtag, enter its number")
+        print("To exit, press X")
+        trend_input = input('Input:').lower()
+
+        # Perform an action based on the user's input
+        if (trend_input.isdigit() and 0 < int(trend_input) <= len(data)):
+            search_tweets(session, ['#' + data[int(trend_input)-1][0]])
     return
 
-def search_tweets(usr):
+def search_tweets(session, key_word=None):
     """
     Function to search tweets based on keywords.
     It provides options for the user to go back, select a tweet, or navigate through the search results.
 
     Arguments:
-    usr (str): The user ID of the logged-in user.
+    session (Session): The session of the logged-in user.
+    key_word (list): The keywords to search for, or None to ask the user.
 
     Returns: None
     """
-    global connection, cursor
-
     # Get the keywords from the user
-    key_word = input("Enter a keyword or multiple keywords (separated by a space): ").split()
+    if key_word is None:
+        key_word = input("Enter a keyword or multiple keywords (separated by a space): ").split()
     page_num = 1
 
     while key_word:
-        # Initialize the list of tweets
-        tweetlist = []
-
-        # For each keyword
-        for i in key_word:
-            offset = (page_num-1)*5
-
-            # If the keyword is a hashtag
-            if re.match(r'^#', i):
-                cursor.execute("""
-                    SELECT t1.*
-                    FROM tweets t1, mentions m1
-                    WHERE m1.term LIKE ? 
-                    AND m1.tid = t1.tid
-                    ORDER BY tdate DESC
-                    LIMIT 5 OFFSET ?;
-                """, (i[1:], offset))
-            else:  
-                cursor.execute("""
-                    SELECT * FROM Tweets 
-                    WHERE text LIKE ? ORDER BY tdate DESC LIMIT 10 OFFSET ?;""",
-                    ('%'+i+'%', offset))
-
-            # Fetch the results
-            result = cursor.fetchall()
-
-            # Remove duplicates and add the results to the list of tweets
-            tweetlist = result + list(set(tweetlist)-set(result))
+        # Write out composed tweets that have waited long enough, so they can be found
+        pool.flush_if_due()
+
+        # Run one ranked full-text query for all the keywords
+        tweetlist = service.search_tweets(pool, key_word, page_num)
+        if tweetlist is None:
+            return
 
         # Clear the console
         clear()
@@ -509,8 +432,8 @@ def search_tweets(usr):
 
         # Print the tweets
         digit=1
-        for text in tweetlist:
-            print(digit , ": " , str(text[3]) , "- " , str(text[0]))
+        for row in tweetlist:
+            print(digit , ": " , str(row.text) , "- " , str(row.tid))
             digit+=1;
 
         print("P: Previous <--  --> N: Next")
@@ -523,7 +446,7 @@ def search_tweets(usr):
         # Perform an action based on the user's input
         if (fa_input == 's'):
             tid=input("Enter Tweet Id you want to view: ")
-            tweet_action(tid,usr)
+            tweet_action(tid,session)
         elif (fa_input == 'n'):
             page_num += 1
         elif (fa_input == 'p'):
@@ -535,13 +458,13 @@ def search_tweets(usr):
             return 
     return
 
-def search_users(usr):
+def search_users(session):
     """
     Function to search users based on a keyword.
     It provides options for the user to go back, select a user, or navigate through the search results.
 
     Arguments:
-    usr (str): The user ID of the logged-in user.
+    session (Session): The session of the logged-in user.
 
     Returns: None
     """
@@ -555,36 +478,12 @@ def search_users(usr):
         print('      TWEETBOOK.PY')
         print('************************')
 
-        # Calculate the offset for pagination
-        offset = (page_num-1)*5
-
-        # Execute the SQL query to search users by name or city
-        cursor.execute('''
-            SELECT *
-            FROM users
-            WHERE LOWER(name) LIKE ? OR LOWER(city) LIKE ?
-            ORDER BY
-            CASE
-                WHEN LOWER(name) LIKE ? THEN 0
-                ELSE 1
-            END,
-            LENGTH(name) ASC, 
-            LENGTH(city) ASC
-            LIMIT 5 OFFSET ?''', ('%'+keyword+'%', '%'+keyword+'%', '%'+keyword+'%', offset))
-        connection.commit()
-
-        # Fetch the results and convert them into a list of dictionaries
-        desc = cursor.description
-        column_names = [col[0] for col in desc]
-        data = [dict(zip(column_names, row))  
-            for row in cursor.fetchall()]
-
-        # Print the results
-        for i, row in enumerate(data, start=1):
-            row['num'] = i
-
-        for row in data:
-            print(row['num'], ": ", row['name'], " - ", row['usr'])
+        # Search users by name or city
+        data = service.search_users(pool, keyword, page_num)
+
+        # Print the results, numbered from 1
+        for num, row in enumerate(data, start=1):
+            print(num, ": ", row.name, " - ", row.usr)
         
         print("P: Previous <--  --> N: Next")
         print('************************')
@@ -594,7 +493,7 @@ def search_users(usr):
 
         # Perform an action based on the user's input
         if (search_user_input.isdigit() and int(search_user_input)<=len(data)):
-            flwer_action(data[int(search_user_input)-1].get('usr'),usr)   
+            flwer_action(data[int(search_user_input)-1].usr,session)   
         elif (search_user_input == 'n'):
             page_num += 1
         elif (search_user_input == 'p'):
@@ -611,8 +510,6 @@ def main():
 
     Returns: None
     """
-    global connection, cursor
-
     # Get the database name from the user
     filename = input('Enter your database name (with the .db extension):')
 
@@ -629,9 +526,16 @@ def main():
         if ans == 0:
            i=False
 
-    # Commit any changes and close the connection to the database
-    connection.commit()
-    connection.close()
+    # Write out buffered tweets and close the connections to the database
+    pool.close()
+
+    # Hit and miss counts, for sizing the cache
+    if os.environ.get('TWEETBOOK_CACHE_STATS'):
+        print(pool.cache.summary())
+
+    # Query timings, for finding the slow pages
+    if QUERY_STATS is not None:
+        QUERY_STATS.save()
 
     return
 
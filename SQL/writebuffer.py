@@ -0,0 +1,213 @@
+import atexit
+import sqlite3
+import sys
+import time
+
+from ids import IdAllocator
+
+class WriteBuffer:
+    """
+    Write-behind buffer for composed tweets.
+    Tweets, hashtags and mentions are collected in memory and written with
+    executemany in a single transaction once the buffer holds max_tweets tweets
+    or its oldest tweet is max_delay seconds old. Whatever is left is flushed
+    when the program exits.
+
+    SQLite connections belong to the thread that opened them, so flushing only
+    happens from the calling thread (in add, flush_if_due or flush).
+
+    A tweet that breaks a constraint would fail the whole batch, so a failed
+    batch is written again one tweet at a time; the tweets that still fail are
+    reported, kept in rejected and dropped, and the rest are written. Tweets that
+    could not be written for any other reason, such as a locked database, are
+    kept for the next flush.
+    """
+    def __init__(self, connection, max_tweets=500, max_delay=1.0, id_block=1000):
+        """
+        Arguments:
+        connection (sqlite3.Connection): The connection to write through.
+        max_tweets (int): Number of buffered tweets that triggers a flush.
+        max_delay (float): Age in seconds of the oldest buffered tweet that triggers a flush.
+        id_block (int): Number of tweet IDs reserved at a time.
+        """
+        self.connection = connection
+        self.max_tweets = max_tweets
+        self.max_delay = max_delay
+        self.tweets = []
+        self.hashtags = set()
+        self.mentions = []
+        self.oldest = None
+        self.tids = IdAllocator(connection, 'tid', id_block)
+        self.flushed = 0
+        # (tweet, error) of the tweets that could not be written
+        self.rejected = []
+        # Functions called as f(connection, tweets) inside the flush transaction
+        self.after_write = []
+        # Functions called as f(tweets) once the flush transaction has committed
+        self.after_flush = []
+        atexit.register(self.flush)
+
+    def next_tid(self):
+        """
+        Function to allocate a tweet ID that is not taken in the table, the buffer or by any other writer.
+
+        Arguments: None
+
+        Returns:
+        tid (int): The new tweet ID.
+        """
+        return self.tids.next()
+
+    def add(self, tid, writer, tdate, text, replyto, terms):
+        """
+        Function to queue a tweet and its hashtags.
+
+        Arguments:
+        tid (int): The tweet ID.
+        writer (int): The user ID of the writer.
+        tdate (str): The tweet date.
+        text (str): The tweet text.
+        replyto (int): The tweet ID this replies to, or None.
+        terms (iterable): The hashtag terms used in the tweet, without '#'.
+
+        Returns: None
+        """
+        if self.oldest is None:
+            self.oldest = time.monotonic()
+        self.tweets.append((tid, writer, tdate, text, replyto))
+        for term in set(terms):
+            self.hashtags.add(term)
+            self.mentions.append((tid, term))
+        self.flush_if_due()
+
+    def flush_if_due(self):
+        """
+        Function to flush the buffer if it is full or its oldest tweet is too old.
+
+        Arguments: None
+
+        Returns: None
+        """
+        if not self.tweets:
+            return
+        if len(self.tweets) >= self.max_tweets or time.monotonic() - self.oldest >= self.max_delay:
+            try:
+                self.flush()
+            except sqlite3.OperationalError as e:
+                # The tweets are still buffered and the next call tries again; only flush itself raises
+                print('Composed tweets not written yet, will retry: {}'.format(e), file=sys.stderr)
+
+    def has_tweet(self, tid):
+        """
+        Function to tell whether a tweet is waiting in the buffer.
+
+        Arguments:
+        tid (int): The tweet ID.
+
+        Returns:
+        found (bool): True if the tweet is buffered.
+        """
+        return any(tweet[0] == tid for tweet in self.tweets)
+
+    def write(self, tweets, hashtags, mentions):
+        """
+        Function to write tweets, hashtags and mentions in one transaction, with the after_write hooks.
+
+        Arguments:
+        tweets (list): (tid, writer, tdate, text, replyto) tuples.
+        hashtags (set): The hashtag terms.
+        mentions (list): (tid, term) tuples.
+
+        Returns: None
+        """
+        with self.connection:
+            self.connection.executemany('INSERT INTO tweets(tid,writer,tdate,text,replyto) VALUES (?,?,?,?,?)', tweets)
+            self.connection.executemany('INSERT OR IGNORE INTO hashtags(term) VALUES (?)', [(term,) for term in hashtags])
+            self.connection.executemany('INSERT OR IGNORE INTO mentions(tid,term) VALUES (?,?)', mentions)
+            for hook in self.after_write:
+                hook(self.connection, tweets)
+
+    def flush(self):
+        """
+        Function to write every buffered tweet, hashtag and mention in one transaction.
+        If a tweet breaks a constraint, the tweets are written one at a time and the
+        ones that fail are dropped. Other errors, such as a locked database, leave
+        the tweets not written in the buffer for the next flush and are raised once
+        the hooks have run for the tweets that were written.
+
+        Arguments: None
+
+        Returns: None
+        """
+        if not self.tweets:
+            return
+        tweets, hashtags, mentions, oldest = self.tweets, self.hashtags, self.mentions, self.oldest
+        self.tweets = []
+        self.hashtags = set()
+        self.mentions = []
+        self.oldest = None
+        error = None
+        try:
+            self.write(tweets, hashtags, mentions)
+        except sqlite3.IntegrityError:
+            tweets, error = self.write_each(tweets, mentions, oldest)
+        except sqlite3.Error:
+            # Nothing was written, so try again with the next flush
+            self.requeue(tweets, hashtags, mentions, oldest)
+            raise
+        if tweets:
+            for hook in self.after_flush:
+                hook(tweets)
+        self.flushed += len(tweets)
+        if error is not None:
+            raise error
+
+    def requeue(self, tweets, hashtags, mentions, oldest):
+        """
+        Function to put tweets that could not be written back at the front of the buffer.
+
+        Arguments:
+        tweets (list): (tid, writer, tdate, text, replyto) tuples.
+        hashtags (set): The hashtag terms of the tweets.
+        mentions (list): (tid, term) tuples of the tweets.
+        oldest (float): When the oldest of the tweets was queued, from time.monotonic.
+
+        Returns: None
+        """
+        self.tweets = tweets + self.tweets
+        self.hashtags |= hashtags
+        self.mentions = mentions + self.mentions
+        self.oldest = oldest if self.oldest is None else min(oldest, self.oldest)
+
+    def write_each(self, tweets, mentions, oldest):
+        """
+        Function to write tweets one transaction each, after their batch failed, and drop the ones that
+        break a constraint. Any other error stops the writes and puts the rest back in the buffer.
+
+        Arguments:
+        tweets (list): (tid, writer, tdate, text, replyto) tuples.
+        mentions (list): (tid, term) tuples of the tweets.
+        oldest (float): When the oldest of the tweets was queued, from time.monotonic.
+
+        Returns:
+        written (tuple): (the tweets that were written, the error that stopped the writes or None).
+        """
+        by_tweet = {}
+        for mention in mentions:
+            by_tweet.setdefault(mention[0], []).append(mention)
+        written = []
+        for index, tweet in enumerate(tweets):
+            own = by_tweet.get(tweet[0], [])
+            try:
+                self.write([tweet], {term for _, term in own}, own)
+            except sqlite3.IntegrityError as e:
+                self.rejected.append((tweet, str(e)))
+                print('Tweet {} was not written: {}'.format(tweet[0], e), file=sys.stderr)
+            except sqlite3.Error as e:
+                rest = tweets[index:]
+                rest_mentions = [mention for later in rest for mention in by_tweet.get(later[0], [])]
+                self.requeue(rest, {term for _, term in rest_mentions}, rest_mentions, oldest)
+                return written, e
+            else:
+                written.append(tweet)
+        return written, None
@@ -0,0 +1,214 @@
+import collections
+import sys
+import threading
+import time
+
+def freeze(value):
+    """
+    Turns query parameters into something hashable that is the same for equal queries.
+    Dicts are sorted by key, since the order of the fields in a filter does not change what it matches.
+
+    Args:
+        value: A parameter: a dict, list, tuple or scalar.
+
+    Returns:
+        The hashable form.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+def query_key(query, *params):
+    """
+    Builds a cache key from a query and its parameters.
+    SQL text is compared with its whitespace collapsed, so the same query written
+    in two places shares its entries.
+
+    Args:
+        query (str or dict): The SQL text, a MongoDB filter, or the name of a query built elsewhere.
+        params: The parameters the result depends on.
+
+    Returns:
+        tuple: The key.
+    """
+    if isinstance(query, str):
+        query = ' '.join(query.split())
+    return (freeze(query),) + freeze(params)
+
+def approximate_size(value):
+    """
+    Estimates the memory held by a query result: the object itself plus everything in it.
+
+    Args:
+        value: Rows, documents, records or scalars.
+
+    Returns:
+        int: The size in bytes. Shared objects are counted every time they appear, so it errs high.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(approximate_size(key) + approximate_size(item) for key, item in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(approximate_size(item) for item in value)
+    elif isinstance(getattr(value, 'raw', None), bytes):
+        # A raw BSON document holds its encoded bytes, and is not decoded to be measured
+        size += len(value.raw)
+    elif hasattr(type(value), '__slots__'):
+        # getsizeof only counts the slots themselves, not what they refer to; private slots such as ObjectId's are skipped
+        size += sum(approximate_size(getattr(value, slot)) for slot in type(value).__slots__
+                    if not slot.startswith('__') and hasattr(value, slot))
+    return size
+
+class QueryCache:
+    """
+    Read-through cache of query results, shared by the menu pages.
+    Entries are dropped when they are older than their TTL, when the least
+    recently used ones have to make room under max_bytes, or when a write
+    invalidates one of the tags they were stored with, e.g. ('user', usr).
+
+    A query that was running while one of its tags was invalidated may have
+    read the old data, so its result is returned but not stored.
+    Results are handed out as stored; callers must not change them.
+    All methods are thread-safe.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024, ttl=30.0):
+        """
+        Args:
+            max_bytes (int): Memory cap for the stored results, 0 to store nothing.
+            ttl (float): Default seconds a result is served for.
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (value, size, expiry time, tags), least recently used first
+        self.entries = collections.OrderedDict()
+        # tag -> keys stored with it
+        self.tagged = collections.defaultdict(set)
+        # tag -> number of times it was invalidated
+        self.versions = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, load, tags=(), ttl=None):
+        """
+        Returns the stored result for a key, or runs load and stores its result.
+        The query runs outside the lock, so a slow one does not hold up other threads.
+
+        Args:
+            key (tuple): The key, see query_key.
+            load (function): Runs the query; called without arguments.
+            tags (iterable): Tags that a write can invalidate the result by.
+            ttl (float): Seconds to serve the result for, defaults to the cache's TTL.
+
+        Returns:
+            The result.
+        """
+        tags = tuple(tags)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[2] > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._drop(key)
+                self.expirations += 1
+            self.misses += 1
+            versions = [self.versions.get(tag, 0) for tag in tags]
+
+        value = load()
+        size = approximate_size(value)
+
+        with self.lock:
+            if size > self.max_bytes or versions != [self.versions.get(tag, 0) for tag in tags]:
+                return value
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, size, time.monotonic() + (self.ttl if ttl is None else ttl), tags)
+            for tag in tags:
+                self.tagged[tag].add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._drop(next(iter(self.entries)))
+                self.evictions += 1
+        return value
+
+    def _drop(self, key):
+        """
+        Removes an entry; the caller holds the lock.
+        """
+        _, size, _, tags = self.entries.pop(key)
+        self.size -= size
+        for tag in tags:
+            keys = self.tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tagged[tag]
+
+    def invalidate(self, *tags):
+        """
+        Drops every result stored with any of the tags.
+        It should be called after the write that changed the data has committed.
+
+        Args:
+            tags: The tags, e.g. ('tweet', tid).
+
+        Returns:
+            int: The number of results dropped.
+        """
+        dropped = 0
+        with self.lock:
+            for tag in tags:
+                self.versions[tag] = self.versions.get(tag, 0) + 1
+                for key in self.tagged.pop(tag, ()):
+                    if key in self.entries:
+                        self._drop(key)
+                        dropped += 1
+            self.invalidations += dropped
+        return dropped
+
+    def clear(self):
+        """
+        Drops every stored result; the counters are kept.
+        """
+        with self.lock:
+            self.entries.clear()
+            self.tagged.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns the counters for sizing the cache.
+
+        Returns:
+            dict: entries, bytes, hits, misses, hit_ratio, evictions, expirations and invalidations.
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'bytes': self.size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+    def summary(self):
+        """
+        Returns:
+            str: The counters on one line.
+        """
+        stats = self.stats()
+        return ('cache: {hits} hits, {misses} misses ({hit_ratio:.0%}), {entries} entries in {mb:.1f} MB, '
+                '{evictions} evicted, {expirations} expired, {invalidations} invalidated').format(
+                    mb=stats['bytes'] / (1024 * 1024), **stats)
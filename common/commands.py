@@ -0,0 +1,109 @@
+import inspect
+import json
+import shlex
+import sys
+import time
+from datetime import date, datetime
+
+def parse_command(line):
+    """
+    Splits one line of a command script into the command and its arguments.
+    A line is either a JSON object with the command under "cmd" and the
+    arguments by name, e.g. {"cmd": "search_tweets", "keywords": ["farmers"], "page": 2},
+    or shell-like words, e.g. search_tweets farmers page=2, where key=value
+    words are named arguments and the others fill the parameters in order.
+
+    Args:
+        line (str): The line.
+
+    Returns:
+        tuple: (command, positional arguments, named arguments), or None for blank and # comment lines.
+    """
+    line = line.strip()
+    if not line or line.startswith('#'):
+        return None
+    if line.startswith('{'):
+        named = json.loads(line)
+        if not isinstance(named, dict) or not isinstance(named.get('cmd'), str):
+            raise ValueError('a JSON command needs a "cmd" string')
+        return named.pop('cmd'), [], named
+    words = shlex.split(line)
+    positional = [word for word in words[1:] if '=' not in word]
+    named = dict(word.split('=', 1) for word in words[1:] if '=' in word)
+    return words[0], positional, named
+
+def call(handler, state, positional, named):
+    """
+    Calls a command handler; a list given by name for a *args parameter is passed as its values.
+    """
+    for name, parameter in inspect.signature(handler).parameters.items():
+        if parameter.kind == inspect.Parameter.VAR_POSITIONAL and name in named:
+            values = named.pop(name)
+            positional = list(positional) + (values if isinstance(values, list) else [values])
+    return handler(state, *positional, **named)
+
+def encode(value):
+    """
+    Converts what json cannot write by itself: dates, bytes, listing records and database IDs such as ObjectId.
+    """
+    if hasattr(value, '_asdict'):
+        return value._asdict()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+def describe(commands):
+    """
+    Lists the commands with their parameters and the first line of their docstrings.
+    """
+    listing = {}
+    for name, handler in sorted(commands.items()):
+        parameters = list(inspect.signature(handler).parameters.values())[1:]
+        doc = inspect.getdoc(handler) or ''
+        listing[name] = {'usage': ' '.join([name] + [str(p) for p in parameters]), 'help': doc.split('\n')[0]}
+    return listing
+
+def run_commands(commands, state, lines, out=sys.stdout):
+    """
+    Runs a command script and writes one JSON line per command:
+    {"line": n, "cmd": ..., "ok": true, "result": ..., "ms": ...} or, if it failed,
+    "ok": false with an "error" message. A failed command does not stop the script.
+    The "help" command lists the available commands.
+
+    Args:
+        commands (dict): Command name -> handler, called as handler(state, *args, **kwargs).
+        state: Passed to every handler, e.g. the database connections and the logged-in session.
+        lines (iterable): The script, one command per line.
+        out (file): Where the JSON lines go.
+
+    Returns:
+        int: The number of commands that failed.
+    """
+    failed = 0
+    for number, line in enumerate(lines, start=1):
+        name = None
+        start = time.perf_counter()
+        try:
+            parsed = parse_command(line)
+            if parsed is None:
+                continue
+            name, positional, named = parsed
+            if name == 'help':
+                result = describe(commands)
+            elif name not in commands:
+                raise KeyError('unknown command {!r}, try help'.format(name))
+            else:
+                result = call(commands[name], state, positional, named)
+            record = {'line': number, 'cmd': name, 'ok': True, 'result': result}
+        except Exception as e:
+            failed += 1
+            message = e.args[0] if isinstance(e, KeyError) and e.args else str(e)
+            record = {'line': number, 'cmd': name, 'ok': False, 'error': '{}: {}'.format(type(e).__name__, message)}
+        record['ms'] = round((time.perf_counter() - start) * 1000, 3)
+        out.write(json.dumps(record, default=encode) + '\n')
+        out.flush()
+    return failed
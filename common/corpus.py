@@ -0,0 +1,307 @@
+import copy
+import itertools
+import json
+import math
+import os
+import random
+from datetime import datetime, timezone
+
+# The sample dump used as templates for generated tweets
+SAMPLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mongodb', 'json', '10.json')
+
+WORDS = ['farmers', 'protest', 'india', 'support', 'delhi', 'government', 'law', 'news',
+         'today', 'people', 'rights', 'justice', 'vote', 'rally', 'march', 'world']
+
+# Made-up vocabulary for tweet text; words are drawn with Zipf's law like real text,
+# so a few words are very common and most are rare
+VOCABULARY = WORDS + ['{}{}'.format(a, b) for a in ('ka', 'lo', 'mi', 'ne', 'ru', 'so', 'ti', 'vu')
+                      for b in range(1000)]
+ZIPF_WEIGHTS = list(itertools.accumulate(1 / rank for rank in range(1, len(VOCABULARY) + 1)))
+
+# Parts of the names and cities of generated users
+FIRST_NAMES = ['amrit', 'bea', 'carlos', 'deepa', 'emma', 'farid', 'grace', 'harpreet', 'ivan', 'jia',
+               'kiran', 'liam', 'maya', 'noah', 'olu', 'priya', 'quinn', 'ravi', 'sara', 'tom']
+LAST_NAMES = ['singh', 'smith', 'chen', 'garcia', 'kaur', 'nguyen', 'patel', 'brown', 'khan', 'wilson']
+CITIES = ['Edmonton', 'Calgary', 'Toronto', 'Vancouver', 'Delhi', 'Mumbai', 'Amritsar', 'London', 'Lagos', 'Sydney']
+
+# Named sizes of the benchmark suite, in tweets; users, follows and retweets scale with them
+SCALES = {
+    '10k': 10000,
+    '100k': 100000,
+    '1m': 1000000,
+    '10m': 10000000,
+    '100m': 100000000,
+}
+
+# Time of the first generated tweet, 2021-03-01T00:00:00Z like the dumps
+EPOCH = 1614556800
+
+def random_word(rng):
+    """
+    Picks a word from the vocabulary, favouring the first ones.
+    """
+    return rng.choices(VOCABULARY, cum_weights=ZIPF_WEIGHTS)[0]
+
+def random_text(rng):
+    """
+    Makes up a tweet text with one or two hashtags.
+    """
+    words = [random_word(rng) for _ in range(rng.randint(4, 12))]
+    tags = ['#' + rng.choice(WORDS) for _ in range(rng.randint(1, 2))]
+    return ' '.join(words + tags)
+
+def zipf_rank(rng, n, s=1.0):
+    """
+    Picks a rank from 0 to n - 1 with probability falling off as (rank + 1) ** -s.
+    Unlike a Pareto draw folded with modulo, the most popular rank gets only
+    about 1 / ln(n) of the picks with s = 1, so there is no single user everyone
+    follows; a smaller s spreads the picks out further.
+
+    Args:
+        rng (Random): The random source.
+        n (int): Number of ranks.
+        s (float): The exponent, from 0 (uniform) to 1.
+
+    Returns:
+        int: The rank.
+    """
+    if s == 1.0:
+        return int((n + 1) ** rng.random()) - 1
+    e = 1 - s
+    return min(n - 1, int((1 + rng.random() * ((n + 1) ** e - 1)) ** (1 / e)) - 1)
+
+def active_user(rng, users):
+    """
+    Picks the writer of a tweet or retweet. How much users write also follows a
+    power law, but a flatter one, and the most active users are spread over the
+    IDs instead of being the most followed ones, which keeps the feeds the
+    follow graph implies at a realistic size.
+
+    Args:
+        rng (Random): The random source.
+        users (int): Number of users, with IDs 1 to users.
+
+    Returns:
+        int: The user ID.
+    """
+    # The most active user lands in the middle of the IDs, far from the most followed ones
+    return (zipf_rank(rng, users, 0.8) * 2654435761 + users // 2) % users + 1
+
+def hashtag_name(rank):
+    """
+    Returns the hashtag (without '#') of a popularity rank: the sample words first, then made-up ones.
+    """
+    return WORDS[rank] if rank < len(WORDS) else 'tag{}'.format(rank)
+
+def user_record(usr):
+    """
+    Describes a generated user. Everything is derived from the ID, so nothing has to be kept per user.
+
+    Args:
+        usr (int): The user ID, from 1.
+
+    Returns:
+        dict: id, username, displayname and location.
+    """
+    mixed = usr * 2654435761 % 4294967296
+    return {
+        'id': usr,
+        'username': 'user{}'.format(usr),
+        'displayname': '{} {}'.format(FIRST_NAMES[mixed % len(FIRST_NAMES)].title(),
+                                      LAST_NAMES[mixed // len(FIRST_NAMES) % len(LAST_NAMES)].title()),
+        'location': CITIES[mixed // 1000 % len(CITIES)],
+    }
+
+def expected_followers(usr, users, follows):
+    """
+    Returns the number of followers follow_graph gives a user on average, for the followersCount of the dumps.
+    """
+    return int(users * follows * math.log((usr + 1) / usr) / math.log(users + 1))
+
+def corpus_size(tweets):
+    """
+    Picks the other sizes of a generated corpus from its number of tweets.
+
+    Args:
+        tweets (int): Number of tweets.
+
+    Returns:
+        dict: users (one per 10 tweets), follows (mean accounts followed per user) and tags (distinct hashtags).
+    """
+    return {'users': max(tweets // 10, 100), 'follows': 20, 'tags': max(tweets // 100, len(WORDS))}
+
+def follow_graph(users, follows=20, seed=291):
+    """
+    Makes up who follows whom, one user at a time so any size fits in memory.
+    The number of accounts a user follows has a heavy-tailed (Pareto) spread around
+    the mean, and who they follow is drawn with zipf_rank, so user 1 is the most
+    followed and a long tail of users have few or no followers.
+
+    Args:
+        users (int): Number of users, with IDs 1 to users.
+        follows (int): Mean number of accounts a user follows.
+        seed (int): Random seed, so the same arguments always give the same graph.
+
+    Returns:
+        generator: (follower, followed) pairs, each at most once and never a user following themselves.
+    """
+    rng = random.Random(seed)
+    for flwer in range(1, users + 1):
+        # A Pareto variate with shape 1.5 has mean 3
+        wanted = min(users - 1, int(rng.paretovariate(1.5) * follows / 3))
+        flwees = set()
+        for _ in range(2 * wanted + 10):
+            if len(flwees) >= wanted:
+                break
+            flwee = zipf_rank(rng, users) + 1
+            if flwee != flwer:
+                flwees.add(flwee)
+        for flwee in sorted(flwees):
+            yield flwer, flwee
+
+def generate_activity(tweets, users, tags=None, days=30, replies=0.15, retweets=0.5, mentions=0.2,
+                      start=EPOCH, seed=291):
+    """
+    Makes up tweets, replies and retweets in time order.
+    Writers and retweeters are drawn with active_user, hashtags and mentioned
+    users with zipf_rank; replies and retweets mostly go to recent tweets.
+
+    Args:
+        tweets (int): Number of tweets, with IDs 1 to tweets.
+        users (int): Number of users, with IDs 1 to users.
+        tags (int): Number of distinct hashtags, defaults to corpus_size.
+        days (int): Number of days the tweets span.
+        replies (float): Share of tweets that reply to an earlier one.
+        retweets (float): Mean retweets made per tweet written.
+        mentions (float): Share of tweets that mention a user.
+        start (int): Time of the first tweet in seconds since the epoch.
+        seed (int): Random seed, so the same arguments always give the same activity.
+
+    Returns:
+        generator: ('tweet', dict) with id, writer, date, text, replyto and the retweet, like and quote
+            counts of the dumps, or ('retweet', (user, tweet id, date)). Dates are ISO 8601 in UTC.
+    """
+    rng = random.Random(seed)
+    tags = tags or corpus_size(tweets)['tags']
+    for tid in range(1, tweets + 1):
+        date = datetime.fromtimestamp(start + (tid - 1) * days * 86400 // tweets, timezone.utc).isoformat()
+        words = [random_word(rng) for _ in range(rng.randint(4, 12))]
+        words += ['#' + hashtag_name(zipf_rank(rng, tags)) for _ in range(rng.randint(0, 2))]
+        if rng.random() < mentions:
+            words.insert(0, '@user{}'.format(zipf_rank(rng, users) + 1))
+        replyto = tid - zipf_rank(rng, tid - 1) - 1 if tid > 1 and rng.random() < replies else None
+        yield 'tweet', {
+            'id': tid,
+            'writer': active_user(rng, users),
+            'date': date,
+            'text': ' '.join(words),
+            'replyto': replyto,
+            'retweetCount': int(rng.paretovariate(1.5)) - 1,
+            'likeCount': int(rng.paretovariate(1.3)) - 1,
+            'quoteCount': int(rng.paretovariate(2.0)) - 1,
+        }
+        for _ in range(int(retweets) + (rng.random() < retweets % 1)):
+            yield 'retweet', (active_user(rng, users), tid - zipf_rank(rng, tid), date)
+
+def tweet_document(tweet, users, follows=20):
+    """
+    Turns a tweet from generate_activity into a document shaped like the dumps.
+
+    Args:
+        tweet (dict): The generated tweet.
+        users (int): Number of users in the corpus.
+        follows (int): Mean number of accounts a user follows, for the followersCount.
+
+    Returns:
+        dict: The tweet document; ids are offset like generate_tweets so they look like the dataset's.
+    """
+    user = user_record(tweet['writer'])
+    user['followersCount'] = expected_followers(tweet['writer'], users, follows)
+    tweet_id = 1376739399593910273 + tweet['id']
+    mentioned = [word[1:] for word in tweet['text'].split() if word.startswith('@')]
+    return {
+        'url': 'https://twitter.com/{}/status/{}'.format(user['username'], tweet_id),
+        'date': tweet['date'],
+        'content': tweet['text'],
+        'renderedContent': tweet['text'],
+        'id': tweet_id,
+        'user': user,
+        'outlinks': [],
+        'replyCount': 0,
+        'retweetCount': tweet['retweetCount'],
+        'likeCount': tweet['likeCount'],
+        'quoteCount': tweet['quoteCount'],
+        'conversationId': tweet_id if tweet['replyto'] is None else 1376739399593910273 + tweet['replyto'],
+        'lang': 'en',
+        'retweetedTweet': None,
+        'quotedTweet': None,
+        'mentionedUsers': [{'username': username} for username in mentioned] or None,
+    }
+
+def generate_tweets(path, n, seed=291):
+    """
+    Writes n synthetic tweets to an NDJSON file, using the sample dump as templates.
+    Ids, dates, content and counters are varied so indexes and sorts see realistic spreads.
+
+    Args:
+        path (str): Output file path.
+        n (int): Number of tweets to write.
+        seed (int): Random seed, so the same arguments always give the same file.
+
+    Returns:
+        str: The output path.
+    """
+    rng = random.Random(seed)
+    with open(SAMPLE_PATH, 'r') as file:
+        templates = [json.loads(line) for line in file if line.strip()]
+
+    users = max(n // 20, 1)
+    with open(path, 'w') as out:
+        for i in range(n):
+            tweet = copy.deepcopy(templates[i % len(templates)])
+            tweet_id = 1376739399593910273 + i
+            user_no = int(rng.paretovariate(1.2)) % users
+            words = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 12)))
+            tweet['id'] = tweet_id
+            tweet['conversationId'] = tweet_id
+            tweet['date'] = '2021-03-{:02d}T{:02d}:{:02d}:{:02d}+00:00'.format(
+                rng.randint(1, 30), rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59))
+            tweet['content'] = tweet['renderedContent'] = words + ' #' + rng.choice(WORDS)
+            tweet['retweetCount'] = int(rng.paretovariate(1.5)) - 1
+            tweet['likeCount'] = int(rng.paretovariate(1.3)) - 1
+            tweet['quoteCount'] = int(rng.paretovariate(2.0)) - 1
+            tweet['user']['username'] = 'user{}'.format(user_no)
+            tweet['user']['id'] = user_no
+            tweet['user']['followersCount'] = int(rng.paretovariate(1.1) * 10)
+            out.write(json.dumps(tweet) + '\n')
+    return path
+
+def hashtag_stream(n, days=7, tags=20000, start=1614556800, seed=291):
+    """
+    Makes up the hashtags of n tweets spread evenly over a number of days, in time order.
+    Hashtag use mostly follows a power law, and which hashtags are popular changes from
+    day to day, so the trending list of the last day differs from the overall one.
+
+    Args:
+        n (int): Number of tweets.
+        days (int): Number of days the tweets span; the last tweet falls in the last hour of the last day.
+        tags (int): Number of distinct hashtags.
+        start (int): Time of the first tweet in seconds since the epoch, midnight UTC (default 2021-03-01).
+        seed (int): Random seed, so the same arguments always give the same tweets.
+
+    Returns:
+        generator: (seconds since the epoch, list of distinct hashtags) per tweet.
+    """
+    rng = random.Random(seed)
+    ranking = list(range(tags))
+    day = None
+    for i in range(n):
+        when = start + i * days * 86400 // n
+        if when // 86400 != day:
+            # A new day brings a new order of popularity
+            day = when // 86400
+            rng.shuffle(ranking)
+        # Mostly the popular ones, with a long tail of rarely used hashtags
+        picked = {ranking[(int(rng.paretovariate(1.1)) - 1) % tags] if rng.random() < 0.8 else rng.randrange(tags)
+                  for _ in range(rng.randint(1, 3))}
+        yield when, ['tag{}'.format(tag) for tag in picked]
@@ -0,0 +1,90 @@
+import collections
+import re
+import unicodedata
+
+def _mark_ranges():
+    """
+    Builds a regex character class body covering the combining marks of the Basic Multilingual Plane.
+    Python's \\w leaves out marks such as Devanagari and Gurmukhi vowel signs,
+    which would cut hashtags like #किसान in half.
+
+    Returns:
+        str: Ranges like "\\u0300-\\u036f..." for use inside [...].
+    """
+    marks = [code for code in range(0x10000) if unicodedata.category(chr(code)).startswith('M')]
+    ranges = []
+    for code in marks:
+        if ranges and ranges[-1][1] == code - 1:
+            ranges[-1][1] = code
+        else:
+            ranges.append([code, code])
+    return ''.join('\\u{:04x}-\\u{:04x}'.format(first, last) for first, last in ranges)
+
+# A character that can be part of a hashtag: letters, digits, underscore,
+# combining marks and the zero-width joiners used in Indic scripts
+_TAG_CHAR = '[\\w{}\\u200c\\u200d]'.format(_mark_ranges())
+
+URL_RE = re.compile(r'\b(?:https?://|www\.)[^\s<>"]+', re.IGNORECASE)
+# '#' or the full-width '＃', not glued to a word before it
+HASHTAG_RE = re.compile('(?<![\\w&#＃])[#＃]({}+)'.format(_TAG_CHAR))
+# Usernames are ASCII, at most 15 characters
+MENTION_RE = re.compile(r'(?<![\w@＠])[@＠]([A-Za-z0-9_]{1,15})(?![A-Za-z0-9_])')
+
+Entities = collections.namedtuple('Entities', ['hashtags', 'mentions', 'urls'])
+
+def extract_entities(text):
+    """
+    Finds the hashtags, @mentions and URLs in a tweet.
+    URLs are taken out first, so a '#' in a link is not read as a hashtag.
+    Each list keeps the order of first appearance and has no repeats.
+    Hashtags made only of digits are not hashtags, as on Twitter.
+
+    Args:
+        text (str): The tweet text.
+
+    Returns:
+        Entities: hashtags and mentions without their '#'/'@', and urls.
+    """
+    if not text:
+        return Entities([], [], [])
+    urls = URL_RE.findall(text)
+    if urls:
+        text = URL_RE.sub(' ', text)
+    tags = [tag for tag in HASHTAG_RE.findall(text) if not tag.isdigit()]
+    return Entities(list(dict.fromkeys(tags)), list(dict.fromkeys(MENTION_RE.findall(text))), list(dict.fromkeys(urls)))
+
+def hashtags(text):
+    """
+    Finds the hashtags in a tweet, without '#', in order of first appearance.
+
+    Args:
+        text (str): The tweet text.
+
+    Returns:
+        list: The hashtags as written.
+    """
+    return extract_entities(text).hashtags
+
+def normalize_hashtag(tag):
+    """
+    Gives the form a hashtag is stored and looked up in, so #Farmers and #farmers match.
+
+    Args:
+        tag (str): A hashtag, with or without the leading '#'.
+
+    Returns:
+        str: The lower-cased hashtag without '#'.
+    """
+    return tag.lstrip('#＃').lower()
+
+def hashtag_keys(text):
+    """
+    Finds the hashtags in a tweet in their normalized form, without repeats.
+
+    Args:
+        text (str): The tweet text.
+
+    Returns:
+        list: The normalized hashtags.
+    """
+    return list(dict.fromkeys(normalize_hashtag(tag) for tag in hashtags(text)))
@@ -0,0 +1,305 @@
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Result fields compared between runs, and whether a higher value is better
+METRICS = {
+    'p50_ms': False,
+    'p95_ms': False,
+    'p99_ms': False,
+    'throughput': True,
+    'peak_heap_mb': False,
+}
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process in MB, or 0 if unknown.
+    """
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def percentile(samples, p):
+    """
+    Returns the p-th percentile of a list of samples (nearest-rank).
+    """
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+def row_cost(build, rows, repeat=5, per=10000):
+    """
+    Measures what building a list of rows costs: the best time of repeat builds, then
+    with tracemalloc the memory the list keeps, its peak while being built and the
+    number of memory blocks it keeps (one or more per object), all per `per` rows.
+
+    Args:
+        build (function): Builds and returns the rows.
+        rows (int): Number of rows build returns.
+        repeat (int): Number of timed builds.
+        per (int): Number of rows the results are given for, e.g. a page.
+
+    Returns:
+        dict: ms, kept_kb, peak_kb and blocks, per `per` rows.
+    """
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = build()
+        best = min(best or float('inf'), time.perf_counter() - start)
+        del result
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    blocks = sys.getallocatedblocks()
+    tracemalloc.reset_peak()
+    result = build()
+    blocks = sys.getallocatedblocks() - blocks
+    kept, peak = tracemalloc.get_traced_memory()
+    del result
+    if not tracing:
+        tracemalloc.stop()
+    scale = per / rows
+    return {
+        'ms': round(best * 1000 * scale, 4),
+        'kept_kb': round((kept - before) / 1024 * scale, 1),
+        'peak_kb': round((peak - before) / 1024 * scale, 1),
+        'blocks': round(blocks * scale),
+    }
+
+def environment():
+    """
+    Describes where a benchmark ran, so results from different commits and machines can be told apart.
+
+    Returns:
+        dict: commit (None outside a git checkout), dirty, python, platform, cpus and time.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=root, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'time': datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+    }
+
+class Recorder:
+    """
+    Collects the results of the scenarios of one benchmark run.
+    Each scenario keeps the latency of every call, its wall time (for the
+    throughput) and the memory it peaked at. The process RSS is a high-water
+    mark over the whole run; with trace_memory the Python heap peak is measured
+    per scenario instead, at the cost of slowing every allocation down.
+    """
+    def __init__(self, meta=None, trace_memory=False):
+        """
+        Args:
+            meta (dict): What was run: backend, sizes, seed and so on; saved with the results.
+            trace_memory (bool): Whether to trace Python allocations for peak_heap_mb.
+        """
+        self.meta = dict(meta or {})
+        self.trace_memory = trace_memory
+        # name -> samples in seconds, items, errors, wall seconds and memory, in run order
+        self.scenarios = {}
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _entry(self, name):
+        if name not in self.scenarios:
+            self.scenarios[name] = {'samples': [], 'items': 0, 'errors': 0, 'error': None, 'seconds': 0.0,
+                                    'peak_rss_mb': 0.0, 'peak_heap_mb': None}
+        return self.scenarios[name]
+
+    @contextlib.contextmanager
+    def scenario(self, name):
+        """
+        Context manager that runs a scenario: its wall time counts towards the
+        throughput and the memory peak inside it is recorded.
+
+        Args:
+            name (str): The scenario, e.g. 'feed_page'.
+        """
+        entry = self._entry(name)
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry['seconds'] += time.perf_counter() - start
+            entry['peak_rss_mb'] = peak_rss_mb()
+            if self.trace_memory:
+                entry['peak_heap_mb'] = max(entry['peak_heap_mb'] or 0.0, tracemalloc.get_traced_memory()[1] / (1024 * 1024))
+
+    def time(self, name, f, *args, items=1):
+        """
+        Calls f(*args) and records its latency under a scenario.
+        An exception is counted as an error of the scenario rather than ending the run.
+
+        Args:
+            name (str): The scenario.
+            f (function): The call to time.
+            args: Arguments for f.
+            items (int): Units of work the call does, for the throughput, e.g. documents loaded.
+
+        Returns:
+            The result of f, or None if it raised.
+        """
+        entry = self._entry(name)
+        start = time.perf_counter()
+        try:
+            result = f(*args)
+        except Exception as e:
+            entry['errors'] += 1
+            entry['error'] = entry['error'] or '{}: {}'.format(type(e).__name__, e)
+            return None
+        entry['samples'].append(time.perf_counter() - start)
+        entry['items'] += items
+        return result
+
+    def results(self):
+        """
+        Returns:
+            dict: scenario -> calls, errors, first error, seconds, throughput (items per second of the
+                scenario), mean/p50/p95/p99/max latency in ms, peak_rss_mb and peak_heap_mb.
+        """
+        results = {}
+        for name, entry in self.scenarios.items():
+            samples = sorted(entry['samples'])
+            ms = [sample * 1000 for sample in samples]
+            results[name] = {
+                'calls': len(samples),
+                'errors': entry['errors'],
+                'error': entry['error'],
+                'seconds': round(entry['seconds'], 6),
+                'throughput': round(entry['items'] / entry['seconds'], 3) if entry['seconds'] else None,
+                'mean_ms': round(sum(ms) / len(ms), 4) if ms else None,
+                'p50_ms': round(percentile(ms, 50), 4) if ms else None,
+                'p95_ms': round(percentile(ms, 95), 4) if ms else None,
+                'p99_ms': round(percentile(ms, 99), 4) if ms else None,
+                'max_ms': round(ms[-1], 4) if ms else None,
+                'peak_rss_mb': round(entry['peak_rss_mb'], 1),
+                'peak_heap_mb': None if entry['peak_heap_mb'] is None else round(entry['peak_heap_mb'], 2),
+            }
+        return results
+
+    def report(self, out=sys.stdout):
+        """
+        Prints one line per scenario.
+        """
+        for name, result in self.results().items():
+            if not result['calls']:
+                print('{:<18} no successful calls, {} errors: {}'.format(name, result['errors'], result['error']), file=out)
+                continue
+            line = '{:<18} {:>7} calls {:>12.1f}/s  p50 {:>9.3f}  p95 {:>9.3f}  p99 {:>9.3f} ms  RSS {:>7.1f} MB'.format(
+                name, result['calls'], result['throughput'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['peak_rss_mb'])
+            if result['peak_heap_mb'] is not None:
+                line += '  heap {:>7.2f} MB'.format(result['peak_heap_mb'])
+            if result['errors']:
+                line += '  {} errors'.format(result['errors'])
+            print(line, file=out)
+
+    def save(self, path):
+        """
+        Writes the run to a JSON file for compare.
+
+        Args:
+            path (str): The output path; '-' for standard output.
+
+        Returns:
+            dict: What was written.
+        """
+        document = {'meta': self.meta, 'environment': environment(), 'results': self.results()}
+        text = json.dumps(document, indent=2, sort_keys=True)
+        if path == '-':
+            print(text)
+        else:
+            with open(path, 'w') as file:
+                file.write(text + '\n')
+        return document
+
+def compare(baseline, current, tolerance=0.2):
+    """
+    Compares two saved runs scenario by scenario.
+
+    Args:
+        baseline (dict): The earlier run, as saved by Recorder.save.
+        current (dict): The later run.
+        tolerance (float): Relative change in the worse direction that counts as a regression.
+
+    Returns:
+        list: (scenario, metric, baseline value, current value, relative change, regressed) for every
+            metric both runs have; a positive change is always an improvement.
+    """
+    rows = []
+    for name, old in baseline['results'].items():
+        new = current['results'].get(name)
+        if new is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            before, after = old.get(metric), new.get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before * (1 if higher_is_better else -1)
+            rows.append((name, metric, before, after, change, change < -tolerance))
+    return rows
+
+def main():
+    """
+    Compares two benchmark result files from the command line and exits with status 1 on a regression.
+    Usage: python3 harness.py <baseline.json> <current.json> [--tolerance 0.2]
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description='Compare two tweetbook benchmark result files.')
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='relative slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    runs = []
+    for path in (args.baseline, args.current):
+        with open(path) as file:
+            runs.append(json.load(file))
+    print('baseline {} ({}), current {} ({})'.format(
+        (runs[0]['environment']['commit'] or '?')[:10], runs[0]['environment']['time'],
+        (runs[1]['environment']['commit'] or '?')[:10], runs[1]['environment']['time']))
+    if runs[0]['meta'] != runs[1]['meta']:
+        print('warning: the runs had different settings, {} vs {}'.format(runs[0]['meta'], runs[1]['meta']))
+
+    rows = compare(runs[0], runs[1], args.tolerance)
+    for name, metric, before, after, change, regressed in rows:
+        print('{:<18} {:<12} {:>12.3f} -> {:>12.3f}  {:>+7.1%}{}'.format(
+            name, metric, before, after, change, '  REGRESSION' if regressed else ''))
+    if any(row[5] for row in rows):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
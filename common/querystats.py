@@ -0,0 +1,290 @@
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+# Upper bounds of the latency histogram buckets in seconds, as in a Prometheus histogram
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Modules whose frames are skipped when naming a query after the function that ran it
+WRAPPER_MODULES = {__name__, 'instrument'}
+
+def caller_name():
+    """
+    Names a query after the function that ran it, e.g. 'service.feed_page.load'.
+    The frames of the instrumentation itself are skipped.
+
+    Returns:
+        str: The module and qualified name of the calling function.
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get('__name__') in WRAPPER_MODULES:
+        frame = frame.f_back
+    if frame is None:
+        return '?'
+    code = frame.f_code
+    name = getattr(code, 'co_qualname', code.co_name).replace('<locals>.', '')
+    return '{}.{}'.format(frame.f_globals.get('__name__', '?'), name)
+
+def query_shape(value):
+    """
+    Replaces the values in a MongoDB filter or pipeline with '?', so queries that
+    differ only in their parameters have the same shape and are explained once.
+    Repeated items of a list are kept once, so an $in of any length has one shape.
+
+    Args:
+        value: A filter, pipeline, sort or projection.
+
+    Returns:
+        str: The shape as compact JSON.
+    """
+    def strip(value):
+        if isinstance(value, dict):
+            return {key: strip(item) for key, item in value.items()}
+        if isinstance(value, (list, tuple)):
+            items = []
+            for item in map(strip, value):
+                if item not in items:
+                    items.append(item)
+            return items
+        return '?'
+    return json.dumps(strip(value), sort_keys=True, default=str)
+
+def escape_label(value):
+    """
+    Escapes a Prometheus label value.
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class QueryStats:
+    """
+    Latency histograms, row counts and slow-query samples for the database calls of one process.
+    Calls are grouped by (name, op): the function that ran the query and the
+    statement kind or collection method, e.g. ('service.feed_page.load', 'SELECT').
+    The plan of each distinct statement is read once, with EXPLAIN QUERY PLAN or
+    explain("executionStats"), and its estimate of the rows or documents scanned
+    is added to every call of the statement.
+
+    Nothing is wrapped unless a QueryStats is given to the connections, so the
+    calls cost nothing extra when it is off. All methods are thread-safe.
+    """
+    def __init__(self, slow_ms=100.0, samples=50, output=None):
+        """
+        Args:
+            slow_ms (float): Calls slower than this are kept as slow-query samples.
+            samples (int): Number of the latest slow-query samples kept.
+            output (str): Where save writes by default; '.prom' and '.txt' files get
+                Prometheus text, other paths JSON, '-' standard output.
+        """
+        self.slow_ms = slow_ms
+        self.output = output
+        self.started = time.time()
+        self.lock = threading.Lock()
+        # (name, op) -> calls, errors, seconds, max, rows, scanned, full scans and bucket counts
+        self.queries = {}
+        # statement -> plan, so each statement is explained once
+        self.plans = {}
+        self.slow = collections.deque(maxlen=samples)
+        self.slow_calls = 0
+
+    def plan(self, statement, explain=None):
+        """
+        Returns the plan of a statement, running explain the first time it is seen.
+        explain runs outside the lock; two threads may both explain a new statement.
+
+        Args:
+            statement (str): The SQL text or the query shape.
+            explain (function): Returns the plan as a dict with 'scanned' (or None), 'full_scans' and 'detail';
+                None to only return a plan that was already read.
+
+        Returns:
+            dict: The plan, or None if there is none yet.
+        """
+        with self.lock:
+            if statement in self.plans or explain is None:
+                return self.plans.get(statement)
+        try:
+            plan = explain()
+        except Exception as e:
+            plan = {'scanned': None, 'full_scans': [], 'detail': ['explain failed: {}'.format(e)]}
+        with self.lock:
+            self.plans[statement] = plan
+        return plan
+
+    def record(self, name, op, seconds, rows, statement=None, plan=None, error=False):
+        """
+        Adds one call.
+
+        Args:
+            name (str): The function that ran the query, see caller_name.
+            op (str): The statement kind (SELECT, INSERT...) or collection method (find, aggregate...).
+            seconds (float): The time from running the query to reading its last row.
+            rows (int): Rows or documents returned, or changed for a write.
+            statement (str): The SQL text or MongoDB query, for the slow-query samples.
+            plan (dict): The statement's plan, see plan.
+            error (bool): Whether the call raised.
+
+        Returns:
+            None
+        """
+        index = 0
+        while index < len(BUCKETS) and seconds > BUCKETS[index]:
+            index += 1
+        scanned = plan.get('scanned') if plan else None
+        with self.lock:
+            entry = self.queries.get((name, op))
+            if entry is None:
+                entry = self.queries[(name, op)] = {'calls': 0, 'errors': 0, 'seconds': 0.0, 'max': 0.0, 'rows': 0,
+                                                    'scanned': 0, 'explained_calls': 0, 'full_scan_calls': 0,
+                                                    'buckets': [0] * (len(BUCKETS) + 1), 'statements': set()}
+            entry['calls'] += 1
+            entry['errors'] += error
+            entry['seconds'] += seconds
+            entry['max'] = max(entry['max'], seconds)
+            entry['rows'] += rows
+            entry['buckets'][index] += 1
+            if statement is not None and len(entry['statements']) < 10:
+                entry['statements'].add(statement)
+            if scanned is not None:
+                entry['scanned'] += scanned
+                entry['explained_calls'] += 1
+            if plan and plan.get('full_scans'):
+                entry['full_scan_calls'] += 1
+            if seconds * 1000 >= self.slow_ms:
+                self.slow_calls += 1
+                self.slow.append({
+                    'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                    'name': name,
+                    'op': op,
+                    'ms': round(seconds * 1000, 3),
+                    'rows': rows,
+                    'statement': statement,
+                    'plan': plan.get('detail') if plan else None,
+                })
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: since, slow_ms, queries (one dict per (name, op), slowest total first, with calls,
+                errors, total/mean/max ms, p50/p95/p99 ms estimated from the histogram, rows, scanned,
+                scanned_per_row, full_scan_calls, statements and the cumulative bucket counts),
+                slow_calls and the slow samples, oldest first.
+        """
+        with self.lock:
+            queries = []
+            for (name, op), entry in self.queries.items():
+                cumulative, counts = 0, []
+                for count in entry['buckets']:
+                    cumulative += count
+                    counts.append(cumulative)
+                queries.append({
+                    'name': name,
+                    'op': op,
+                    'calls': entry['calls'],
+                    'errors': entry['errors'],
+                    'total_ms': round(entry['seconds'] * 1000, 3),
+                    'mean_ms': round(entry['seconds'] * 1000 / entry['calls'], 4),
+                    'max_ms': round(entry['max'] * 1000, 4),
+                    'p50_ms': self.quantile(counts, 0.50),
+                    'p95_ms': self.quantile(counts, 0.95),
+                    'p99_ms': self.quantile(counts, 0.99),
+                    'rows': entry['rows'],
+                    'scanned': entry['scanned'] if entry['explained_calls'] else None,
+                    'scanned_per_row': round(entry['scanned'] / max(entry['rows'], 1), 2) if entry['explained_calls'] else None,
+                    'full_scan_calls': entry['full_scan_calls'],
+                    'statements': sorted(entry['statements']),
+                    'buckets': dict(zip([str(bound) for bound in BUCKETS] + ['+Inf'], counts)),
+                })
+            queries.sort(key=lambda query: query['total_ms'], reverse=True)
+            return {
+                'since': datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec='seconds'),
+                'slow_ms': self.slow_ms,
+                'queries': queries,
+                'slow_calls': self.slow_calls,
+                'slow': list(self.slow),
+            }
+
+    @staticmethod
+    def quantile(counts, q):
+        """
+        Estimates a latency quantile in ms from cumulative bucket counts: the upper bound of
+        the bucket it falls in, as histogram_quantile would without interpolation.
+        """
+        target = q * counts[-1]
+        for bound, count in zip(BUCKETS, counts):
+            if count >= target:
+                return bound * 1000
+        return None
+
+    def prometheus(self):
+        """
+        Returns:
+            str: The counters in the Prometheus text exposition format.
+        """
+        snapshot = self.snapshot()
+        lines = [
+            '# HELP tweetbook_query_duration_seconds Time from running a query to reading its last row.',
+            '# TYPE tweetbook_query_duration_seconds histogram',
+        ]
+        for query in snapshot['queries']:
+            labels = 'query="{}",op="{}"'.format(escape_label(query['name']), escape_label(query['op']))
+            for bound, count in query['buckets'].items():
+                lines.append('tweetbook_query_duration_seconds_bucket{{{},le="{}"}} {}'.format(labels, bound, count))
+            lines.append('tweetbook_query_duration_seconds_sum{{{}}} {}'.format(labels, round(query['total_ms'] / 1000, 9)))
+            lines.append('tweetbook_query_duration_seconds_count{{{}}} {}'.format(labels, query['calls']))
+        counters = [
+            ('tweetbook_query_rows_total', 'Rows or documents returned, or changed by writes.', 'rows'),
+            ('tweetbook_query_scanned_total', 'Rows or documents the query plans expect to examine.', 'scanned'),
+            ('tweetbook_query_full_scans_total', 'Calls whose plan reads a whole table or collection.', 'full_scan_calls'),
+            ('tweetbook_query_errors_total', 'Calls that raised.', 'errors'),
+        ]
+        for metric, description, field in counters:
+            lines.append('# HELP {} {}'.format(metric, description))
+            lines.append('# TYPE {} counter'.format(metric))
+            for query in snapshot['queries']:
+                if query[field] is not None:
+                    lines.append('{}{{query="{}",op="{}"}} {}'.format(
+                        metric, escape_label(query['name']), escape_label(query['op']), query[field]))
+        lines.append('# HELP tweetbook_slow_queries_total Calls slower than {} ms.'.format(snapshot['slow_ms']))
+        lines.append('# TYPE tweetbook_slow_queries_total counter')
+        lines.append('tweetbook_slow_queries_total {}'.format(snapshot['slow_calls']))
+        return '\n'.join(lines) + '\n'
+
+    def save(self, path=None):
+        """
+        Writes the counters: Prometheus text to '.prom' and '.txt' files, JSON otherwise.
+
+        Args:
+            path (str): The output path, '-' for standard output; defaults to output.
+
+        Returns:
+            None
+        """
+        path = path or self.output
+        if not path:
+            return
+        if path.endswith(('.prom', '.txt')):
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.snapshot(), indent=2) + '\n'
+        if path == '-':
+            sys.stdout.write(text)
+        else:
+            with open(path, 'w') as file:
+                file.write(text)
+
+def from_environment(environ=os.environ):
+    """
+    Turns query stats on when TWEETBOOK_QUERY_STATS names the file to write them to
+    ('-' for standard output); TWEETBOOK_SLOW_MS sets the slow-query threshold (default 100).
+
+    Returns:
+        QueryStats: The stats to give the connections, or None when they are off.
+    """
+    output = environ.get('TWEETBOOK_QUERY_STATS')
+    if not output:
+        return None
+    return QueryStats(float(environ.get('TWEETBOOK_SLOW_MS', 100)), output=output)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# common is imported as a package from the repository root, as the SQL and MongoDB sides do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
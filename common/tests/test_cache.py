@@ -0,0 +1,91 @@
+import types
+
+from common import cache
+from common.cache import QueryCache, query_key
+
+class Clock:
+    """
+    Stands in for time in the cache module; the tests move it on by hand.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+def loader(result):
+    """
+    Returns a load function for QueryCache.get that counts its calls.
+    """
+    def load():
+        load.calls += 1
+        return result
+    load.calls = 0
+    return load
+
+def test_second_get_is_a_hit():
+    queries = QueryCache()
+    load = loader([(1, 'a')])
+    key = query_key('SELECT *  FROM tweets\n WHERE tid = ?', 1)
+    assert queries.get(key, load) == [(1, 'a')]
+    # The same query written with other whitespace shares the entry
+    assert queries.get(query_key('SELECT * FROM tweets WHERE tid = ?', 1), load) == [(1, 'a')]
+    assert load.calls == 1
+    assert (queries.hits, queries.misses) == (1, 1)
+
+def test_filters_with_fields_in_another_order_share_a_key():
+    assert query_key({'user.id': 1, 'date': {'$lt': 5}}) == query_key({'date': {'$lt': 5}, 'user.id': 1})
+    assert query_key({'user.id': 1}) != query_key({'user.id': 2})
+
+def test_invalidate_drops_only_the_tagged_results():
+    queries = QueryCache()
+    queries.get('feed', loader([1]), tags=[('user', 1)])
+    queries.get('profile', loader([2]), tags=[('user', 1), ('tweet', 7)])
+    queries.get('other', loader([3]), tags=[('user', 2)])
+    assert queries.invalidate(('user', 1)) == 2
+    assert list(queries.entries) == ['other']
+    assert queries.invalidate(('tweet', 7)) == 0
+    load = loader([4])
+    assert queries.get('feed', load, tags=[('user', 1)]) == [4] and load.calls == 1
+
+def test_result_read_while_invalidated_is_not_stored():
+    queries = QueryCache()
+
+    # A write commits and invalidates while the query is still running
+    def load():
+        queries.invalidate(('user', 1))
+        return ['old']
+    assert queries.get('feed', load, tags=[('user', 1)]) == ['old']
+    assert 'feed' not in queries.entries
+    fresh = loader(['new'])
+    assert queries.get('feed', fresh, tags=[('user', 1)]) == ['new']
+    assert queries.get('feed', fresh, tags=[('user', 1)]) == ['new'] and fresh.calls == 1
+
+def test_results_expire_after_their_ttl(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, 'time', types.SimpleNamespace(monotonic=clock.monotonic))
+    queries = QueryCache(ttl=30.0)
+    load = loader([1])
+    queries.get('default', load)
+    queries.get('short', load, ttl=5.0)
+    clock.now += 10
+    queries.get('default', load)
+    queries.get('short', load)
+    assert load.calls == 3 and queries.expirations == 1
+    clock.now += 25
+    queries.get('default', load)
+    assert load.calls == 4 and queries.expirations == 2
+
+def test_least_recently_used_results_make_room():
+    result = list(range(100))
+    size = cache.approximate_size(result)
+    queries = QueryCache(max_bytes=size * 2)
+    queries.get('a', loader(result))
+    queries.get('b', loader(result))
+    queries.get('a', loader(result))
+    queries.get('c', loader(result))
+    assert list(queries.entries) == ['a', 'c']
+    assert queries.size == size * 2 and queries.evictions == 1
+    # A result bigger than the whole cache is returned but not stored
+    assert queries.get('big', loader(result * 3)) == result * 3
+    assert 'big' not in queries.entries
@@ -0,0 +1,399 @@
+import array
+import collections
+import functools
+import hashlib
+import heapq
+import operator
+import threading
+import time
+from datetime import datetime
+
+@functools.lru_cache(maxsize=65536)
+def _offsets(term, width, depth):
+    """
+    Finds the counter of a term in each row of a sketch, as offsets into the flat counter array.
+    The rows use h1 + i * h2 from one 64-bit hash (Kirsch-Mitzenmacher), and the
+    hash is stable across processes so saved sketches can be loaded again.
+    """
+    digest = int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+    h1 = digest & 0xffffffff
+    h2 = (digest >> 32) | 1
+    return tuple(row * width + (h1 + row * h2) % width for row in range(depth))
+
+class CountMinSketch:
+    """
+    Approximate counts of many terms in a fixed amount of memory.
+    An estimate is never below the true count, and with width w it is above it by
+    at most e/w of the total count with probability 1 - e^-depth.
+    Sketches of the same size add and subtract counter by counter.
+    """
+    def __init__(self, width=2048, depth=4, counts=None):
+        """
+        Args:
+            width (int): Counters per row.
+            depth (int): Number of rows, each with its own hash.
+            counts (bytes): Counters saved with to_bytes, or None for an empty sketch.
+        """
+        self.width = width
+        self.depth = depth
+        self.counts = array.array('i', bytes(4 * width * depth) if counts is None else counts)
+
+    def add(self, term, count=1):
+        """
+        Counts a term.
+
+        Args:
+            term (str): The term.
+            count (int): How many times it was seen.
+
+        Returns:
+            int: The estimated count of the term after adding.
+        """
+        counts = self.counts
+        estimate = None
+        for offset in _offsets(term, self.width, self.depth):
+            counts[offset] += count
+            if estimate is None or counts[offset] < estimate:
+                estimate = counts[offset]
+        return estimate
+
+    def estimate(self, term):
+        """
+        Estimates the count of a term.
+
+        Args:
+            term (str): The term.
+
+        Returns:
+            int: The smallest of its counters.
+        """
+        counts = self.counts
+        return min(counts[offset] for offset in _offsets(term, self.width, self.depth))
+
+    def merge(self, other):
+        """
+        Adds the counts of a sketch of the same size to this one.
+        """
+        self.counts = array.array('i', map(operator.add, self.counts, other.counts))
+
+    def subtract(self, other):
+        """
+        Takes away the counts of a sketch of the same size that were merged into this one.
+        """
+        self.counts = array.array('i', map(operator.sub, self.counts, other.counts))
+
+    def to_bytes(self):
+        """
+        Returns:
+            bytes: The counters, for saving.
+        """
+        return self.counts.tobytes()
+
+class TopK:
+    """
+    The capacity terms with the highest counts seen so far.
+    Counts are kept in a dict and a min-heap finds the term to drop; a new count
+    for a term pushes a fresh heap entry and the stale ones are skipped when they
+    come to the top, so each offer costs O(log capacity).
+    """
+    def __init__(self, capacity, items=()):
+        """
+        Args:
+            capacity (int): Number of terms kept.
+            items (iterable): (term, count) pairs to start from.
+        """
+        self.capacity = capacity
+        self.counts = {}
+        self.heap = []
+        for term, count in items:
+            self.offer(term, count)
+
+    def offer(self, term, count):
+        """
+        Records the current count of a term, keeping it if it is among the highest.
+
+        Args:
+            term (str): The term.
+            count (int): Its count.
+
+        Returns:
+            None
+        """
+        counts = self.counts
+        heap = self.heap
+        if term in counts or len(counts) < self.capacity:
+            counts[term] = count
+            heapq.heappush(heap, (count, term))
+            if len(heap) > 4 * self.capacity:
+                self.heap = [(c, t) for t, c in counts.items()]
+                heapq.heapify(self.heap)
+            return
+        # Skip entries for terms that were dropped or have a newer count
+        while counts.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        if count <= heap[0][0]:
+            return
+        _, dropped = heapq.heapreplace(heap, (count, term))
+        del counts[dropped]
+        counts[term] = count
+
+    def items(self):
+        """
+        Returns:
+            list: [term, count] pairs, highest count first.
+        """
+        return [[term, count] for term, count in sorted(self.counts.items(), key=operator.itemgetter(1), reverse=True)]
+
+class Bucket:
+    """
+    The hashtags of one time bucket: a sketch with every count and the top terms.
+    """
+    def __init__(self, width, depth, capacity, record=None):
+        """
+        Args:
+            width (int): Counters per sketch row.
+            depth (int): Sketch rows.
+            capacity (int): Number of top terms kept.
+            record (dict): A saved bucket with 'sketch' bytes and 'top' pairs, or None for an empty one.
+        """
+        self.sketch = CountMinSketch(width, depth, None if record is None else record['sketch'])
+        self.top = TopK(capacity, [] if record is None else record['top'])
+
+    def add(self, term, count=1):
+        """
+        Counts a term in the bucket.
+        """
+        self.top.offer(term, self.sketch.add(term, count))
+
+    def record(self):
+        """
+        Returns:
+            dict: 'sketch' bytes and 'top' pairs, for saving.
+        """
+        return {'sketch': self.sketch.to_bytes(), 'top': self.top.items()}
+
+def timestamp(date):
+    """
+    Converts a tweet date as stored in the dumps to seconds since the Unix epoch.
+
+    Args:
+        date (str): An ISO 8601 date, e.g. '2021-03-30T03:33:46+00:00'.
+
+    Returns:
+        float: The seconds since the epoch.
+    """
+    return datetime.fromisoformat(date.replace('Z', '+00:00')).timestamp()
+
+class Trending:
+    """
+    Sliding-window hashtag counts for the trending list.
+    Counts go into fixed time buckets (hourly by default), each a Count-Min
+    sketch plus its top terms. The window is the last `window` buckets up to the
+    newest one seen, so a loaded dump trends as of its newest tweet; older
+    buckets are dropped as the window moves on. A running sum of the window's
+    sketches and a top-K over it are kept up to date on every add, so reading
+    the list does not touch the buckets at all.
+
+    Counts made since the last save are kept apart, so save adds them to the
+    stored buckets instead of overwriting what other processes saved.
+    All methods are thread-safe.
+    """
+    def __init__(self, bucket_seconds=3600, window=24, width=2048, depth=4, capacity=100):
+        """
+        Args:
+            bucket_seconds (int): Length of a bucket in seconds.
+            window (int): Number of buckets in the window.
+            width (int): Counters per sketch row.
+            depth (int): Sketch rows.
+            capacity (int): Number of top terms kept per bucket and for the window.
+        """
+        self.bucket_seconds = bucket_seconds
+        self.window = window
+        self.width = width
+        self.depth = depth
+        self.capacity = capacity
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        """
+        Forgets every count.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.buckets = {}
+            self.total = CountMinSketch(self.width, self.depth)
+            self.top_terms = TopK(self.capacity)
+            self.newest = None
+            # Bucket start -> Counter of the counts made since the last save
+            self.pending = {}
+            self.stale = False
+
+    def bucket_start(self, when):
+        """
+        Returns:
+            int: The start, in seconds since the epoch, of the bucket a time falls in.
+        """
+        return int(when) - int(when) % self.bucket_seconds
+
+    def window_start(self):
+        """
+        Returns:
+            int: The start of the oldest bucket in the window, or None before anything was counted.
+        """
+        with self.lock:
+            return None if self.newest is None else self.newest - (self.window - 1) * self.bucket_seconds
+
+    def add(self, tags, when=None, count=1):
+        """
+        Counts the hashtags of a tweet.
+
+        Args:
+            tags (iterable): The normalized hashtags, each counted once.
+            when (float): Time of the tweet in seconds since the epoch, defaults to now.
+            count (int): How many times each was seen.
+
+        Returns:
+            None
+        """
+        start = self.bucket_start(time.time() if when is None else when)
+        with self.lock:
+            if self.newest is None or start > self.newest:
+                self._advance(start)
+            # Too old for the window
+            if start < self.window_start():
+                return
+            bucket = self.buckets.get(start)
+            if bucket is None:
+                bucket = self.buckets[start] = Bucket(self.width, self.depth, self.capacity)
+            pending = self.pending.setdefault(start, collections.Counter())
+            for tag in tags:
+                bucket.add(tag, count)
+                self.top_terms.offer(tag, self.total.add(tag, count))
+                pending[tag] += count
+
+    def _advance(self, start):
+        """
+        Moves the window forward so it ends at the bucket starting at start.
+        """
+        self.newest = start
+        oldest = self.window_start()
+        expired = [s for s in self.buckets if s < oldest]
+        if len(expired) == len(self.buckets):
+            self.total = CountMinSketch(self.width, self.depth)
+            self.top_terms = TopK(self.capacity)
+        else:
+            for s in expired:
+                self.total.subtract(self.buckets[s].sketch)
+            self.stale = self.stale or bool(expired)
+        for s in expired:
+            del self.buckets[s]
+            self.pending.pop(s, None)
+
+    def _rescore(self):
+        """
+        Recomputes the window's top terms after counts were taken away or merged in.
+        The candidates are the top terms of every bucket and of the window before.
+        """
+        candidates = set(self.top_terms.counts)
+        for bucket in self.buckets.values():
+            candidates.update(bucket.top.counts)
+        self.top_terms = TopK(self.capacity, ((term, self.total.estimate(term)) for term in candidates))
+        self.stale = False
+
+    def top(self, n=10):
+        """
+        Lists the hashtags with the most uses in the window.
+
+        Args:
+            n (int): Number of hashtags to list.
+
+        Returns:
+            list: (hashtag, estimated count) pairs, highest first.
+        """
+        with self.lock:
+            if self.stale:
+                self._rescore()
+            return heapq.nlargest(n, self.top_terms.counts.items(), key=operator.itemgetter(1))
+
+    def count(self, tag):
+        """
+        Estimates the uses of a hashtag in the window.
+
+        Args:
+            tag (str): The normalized hashtag.
+
+        Returns:
+            int: The estimated count, never below the true one.
+        """
+        with self.lock:
+            return self.total.estimate(tag)
+
+    def load(self, records):
+        """
+        Replaces the counts with saved buckets.
+
+        Args:
+            records (iterable): (bucket start, record) pairs, record being a dict with 'sketch' bytes and 'top' pairs.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.clear()
+            records = dict(records)
+            if not records:
+                return
+            self.newest = max(records)
+            oldest = self.window_start()
+            for start, record in records.items():
+                if start >= oldest:
+                    bucket = self.buckets[start] = Bucket(self.width, self.depth, self.capacity, record)
+                    self.total.merge(bucket.sketch)
+            self._rescore()
+
+    def save(self, read_bucket, write_bucket):
+        """
+        Adds the counts made since the last save to the stored buckets.
+        Each bucket is read, merged and written back; if write_bucket reports
+        that another writer changed the bucket in between, it is read again.
+        Buckets other processes added to are taken over in memory as well.
+
+        Args:
+            read_bucket (function): read_bucket(start) returns the stored record of a bucket, or None.
+            write_bucket (function): write_bucket(start, record, previous) stores a record and returns
+                False if the stored one is no longer previous, the value read_bucket returned.
+
+        Returns:
+            int: The number of buckets written.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            written = 0
+            try:
+                for start in sorted(pending):
+                    counts = pending[start]
+                    while True:
+                        previous = read_bucket(start)
+                        merged = Bucket(self.width, self.depth, self.capacity, previous)
+                        for tag, count in counts.items():
+                            merged.add(tag, count)
+                        if write_bucket(start, merged.record(), previous):
+                            break
+                    del pending[start]
+                    written += 1
+                    local = self.buckets[start]
+                    if merged.sketch.counts != local.sketch.counts:
+                        self.total.subtract(local.sketch)
+                        self.total.merge(merged.sketch)
+                        self.buckets[start] = merged
+                        self.stale = True
+            except Exception:
+                # Keep the counts that were not saved for the next try
+                for start, counts in pending.items():
+                    if start in self.buckets:
+                        self.pending.setdefault(start, collections.Counter()).update(counts)
+                raise
+            return written
@@ -0,0 +1,632 @@
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+import bson
+from bson import ObjectId
+from bson.codec_options import CodecOptions
+from pymongo import MongoClient
+
+# The corpus generator is shared with the SQL benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.corpus import (WORDS, FIRST_NAMES, CITIES, SCALES, generate_tweets, hashtag_stream, corpus_size,
+                           generate_activity, tweet_document, hashtag_name, random_text, random_word, zipf_rank)
+from common.harness import Recorder, percentile, row_cost
+from common.querystats import from_environment
+from common.trending import Trending
+
+from loader import open_input, load_stream, add_hashtags, Progress
+from pipeline import load_parallel, serial_load
+from indexes import build_indexes, ensure_indexes
+import search
+import ranking
+import trending
+import users
+from records import Tweet, User
+from lazy import LAZY_OPTIONS, inflate, lazy_collection
+from writebuffer import WriteBuffer
+from ids import Snowflake, lease_worker_id
+from instrument import InstrumentedCollection
+
+def prepare_collection(db, n, name='bench_tweets', workers=None):
+    """
+    Returns a scratch collection holding n generated tweets with the tweetbook indexes.
+    An existing collection of the right size is reused, since loading millions of
+    tweets takes far longer than the queries being measured.
+
+    Args:
+        db (Database): The benchmark database.
+        n (int): Number of tweets wanted.
+        name (str): Name of the scratch collection.
+        workers (int): Parse processes for the load, defaults to the CPU count.
+
+    Returns:
+        Collection: The loaded collection.
+    """
+    collection = db[name]
+    if collection.estimated_document_count() == n:
+        # Collections kept from before the hashtags array existed get it now
+        ensure_indexes(collection)
+        search.ensure_hashtags(collection)
+        return collection
+    collection.drop()
+    path = 'bench-{}.json'.format(n)
+    if not os.path.exists(path):
+        generate_tweets(path, n)
+    load_parallel(collection, path, workers or os.cpu_count() or 1, progress=Progress(0))
+    build_indexes(collection)
+    return collection
+
+def time_calls(fn, inputs, repeat):
+    """
+    Times fn over every input, repeat times each.
+
+    Args:
+        fn (function): The function to time; called with one input.
+        inputs (list): The inputs to call fn with.
+        repeat (int): Number of passes over the inputs.
+
+    Returns:
+        list: The latency of every call in milliseconds.
+    """
+    samples = []
+    for _ in range(repeat):
+        for item in inputs:
+            start = time.perf_counter()
+            fn(item)
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+def report_latency(name, samples):
+    """
+    Prints the p50/p95/p99 latency of a list of samples in milliseconds.
+    """
+    print('{:<28} p50 {:>9.2f} ms  p95 {:>9.2f} ms  p99 {:>9.2f} ms  ({} calls)'.format(
+        name, percentile(samples, 50), percentile(samples, 95), percentile(samples, 99), len(samples)))
+
+def first_page(collection, keywords, page_size, text):
+    """
+    Reads the first page of a tweet search the way the app does, newest first.
+
+    Args:
+        collection (Collection): The tweet collection.
+        keywords (list): The keywords to match.
+        page_size (int): Number of tweets per page.
+        text (bool): Find candidates through the indexes; False uses the regex scan.
+
+    Returns:
+        list: The tweets on the page as Tweet records.
+    """
+    return search.tweet_pager(collection, keywords, page_size=page_size, text=text).fetch()
+
+def bench_search(db, args):
+    """
+    Compares the full-scan regex search with the text index search.
+
+    Args:
+        db (Database): The benchmark database.
+        args (Namespace): Parsed command-line arguments.
+
+    Returns:
+        None
+    """
+    collection = prepare_collection(db, args.n)
+    rng = random.Random(args.seed)
+    queries = [rng.sample(WORDS, rng.randint(1, 3)) for _ in range(args.queries)]
+
+    print('collection: {} tweets, {} queries x {}'.format(args.n, len(queries), args.repeat))
+    report_latency('regex scan', time_calls(
+        lambda kw: first_page(collection, kw, args.limit, False), queries, args.repeat))
+    report_latency('text index + post-filter', time_calls(
+        lambda kw: first_page(collection, kw, args.limit, True), queries, args.repeat))
+
+    # A single hashtag: regex over content vs the multikey hashtags index
+    tags = [['#' + word] for word in rng.sample(WORDS, min(len(WORDS), args.queries))]
+    report_latency('hashtag regex scan', time_calls(
+        lambda kw: first_page(collection, kw, args.limit, False), tags, args.repeat))
+    report_latency('hashtag index', time_calls(
+        lambda kw: first_page(collection, kw, args.limit, True), tags, args.repeat))
+
+def bench_topn(db, args):
+    """
+    Checks that ranking the top tweets reads only the metric index, and that its
+    latency stays flat as the collection grows.
+
+    Args:
+        db (Database): The benchmark database.
+        args (Namespace): Parsed command-line arguments.
+
+    Returns:
+        None
+    """
+    for n in args.sizes:
+        collection = prepare_collection(db, n, name='bench_tweets_{}'.format(n))
+        for criteria in ranking.METRIC_INDEXES:
+            stats = ranking.explain_rank(collection, criteria, args.top)
+            samples = time_calls(lambda _: ranking.rank_tweets(collection, criteria, args.top), range(args.repeat), 1)
+            report_latency('{} {} keys/docs {}/{}'.format(
+                n, criteria, stats['totalKeysExamined'], stats['totalDocsExamined']), samples)
+            if stats['totalDocsExamined'] != 0:
+                print('  WARNING: ranking by {} fetched documents, the query is not covered'.format(criteria))
+
+def bench_compose(db, args):
+    """
+    Compares one insert_one per composed tweet with the write-behind buffer.
+
+    Args:
+        db (Database): The benchmark database.
+        args (Namespace): Parsed command-line arguments.
+
+    Returns:
+        None
+    """
+    rng = random.Random(args.seed)
+    tweet_ids = Snowflake(lease_worker_id(db['counters']))
+
+    def composed(i):
+        return {
+            "date": '2021-03-30T03:33:46+00:00',
+            "content": ' '.join(rng.choice(WORDS) for _ in range(8)) + ' #' + rng.choice(WORDS),
+            "id": tweet_ids.next_id(),
+            "user": {"username": "user{}".format(i % 1000), "followersCount": None},
+        }
+
+    def run(name, write, finish):
+        db['bench_compose'].drop()
+        db['bench_compose_users'].drop()
+        start = time.perf_counter()
+        for i in range(args.n):
+            write(composed(i))
+        finish()
+        elapsed = time.perf_counter() - start
+        print('{:<26} {:>8} tweets {:>8.2f}s {:>10.0f} writes/s'.format(name, args.n, elapsed, args.n / elapsed))
+
+    run('insert_one', db['bench_compose'].insert_one, lambda: None)
+    for size in args.sizes:
+        buffer = WriteBuffer(db['bench_compose'], db['bench_compose_users'], max_docs=size, max_delay=args.delay)
+        run('buffered ({} / {}s)'.format(size, args.delay), buffer.add, buffer.close)
+    db['bench_compose'].drop()
+    db['bench_compose_users'].drop()
+
+def bench_load(db, args):
+    """
+    Compares the original serial load loop with the streaming and parallel loaders.
+
+    Args:
+        db (Database): The benchmark database.
+        args (Namespace): Parsed command-line arguments.
+
+    Returns:
+        None
+    """
+    path = args.path
+    if path is None:
+        path = generate_tweets('bench-{}.json'.format(args.n), args.n)
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+
+    def run(name, load):
+        collection = db['bench_load']
+        collection.drop()
+        start = time.perf_counter()
+        docs = load(collection)
+        elapsed = time.perf_counter() - start
+        print('{:<22} {:>10} docs {:>8.2f}s {:>10.0f} docs/s {:>8.2f} MB/s'.format(
+            name, docs, elapsed, docs / elapsed, size_mb / elapsed))
+
+    def stream(collection):
+        with open_input(path) as file:
+            return load_stream(collection, file, args.batch_size, args.window, Progress(0)).docs
+
+    print('input: {} ({:.1f} MB)'.format(path, size_mb))
+    run('serial (original)', lambda c: serial_load(c, path, args.batch_size))
+    run('streaming', stream)
+    for workers in args.workers:
+        run('parallel x{}'.format(workers),
+            lambda c: load_parallel(c, path, workers, args.batch_size, args.window, progress=Progress(0)).docs)
+        run('parallel x{} (json)'.format(workers),
+            lambda c: load_parallel(c, path, workers, args.batch_size, args.window, fast=False, progress=Progress(0)).docs)
+    db['bench_load'].drop()
+
+def exact_trending(collection, since, n):
+    """
+    Counts the n most used hashtags since a date with a $group over the tweets, as the benchmark baseline.
+    """
+    return list(collection.aggregate([
+        {"$match": {"date": {"$gte": since}}},
+        {"$unwind": "$hashtags"},
+        {"$group": {"_id": "$hashtags", "count": {"$sum": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": n},
+    ], allowDiskUse=True))
+
+def bench_trending(db, args):
+    """
+    Compares the trending engine with an exact $group over the tweets of the last
+    day: time to count and rebuild, latency of the top list, and how close the
+    estimated list is to the exact one.
+
+    Args:
+        db (Database): The benchmark database.
+        args (Namespace): Parsed command-line arguments.
+
+    Returns:
+        None
+    """
+    collection = db['bench_trending']
+    buckets = db['bench_trending_buckets']
+    collection.drop()
+    events = list(hashtag_stream(args.n, args.days, args.tags, seed=args.seed))
+    for i in range(0, len(events), 10000):
+        collection.insert_many([
+            {"date": datetime.fromtimestamp(when, timezone.utc).isoformat(), "hashtags": tags}
+            for when, tags in events[i:i + 10000]], ordered=False)
+    # The window is found and filtered through the date index
+    collection.create_index([("date", -1)])
+
+    engine = Trending()
+    start = time.perf_counter()
+    for when, tags in events:
+        engine.add(tags, when)
+    counted = time.perf_counter() - start
+    start = time.perf_counter()
+    trending.rebuild_trending(collection, buckets, engine)
+    rebuilt = time.perf_counter() - start
+    print('{} tweets over {} days, {} hashtags'.format(args.n, args.days, args.tags))
+    print('count {:.1f} us/tweet   rebuild from the collection {:.2f}s'.format(counted / args.n * 1e6, rebuilt))
+
+    since = datetime.fromtimestamp(engine.window_start(), timezone.utc).isoformat()
+    report_latency('sketch + top-K', time_calls(lambda _: engine.top(args.top), range(args.repeat), 1))
+    report_latency('$group', time_calls(lambda _: exact_trending(collection, since, args.top), range(max(1, args.repeat // 100)), 1))
+
+    exact = exact_trending(collection, since, args.top)
+    found = len({tag for tag, _ in engine.top(args.top)} & {row["_id"] for row in exact})
+    error = max(engine.count(row["_id"]) / row["count"] - 1 for row in exact)
+    print('top {}: {} of {} hashtags match the exact list, counts at most {:.2%} high'.format(
+        args.top, found, len(exact), error))
+    collection.drop()
+    buckets.drop()
+
+def sample_tweets(n, seed=291):
+    """
+    Returns n generated tweet documents with an _id each, as they are stored.
+    """
+    tweets = [tweet_document(tweet, n) for kind, tweet in generate_activity(n, n, seed=seed, retweets=0) if kind == 'tweet']
+    for doc in tweets:
+        doc['_id'] = ObjectId()
+    return tweets
+
+def listing_fields(doc):
+    """
+    Returns a tweet document projected to the search listing fields, as the server returns it.
+    """
+    return {field: doc[field] for field in ('_id', 'id', 'date', 'content')} | {'user': {'username': doc['user']['username']}}
+
+def bench_records(db, args):
+    """
+    Compares keeping the listing rows as decoded documents, as the menus did before,
+    with keeping them as Tweet and User records: time, memory kept and peak while
+    decoding, and memory blocks kept, per 10,000 rows. The rows are decoded from
+    BSON the way the driver decodes a reply, so no server is needed.
+    The top users listing used to keep whole user rows; it now projects the listing fields.
+
+    Args:
+        db (Database): The benchmark database, not used.
+        args (Namespace): Parsed command-line arguments.
+
+    Returns:
+        None
+    """
+    tweets = sample_tweets(args.n, args.seed)
+    listed = [bson.encode(listing_fields(doc)) for doc in tweets]
+    rows = [{'_id': doc['user']['username'], 'followersCount': doc['user']['followersCount'],
+             'displayname': doc['user']['displayname'], 'location': doc['user']['location'],
+             'user': doc['user'], 'username': doc['user']['username']} for doc in tweets]
+    full_rows = [bson.encode(row) for row in rows]
+    top_rows = [bson.encode({field: row[field] for field in ('_id', 'displayname', 'followersCount')}) for row in rows]
+
+    variants = [
+        ('tweets', 'projected documents', lambda: [bson.decode(raw) for raw in listed]),
+        ('tweets', 'Tweet records', lambda: [Tweet.from_doc(bson.decode(raw)) for raw in listed]),
+        ('users', 'whole user rows', lambda: [bson.decode(raw) for raw in full_rows]),
+        ('users', 'projected documents', lambda: [bson.decode(raw) for raw in top_rows]),
+        ('users', 'User records', lambda: [User.from_doc(bson.decode(raw)) for raw in top_rows]),
+    ]
+    print('{} tweets and user rows; per 10,000 rows:'.format(args.n))
+    print('{:<7} {:<20} {:>8} {:>10} {:>10} {:>8}'.format('rows', 'kept as', 'ms', 'kept KB', 'peak KB', 'blocks'))
+    for table, name, build in variants:
+        cost = row_cost(build, args.n, args.repeat)
+        print('{:<7} {:<20} {:>8.2f} {:>10.1f} {:>10.1f} {:>8}'.format(
+            table, name, cost['ms'], cost['kept_kb'], cost['peak_kb'], cost['blocks']))
+
+def bench_decode(db, args):
+    """
+    Measures the decode time and memory of a listing page and of a detail view.
+    Each page is one BSON batch decoded with decode_all, as the driver decodes a
+    reply, so no server is needed. A page is read from whole or projected
+    documents, decoded into dicts or lazily as RawBSONDocument, and kept as the
+    documents or as Tweet records. A detail document is kept in the cache decoded
+    or raw; a raw one is decoded in full when it is shown.
+
+    Args:
+        db (Database): The benchmark database, not used.
+        args (Namespace): Parsed command-line arguments.
+
+    Returns:
+        None
+    """
+    tweets = sample_tweets(args.n, args.seed)
+    whole = [bson.encode(doc) for doc in tweets]
+    listed = [bson.encode(listing_fields(doc)) for doc in tweets]
+
+    def pages(raws):
+        return [b''.join(raws[i:i + args.page]) for i in range(0, len(raws), args.page)]
+
+    def read(batches, options, record=None):
+        rows = []
+        for batch in batches:
+            docs = bson.decode_all(batch, options)
+            rows.append(docs if record is None else [record.from_doc(doc) for doc in docs])
+        return rows
+
+    eager = CodecOptions()
+    whole_pages, listed_pages = pages(whole), pages(listed)
+    print('{} tweets of {:.0f} bytes, {} bytes projected; pages of {}'.format(
+        args.n, sum(map(len, whole)) / args.n, round(sum(map(len, listed)) / args.n), args.page))
+    print('{:<19} {:<24} {:>8} {:>10} {:>10} {:>8}'.format('per page', 'kept as', 'ms', 'kept KB', 'peak KB', 'blocks'))
+    for source, name, build in (
+            ('whole documents', 'dicts', lambda: read(whole_pages, eager)),
+            ('whole documents', 'Tweet records', lambda: read(whole_pages, eager, Tweet)),
+            ('whole documents', 'lazy Tweet records', lambda: read(whole_pages, LAZY_OPTIONS, Tweet)),
+            ('projected', 'dicts', lambda: read(listed_pages, eager)),
+            ('projected', 'Tweet records', lambda: read(listed_pages, eager, Tweet)),
+            ('projected', 'lazy Tweet records', lambda: read(listed_pages, LAZY_OPTIONS, Tweet))):
+        cost = row_cost(build, args.n, args.repeat, per=args.page)
+        print('{:<19} {:<24} {:>8.3f} {:>10.1f} {:>10.1f} {:>8}'.format(
+            source, name, cost['ms'], cost['kept_kb'], cost['peak_kb'], cost['blocks']))
+
+    raw_docs = read(whole_pages, LAZY_OPTIONS)
+    print('{:<19} {:<24} {:>8} {:>10} {:>10} {:>8}'.format('per document', 'detail', 'ms', 'kept KB', 'peak KB', 'blocks'))
+    for name, build in (
+            ('cached decoded', lambda: read(whole_pages, eager)),
+            ('cached raw', lambda: read(whole_pages, LAZY_OPTIONS)),
+            ('raw decoded to show', lambda: [inflate(doc) for page in raw_docs for doc in page])):
+        cost = row_cost(build, args.n, args.repeat, per=1)
+        print('{:<19} {:<24} {:>8.4f} {:>10.2f} {:>10.2f} {:>8}'.format(
+            '', name, cost['ms'], cost['kept_kb'], cost['peak_kb'], cost['blocks']))
+
+def load_corpus(collection, tweets, user_count, follows, tags, seed=291, batch_size=1000):
+    """
+    Fills a collection with the tweets of a generated corpus, shaped like the dumps.
+    Retweets are left out: the dumps only carry them as counters, which the generated tweets have.
+
+    Args:
+        collection (Collection): The tweet collection, empty.
+        tweets (int): Number of tweets.
+        user_count (int): Number of users.
+        follows (int): Mean accounts followed per user, for the followersCount of the users.
+        tags (int): Number of distinct hashtags.
+        seed (int): Random seed.
+        batch_size (int): Documents per insert_many.
+
+    Returns:
+        None
+    """
+    batch = []
+    for kind, tweet in generate_activity(tweets, user_count, tags, seed=seed):
+        if kind != 'tweet':
+            continue
+        batch.append(add_hashtags(tweet_document(tweet, user_count, follows)))
+        if len(batch) >= batch_size:
+            collection.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+
+def bench_suite(db, args):
+    """
+    Runs every hot path of the application on a generated corpus and reports
+    latency percentiles, throughput and memory per scenario, optionally as JSON
+    for comparing commits. The MongoDB application has no feeds, follows or
+    retweets, so those scenarios only exist in the SQL suite.
+
+    Args:
+        db (Database): The benchmark database.
+        args (Namespace): Parsed command-line arguments.
+
+    Returns:
+        None
+    """
+    tweets = args.tweets or SCALES[args.scale]
+    sizes = corpus_size(tweets)
+    user_count = args.users or sizes['users']
+    # Per-query timings and plans of the read scenarios when TWEETBOOK_QUERY_STATS is set; they slow every call down
+    query_stats = from_environment()
+    recorder = Recorder({'backend': 'mongodb', 'server': db.client.server_info()['version'], 'tweets': tweets,
+                         'users': user_count, 'follows': args.follows, 'tags': sizes['tags'], 'ops': args.ops,
+                         'pages': args.pages, 'top': args.top, 'seed': args.seed, 'trace_memory': args.trace_memory,
+                         'query_stats': query_stats is not None, 'lazy_decode': not args.eager_decode},
+                        trace_memory=args.trace_memory)
+
+    # The generated collections are kept and reused, since loading takes far longer than the queries
+    name = 'suite_{}_{}_{}'.format(tweets, user_count, args.seed)
+    collection = db[name]
+    users_collection = db[name + '_users']
+    buckets = db[name + '_trending']
+    if args.rebuild or collection.estimated_document_count() != tweets:
+        for c in (collection, users_collection, buckets):
+            c.drop()
+        with recorder.scenario('load'):
+            recorder.time('load', load_corpus, collection, tweets, user_count, args.follows, sizes['tags'], args.seed,
+                          items=tweets)
+        with recorder.scenario('build_indexes'):
+            recorder.time('build_indexes', build_indexes, collection)
+        with recorder.scenario('rebuild_users'):
+            recorder.time('rebuild_users', users.rebuild_users, collection, users_collection)
+    else:
+        users.ensure_users(collection, users_collection)
+    engine = Trending()
+    with recorder.scenario('load_trending'):
+        recorder.time('load_trending', trending.ensure_trending, collection, buckets, engine)
+    # The listings and lookups read as service.Database reads them
+    reads, user_reads = collection, users_collection
+    if not args.eager_decode:
+        reads, user_reads = lazy_collection(collection), lazy_collection(users_collection)
+    if query_stats is not None:
+        collection = InstrumentedCollection(collection, query_stats)
+        reads = InstrumentedCollection(reads, query_stats)
+        user_reads = InstrumentedCollection(user_reads, query_stats)
+
+    rng = random.Random(args.seed)
+    def some_user():
+        return 'user{}'.format(zipf_rank(rng, user_count) + 1)
+
+    def run(name, call, inputs):
+        with recorder.scenario(name):
+            for item in inputs:
+                call(item)
+
+    def page_through(name, pager):
+        recorder.time(name, pager.fetch)
+        for _ in range(args.pages - 1):
+            if not pager.next():
+                break
+            recorder.time(name, pager.fetch)
+
+    # A tweet or profile is decoded in full to be shown
+    def fetch_tweet(_id):
+        return inflate(search.fetch_tweet(reads, _id))
+
+    def fetch_user(username):
+        return inflate(users.fetch_user(user_reads, username))
+
+    run('search_tweets', lambda kw: page_through('search_tweets', search.tweet_pager(reads, kw)),
+        [[random_word(rng) for _ in range(rng.randint(1, 2))] for _ in range(args.ops)])
+    run('search_hashtag', lambda kw: page_through('search_hashtag', search.tweet_pager(reads, kw)),
+        [['#' + hashtag_name(zipf_rank(rng, sizes['tags']))] for _ in range(args.ops)])
+    run('search_users', lambda kw: page_through('search_users', users.user_pager(user_reads, kw)),
+        [rng.choice(FIRST_NAMES + [city.lower() for city in CITIES]) for _ in range(args.ops)])
+    ids = [doc['_id'] for doc in collection.aggregate([{'$sample': {'size': args.ops}}, {'$project': {'_id': 1}}])]
+    run('fetch_tweet', lambda _id: recorder.time('fetch_tweet', fetch_tweet, _id), ids)
+    run('fetch_user', lambda username: recorder.time('fetch_user', fetch_user, username),
+        [some_user() for _ in range(args.ops)])
+    for criteria in ranking.METRIC_INDEXES:
+        run('top_' + criteria, lambda n: recorder.time('top_' + criteria, ranking.top_tweets, reads, criteria, n),
+            [args.top] * args.ops)
+    run('top_users', lambda n: recorder.time('top_users', users.top_users, user_reads, n), [args.top] * args.ops)
+    run('top_hashtags', lambda n: recorder.time('top_hashtags', engine.top, n), [10] * args.ops)
+
+    # Composed tweets go to a scratch copy so the kept corpus stays as generated
+    composed, composed_users = db[name + '_compose'], db[name + '_compose_users']
+    composed.drop()
+    composed_users.drop()
+    buffer = WriteBuffer(composed, composed_users)
+    tweet_ids = Snowflake(lease_worker_id(db['counters']))
+    with recorder.scenario('compose'):
+        for i in range(args.ops):
+            tweet = {'id': i + 1, 'writer': zipf_rank(rng, user_count) + 1, 'text': random_text(rng), 'replyto': None,
+                     'date': datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+                     'retweetCount': None, 'likeCount': None, 'quoteCount': None}
+            doc = add_hashtags(tweet_document(tweet, user_count, args.follows))
+            doc['id'] = tweet_ids.next_id()
+            recorder.time('compose', buffer.add, doc)
+        buffer.close()
+    composed.drop()
+    composed_users.drop()
+
+    recorder.report()
+    if args.json:
+        recorder.save(args.json)
+    if query_stats is not None:
+        query_stats.save()
+    if not args.keep:
+        for c in (collection, users_collection, buckets):
+            c.drop()
+
+def main():
+    """
+    Runs one of the benchmarks against a scratch database on the given MongoDB server.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description='Tweetbook MongoDB benchmarks.')
+    parser.add_argument('port', help='port of the MongoDB server')
+    parser.add_argument('--db', default='291bench', help='scratch database to use (default: 291bench)')
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    load = sub.add_parser('load', help='serial vs streaming vs parallel bulk load throughput')
+    load.add_argument('--path', help='NDJSON file to load (default: generate one)')
+    load.add_argument('-n', type=int, default=200000, help='tweets to generate when no --path is given')
+    load.add_argument('--batch-size', type=int, default=1000)
+    load.add_argument('--window', type=int, default=4)
+    load.add_argument('--workers', type=int, nargs='+', default=[2, 4, os.cpu_count() or 1])
+    load.set_defaults(func=bench_load)
+
+    find = sub.add_parser('search', help='regex scan vs text index tweet search latency')
+    find.add_argument('-n', type=int, default=3000000, help='tweets in the benchmark collection')
+    find.add_argument('--queries', type=int, default=20, help='distinct keyword sets to run')
+    find.add_argument('--repeat', type=int, default=3)
+    find.add_argument('--limit', type=int, default=10, help='tweets per page, the first page is read per query')
+    find.add_argument('--seed', type=int, default=291)
+    find.set_defaults(func=bench_search)
+
+    topn = sub.add_parser('topn', help='covered top N ranking latency across collection sizes')
+    topn.add_argument('--sizes', type=int, nargs='+', default=[100000, 1000000, 3000000])
+    topn.add_argument('--top', type=int, default=10, help='tweets to rank')
+    topn.add_argument('--repeat', type=int, default=50)
+    topn.set_defaults(func=bench_topn)
+
+    compose = sub.add_parser('compose', help='sustained composed tweet writes per second')
+    compose.add_argument('-n', type=int, default=100000, help='tweets to compose')
+    compose.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 2000], help='buffer sizes to try')
+    compose.add_argument('--delay', type=float, default=1.0, help='buffer flush delay in seconds')
+    compose.add_argument('--seed', type=int, default=291)
+    compose.set_defaults(func=bench_compose)
+
+    trend = sub.add_parser('trending', help='trending engine vs exact $group over the last day')
+    trend.add_argument('-n', type=int, default=1000000, help='tweets to generate')
+    trend.add_argument('--days', type=int, default=7, help='days the tweets span')
+    trend.add_argument('--tags', type=int, default=50000, help='distinct hashtags')
+    trend.add_argument('--top', type=int, default=10, help='hashtags to list')
+    trend.add_argument('--repeat', type=int, default=1000)
+    trend.add_argument('--seed', type=int, default=291)
+    trend.set_defaults(func=bench_trending)
+
+    rows = sub.add_parser('records', help='listing rows as decoded documents vs Tweet and User records, per 10,000 rows')
+    rows.add_argument('-n', type=int, default=10000, help='tweets and user rows to decode')
+    rows.add_argument('--repeat', type=int, default=5, help='timed decodes per variant')
+    rows.add_argument('--seed', type=int, default=291)
+    rows.set_defaults(func=bench_records)
+
+    decode = sub.add_parser('decode', help='decode time and memory per listing page and detail view, eager vs lazy')
+    decode.add_argument('-n', type=int, default=10000, help='tweets to decode')
+    decode.add_argument('--page', type=int, default=10, help='tweets per listing page')
+    decode.add_argument('--repeat', type=int, default=5, help='timed decodes per variant')
+    decode.add_argument('--seed', type=int, default=291)
+    decode.set_defaults(func=bench_decode)
+
+    suite = sub.add_parser('suite', help='every hot path on a generated corpus, with percentiles, throughput and memory')
+    suite.add_argument('--scale', default='100k', choices=list(SCALES), help='corpus size in tweets')
+    suite.add_argument('--tweets', type=int, help='tweets to generate, instead of --scale')
+    suite.add_argument('--users', type=int, help='users to generate (default: one per 10 tweets)')
+    suite.add_argument('--follows', type=int, default=20, help='mean accounts followed per user')
+    suite.add_argument('--ops', type=int, default=1000, help='calls per scenario')
+    suite.add_argument('--pages', type=int, default=3, help='pages read per search')
+    suite.add_argument('--top', type=int, default=10, help='tweets and users in the top N listings')
+    suite.add_argument('--trace-memory', action='store_true', help='measure the Python heap peak of each scenario (slower)')
+    suite.add_argument('--eager-decode', action='store_true', help='decode every document in full, as TWEETBOOK_LAZY_DOCS=0 does')
+    suite.add_argument('--json', help='write the results to this file, - for standard output')
+    suite.add_argument('--keep', action='store_true', help='keep the generated collections for the next run')
+    suite.add_argument('--rebuild', action='store_true', help='generate the collections even if kept ones exist')
+    suite.add_argument('--seed', type=int, default=291)
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    client = MongoClient('mongodb://localhost:{}'.format(args.port))
+    args.func(client[args.db], args)
+
+if __name__ == "__main__":
+    main()
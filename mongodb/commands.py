@@ -0,0 +1,119 @@
+import argparse
+import os
+import sys
+
+from bson import ObjectId
+
+import service
+from tweetbook import CACHE_MB, CACHE_TTL, QUERY_STATS, LAZY_DOCS
+
+# The command script runner is shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.commands import run_commands
+
+def search_tweets(database, *keywords, page=1, scan=False):
+    """
+    One page of the tweets containing every keyword, newest first; #word matches the hashtag.
+    Whole words are found through the indexes; scan=yes finds parts of words with a full collection scan.
+    """
+    return service.search_tweets(database, list(keywords), int(page), scan in (True, 'yes', 'true', '1'))
+
+def search_users(database, keyword, page=1):
+    """
+    One page of the users whose display name or location contains the keyword.
+    """
+    return service.search_users(database, keyword, int(page))
+
+def tweet(database, _id):
+    """
+    The full document of a tweet, by the _id shown in the listings.
+    """
+    return service.fetch_tweet(database, ObjectId(_id))
+
+def user(database, username):
+    """
+    The full profile of a user.
+    """
+    return service.fetch_user(database, username)
+
+def top_tweets(database, n=10, by='retweetCount'):
+    """
+    The top n tweets by retweetCount, likeCount or quoteCount.
+    """
+    return service.top_tweets(database, by, int(n))
+
+def top_users(database, n=10):
+    """
+    The n users with the most followers.
+    """
+    return service.top_users(database, int(n))
+
+def trending(database, n=10):
+    """
+    The hashtags used most over the last day, as [hashtag, count] pairs.
+    """
+    return service.trending_hashtags(database, int(n))
+
+def compose(database, text):
+    """
+    Write a tweet as 291user.
+    """
+    return {'id': service.compose(database, text)['id']}
+
+def flush(database):
+    """
+    Write the buffered tweets now instead of within a second.
+    """
+    database.flush()
+    return {}
+
+def query_stats(database):
+    """
+    Latency, documents, plans and slow queries of the calls made so far; needs TWEETBOOK_QUERY_STATS.
+    """
+    if database.query_stats is None:
+        raise ValueError('query stats are off, set TWEETBOOK_QUERY_STATS to the file to write them to')
+    return database.query_stats.snapshot()
+
+COMMANDS = {
+    'search_tweets': search_tweets,
+    'search_users': search_users,
+    'tweet': tweet,
+    'user': user,
+    'top_tweets': top_tweets,
+    'top_users': top_users,
+    'trending': trending,
+    'compose': compose,
+    'flush': flush,
+    'query_stats': query_stats,
+}
+
+def main():
+    """
+    Runs a script of tweetbook commands without the menus and prints one JSON line per command.
+    Usage: python3 commands.py <port> [script]   (the script is read from standard input if not given)
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description='Run tweetbook commands from a script and print JSON lines.')
+    parser.add_argument('port')
+    parser.add_argument('script', nargs='?', help='file of commands, one per line (default: standard input)')
+    args = parser.parse_args()
+
+    database = service.Database(args.port, cache_mb=CACHE_MB, cache_ttl=CACHE_TTL, query_stats=QUERY_STATS,
+                                lazy=LAZY_DOCS)
+    try:
+        if args.script:
+            with open(args.script) as script:
+                failed = run_commands(COMMANDS, database, script)
+        else:
+            failed = run_commands(COMMANDS, database, sys.stdin)
+    finally:
+        database.close()
+        if QUERY_STATS is not None:
+            QUERY_STATS.save()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import threading
+import time
+
+# Twitter's Snowflake layout, which the tweet IDs in the dataset follow:
+# 41 bits of milliseconds since TWITTER_EPOCH, 10 bits of worker ID, 12 bits of sequence
+TWITTER_EPOCH = 1288834974657
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER = (1 << WORKER_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+
+# The counter document worker IDs are leased from
+WORKER_LEASE = 'snowflake_workers'
+
+class Snowflake:
+    """
+    Generator of 64-bit tweet IDs in the same format as the dataset's, so
+    composed tweets sort by ID in time order with the loaded ones.
+    IDs are unique across processes as long as each uses its own worker ID, see
+    lease_worker_id; within a process up to 4096 IDs are handed out per millisecond.
+    """
+    def __init__(self, worker_id):
+        """
+        Args:
+            worker_id (int): 0 to 1023, not used by any other process writing to the same collection.
+        """
+        if not 0 <= worker_id <= MAX_WORKER:
+            raise ValueError('worker ID {} is not between 0 and {}'.format(worker_id, MAX_WORKER))
+        self.worker_id = worker_id
+        self.last_ms = -1
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def next_id(self):
+        """
+        Hands out the next ID.
+
+        Returns:
+            int: The new ID.
+        """
+        with self.lock:
+            now = int(time.time() * 1000)
+            # Never go back in time if the clock is set back; keep counting from the last millisecond
+            if now <= self.last_ms:
+                now = self.last_ms
+                self.sequence = (self.sequence + 1) & MAX_SEQUENCE
+                if self.sequence == 0:
+                    # 4096 IDs used up in this millisecond, move on to the next one
+                    now += 1
+            else:
+                self.sequence = 0
+            self.last_ms = now
+            return ((now - TWITTER_EPOCH) << (WORKER_BITS + SEQUENCE_BITS)) | (self.worker_id << SEQUENCE_BITS) | self.sequence
+
+def lease_worker_id(counters):
+    """
+    Picks the worker ID for this process: TWEETBOOK_WORKER_ID if it is set, otherwise
+    the next one from a counter document, taken with one atomic $inc. Processes
+    started against the same database get different IDs until 1024 more have started.
+
+    Args:
+        counters (Collection): The collection holding the counter document.
+
+    Returns:
+        int: The worker ID.
+    """
+    configured = os.environ.get('TWEETBOOK_WORKER_ID')
+    if configured is not None:
+        return int(configured)
+    # return_document=True is ReturnDocument.AFTER: the count including this lease
+    doc = counters.find_one_and_update({'_id': WORKER_LEASE}, {'$inc': {'next': 1}}, upsert=True, return_document=True)
+    return (doc['next'] - 1) & MAX_WORKER
+
+def id_time(tweet_id):
+    """
+    Reads the creation time out of a Snowflake ID.
+
+    Args:
+        tweet_id (int): A tweet ID.
+
+    Returns:
+        float: Seconds since the Unix epoch.
+    """
+    return ((tweet_id >> (WORKER_BITS + SEQUENCE_BITS)) + TWITTER_EPOCH) / 1000
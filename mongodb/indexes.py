@@ -0,0 +1,76 @@
+import pymongo
+from pymongo import IndexModel
+
+# Case-insensitive comparison for the text fields users search on
+CASE_INSENSITIVE = {'locale': 'en', 'strength': 2}
+
+# Every index the tweetbook CLI relies on, keyed by name.
+# Numeric fields get no collation since it never affects how numbers compare.
+# MongoDB allows one text index per collection, so the user fields use collated
+# b-tree indexes instead of a second text index.
+INDEX_SPECS = [
+    IndexModel([("content", pymongo.TEXT)], name="content_text"),
+    IndexModel([("date", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)], name="date_id"),
+    # Multikey index on the normalized hashtags, so a hashtag search is an index lookup
+    IndexModel([("hashtags", pymongo.ASCENDING)], name="hashtags"),
+    IndexModel([("user.displayname", pymongo.ASCENDING)], name="user_displayname", collation=CASE_INSENSITIVE),
+    IndexModel([("user.location", pymongo.ASCENDING)], name="user_location", collation=CASE_INSENSITIVE),
+    IndexModel([("user.followersCount", pymongo.DESCENDING)], name="user_followersCount"),
+    # _id is part of the metric indexes so ranking the top tweets is a covered, index-only read
+    IndexModel([("retweetCount", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)], name="retweetCount_id"),
+    IndexModel([("likeCount", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)], name="likeCount_id"),
+    IndexModel([("quoteCount", pymongo.DESCENDING), ("_id", pymongo.ASCENDING)], name="quoteCount_id"),
+]
+
+# Indexes on the materialized users collection, see users.py
+USER_INDEX_SPECS = [
+    IndexModel([("followersCount", pymongo.DESCENDING)], name="followersCount"),
+    # No stemming or stop words, so the index matches whole words like the old \b...\b regexes
+    IndexModel([("displayname", pymongo.TEXT), ("location", pymongo.TEXT)], name="displayname_location_text", default_language="none"),
+]
+
+def build_indexes(collection, specs=INDEX_SPECS):
+    """
+    Builds all the given indexes with a single create_indexes command.
+    The server builds them together in one scan of the collection, so this
+    should be called once after a bulk load rather than before it.
+
+    Args:
+        collection (Collection): The collection to index.
+        specs (list): The IndexModel specs to build.
+
+    Returns:
+        list: The names of the indexes built.
+    """
+    if not specs:
+        return []
+    return collection.create_indexes(specs)
+
+def missing_indexes(collection, specs=INDEX_SPECS):
+    """
+    Finds the specs that do not have an index with the same name on the collection yet.
+
+    Args:
+        collection (Collection): The collection to check.
+        specs (list): The IndexModel specs expected to exist.
+
+    Returns:
+        list: The IndexModel specs that are missing.
+    """
+    existing = collection.index_information()
+    return [spec for spec in specs if spec.document["name"] not in existing]
+
+def ensure_indexes(collection, specs=INDEX_SPECS):
+    """
+    Creates any missing indexes and leaves existing ones alone.
+    Safe to call on every startup: when everything is in place it costs a
+    single listIndexes round trip and never triggers a rebuild.
+
+    Args:
+        collection (Collection): The collection to index.
+        specs (list): The IndexModel specs expected to exist.
+
+    Returns:
+        list: The names of the indexes that had to be created.
+    """
+    return build_indexes(collection, missing_indexes(collection, specs))
@@ -0,0 +1,234 @@
+import json
+import os
+import sys
+import time
+
+# The stats collection and export are shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.querystats import caller_name, query_shape
+
+# Pipeline stages that write, so the pipeline must not be run again by explain
+WRITE_STAGES = ("$out", "$merge")
+
+def find_key(doc, key):
+    """
+    Returns the first value of key found anywhere in a nested explain document, or None.
+    """
+    if isinstance(doc, dict):
+        if key in doc:
+            return doc[key]
+        values = doc.values()
+    elif isinstance(doc, list):
+        values = doc
+    else:
+        return None
+    for value in values:
+        found = find_key(value, key)
+        if found is not None:
+            return found
+    return None
+
+def plan_stages(plan):
+    """
+    Lists the stages of a winning plan from the root down, e.g. ['LIMIT', 'FETCH', 'IXSCAN'].
+    """
+    stages = []
+    while isinstance(plan, dict):
+        plan = plan.get("queryPlan", plan)
+        if "stage" in plan:
+            stages.append(plan["stage"] + (" " + plan["indexName"] if "indexName" in plan else ""))
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return stages
+
+def explain(collection, command):
+    """
+    Runs a find or aggregate command with explain("executionStats") and summarizes it.
+
+    Args:
+        collection (Collection): The plain collection.
+        command (dict): The find or aggregate command.
+
+    Returns:
+        dict: scanned (documents examined), full_scans (COLLSCAN stages) and detail.
+    """
+    result = collection.database.command("explain", command, verbosity="executionStats")
+    stats = find_key(result, "executionStats") or {}
+    stages = plan_stages(find_key(result, "winningPlan"))
+    return {
+        "scanned": stats.get("totalDocsExamined"),
+        "full_scans": [stage for stage in stages if stage.startswith("COLLSCAN")],
+        "detail": [
+            " > ".join(stages),
+            "keys examined: {}".format(stats.get("totalKeysExamined")),
+            "documents examined: {}".format(stats.get("totalDocsExamined")),
+            "returned: {}".format(stats.get("nReturned")),
+        ],
+    }
+
+class InstrumentedCursor:
+    """
+    Wraps a find or aggregate cursor to time it from the call that created it to its last
+    document and count the documents. The options chained onto a find cursor (sort,
+    limit, skip, hint) are passed on and kept, so explain runs the same command.
+    The call is recorded once the cursor is exhausted or closed, or when it is freed.
+    """
+    def __init__(self, owner, name, op, command, cursor, seconds):
+        self.owner = owner
+        self.name = name
+        self.op = op
+        self.command = command
+        self.cursor = cursor
+        self.seconds = seconds
+        self.rows = 0
+        self.done = False
+
+    def sort(self, key_or_list, direction=None):
+        self.cursor.sort(key_or_list, direction)
+        pairs = [(key_or_list, direction or 1)] if isinstance(key_or_list, str) else key_or_list
+        self.command["sort"] = dict(pairs)
+        return self
+
+    def limit(self, limit):
+        self.cursor.limit(limit)
+        self.command["limit"] = limit
+        return self
+
+    def skip(self, skip):
+        self.cursor.skip(skip)
+        self.command["skip"] = skip
+        return self
+
+    def hint(self, index):
+        self.cursor.hint(index)
+        self.command["hint"] = index
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            doc = next(self.cursor)
+        except StopIteration:
+            self.seconds += time.perf_counter() - start
+            self.finish()
+            raise
+        self.seconds += time.perf_counter() - start
+        self.rows += 1
+        return doc
+
+    def finish(self, can_explain=True):
+        """
+        Records the call, explaining its query shape the first time it is seen.
+        """
+        if self.done:
+            return
+        self.done = True
+        self.owner.record(self.name, self.op, self.seconds, self.rows, self.command, can_explain=can_explain)
+
+    def close(self):
+        self.cursor.close()
+        self.finish()
+
+    def __del__(self):
+        # No explain while the cursor is being freed
+        try:
+            self.finish(can_explain=False)
+        except Exception:
+            pass
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+class InstrumentedCollection:
+    """
+    Wraps a collection so that its reads and writes are recorded in a QueryStats.
+    service.Database uses it when query stats are on; otherwise the collections are
+    plain pymongo ones and nothing is measured. Methods that are not wrapped are
+    passed straight to the collection.
+    """
+    def __init__(self, collection, query_stats):
+        """
+        Args:
+            collection (Collection): The collection to measure.
+            query_stats (QueryStats): Where the calls are recorded.
+        """
+        self.collection = collection
+        self.query_stats = query_stats
+
+    def __getattr__(self, attr):
+        return getattr(self.collection, attr)
+
+    def record(self, name, op, seconds, rows, command=None, error=False, can_explain=True):
+        """
+        Adds a call to the stats. find and aggregate commands that do not write are
+        explained once per query shape; explain runs after the call and is not timed.
+        """
+        plan = None
+        statement = None
+        if command is not None:
+            statement = json.dumps(command, default=str)
+            shape = "{} {} {}".format(self.collection.name, op, query_shape(command))
+            writes = any(stage in WRITE_STAGES for step in command.get("pipeline", ()) for stage in step)
+            if not writes:
+                plan = self.query_stats.plan(shape, (lambda: explain(self.collection, command)) if can_explain and not error else None)
+        self.query_stats.record(name, op, seconds, rows, statement, plan, error)
+
+    def find(self, filter=None, projection=None, *args, **kwargs):
+        name = caller_name()
+        command = {"find": self.collection.name, "filter": filter or {}}
+        if projection is not None:
+            command["projection"] = projection
+        start = time.perf_counter()
+        cursor = self.collection.find(filter, projection, *args, **kwargs)
+        return InstrumentedCursor(self, name, "find", command, cursor, time.perf_counter() - start)
+
+    def find_one(self, filter=None, projection=None, *args, **kwargs):
+        name = caller_name()
+        # find_one takes a bare _id as well as a filter
+        if filter is not None and not isinstance(filter, dict):
+            filter = {"_id": filter}
+        command = {"find": self.collection.name, "filter": filter or {}, "limit": 1}
+        if projection is not None:
+            command["projection"] = projection
+        if kwargs.get("sort"):
+            command["sort"] = dict(kwargs["sort"])
+        start = time.perf_counter()
+        try:
+            doc = self.collection.find_one(filter, projection, *args, **kwargs)
+        except Exception:
+            self.record(name, "find_one", time.perf_counter() - start, 0, command, error=True)
+            raise
+        self.record(name, "find_one", time.perf_counter() - start, int(doc is not None), command)
+        return doc
+
+    def aggregate(self, pipeline, *args, **kwargs):
+        name = caller_name()
+        command = {"aggregate": self.collection.name, "pipeline": pipeline, "cursor": {}}
+        start = time.perf_counter()
+        cursor = self.collection.aggregate(pipeline, *args, **kwargs)
+        return InstrumentedCursor(self, name, "aggregate", command, cursor, time.perf_counter() - start)
+
+    def insert_many(self, documents, *args, **kwargs):
+        name = caller_name()
+        start = time.perf_counter()
+        try:
+            result = self.collection.insert_many(documents, *args, **kwargs)
+        except Exception:
+            self.record(name, "insert_many", time.perf_counter() - start, 0, error=True)
+            raise
+        self.record(name, "insert_many", time.perf_counter() - start, len(result.inserted_ids))
+        return result
+
+    def bulk_write(self, requests, *args, **kwargs):
+        name = caller_name()
+        start = time.perf_counter()
+        try:
+            result = self.collection.bulk_write(requests, *args, **kwargs)
+        except Exception:
+            self.record(name, "bulk_write", time.perf_counter() - start, 0, error=True)
+            raise
+        changed = result.inserted_count + result.upserted_count + result.modified_count + result.deleted_count
+        self.record(name, "bulk_write", time.perf_counter() - start, changed)
+        return result
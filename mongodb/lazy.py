@@ -0,0 +1,36 @@
+from bson import decode
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+# Read with these options a document stays as its BSON bytes until one of its fields
+# is read, and an embedded document until one of its own fields is read
+LAZY_OPTIONS = CodecOptions(document_class=RawBSONDocument)
+
+def lazy_collection(collection):
+    """
+    Returns the same collection read lazily: its queries return RawBSONDocument.
+    A listing that builds records from a few fields then never decodes the rest,
+    and a cached document is kept as one bytes object instead of a tree of dicts.
+
+    Args:
+        collection (Collection): The collection.
+
+    Returns:
+        Collection: The collection with LAZY_OPTIONS.
+    """
+    return collection.with_options(codec_options=LAZY_OPTIONS)
+
+def inflate(doc):
+    """
+    Decodes a lazily read document, embedded documents included, into plain dicts,
+    for the detail screens that show every field.
+
+    Args:
+        doc (Mapping): A RawBSONDocument, a document that is already decoded, or None.
+
+    Returns:
+        dict: The decoded document, or doc itself if it is not raw.
+    """
+    if isinstance(doc, RawBSONDocument):
+        return decode(doc.raw)
+    return doc
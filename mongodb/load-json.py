@@ -1,41 +1,56 @@
-import json
-import pymongo
+import argparse
 from pymongo import MongoClient
-import sys
-
-client = MongoClient('mongodb://localhost:{}'.format(sys.argv[1]))
-
-# Open data base in MongoDB server
-db = client["291db"]
-
-# Open tweet_info collection in database
-infoCollection = db["tweet_info"]
-
-# Delete any existing documents in collection
-infoCollection.delete_many({})
-
-tweets = []
-
-# Load JSON file data to be inserted in collection into array
-# Change "json/10.json" to a variable
-with open(sys.argv[2], "r") as file:
-    for line in file:
-        try:
-            data = json.loads(line)
-            tweets.append(data)
-        except json.JSONDecodeError as e:
-            print(f"Error deconfing JSON: {e}")
-            continue
-
-# Enter tweets in batches of 1000
-for i in range(0, len(tweets), 1000):
-    batch = tweets[i:i + 1000]
-    infoCollection.insert_many(batch)
-
-# Create indexes with case-insensitive collation
-infoCollection.create_index([("content", "text")])
-infoCollection.create_index([("displayname", "text"), ("location", "text")], collation={'locale': 'en', 'strength': 2})
-infoCollection.create_index([("retweetCount", pymongo.DESCENDING)], collation={'locale': 'en', 'strength': 2})
-infoCollection.create_index([("likeCount", pymongo.DESCENDING)], collation={'locale': 'en', 'strength': 2})
-infoCollection.create_index([("quoteCount", pymongo.DESCENDING)], collation={'locale': 'en', 'strength': 2})
-infoCollection.create_index([("followersCount", pymongo.DESCENDING)], collation={'locale': 'en', 'strength': 2})
+
+from loader import open_input, load_stream, Progress
+from pipeline import is_splittable, load_parallel
+from indexes import build_indexes
+from users import rebuild_users
+from trending import rebuild_trending
+
+def main():
+    """
+    Loads an NDJSON tweet dump into the tweet_info collection and builds its indexes.
+
+    Returns:
+        None
+    """
+    parser = argparse.ArgumentParser(description='Load an NDJSON tweet dump into the tweet_info collection.')
+    parser.add_argument('port', help='port of the MongoDB server')
+    parser.add_argument('path', help='NDJSON file to load (plain, .gz or .zst), or "-" for stdin')
+    parser.add_argument('--batch-size', type=int, default=1000, help='documents per insert_many call (default: 1000)')
+    parser.add_argument('--window', type=int, default=4, help='maximum insert_many calls in flight (default: 4)')
+    parser.add_argument('--workers', type=int, default=0, help='parse processes for the parallel pipeline, 0 for the streaming loader (default: 0)')
+    parser.add_argument('--progress', type=float, default=5.0, help='seconds between progress lines, 0 to disable (default: 5)')
+    args = parser.parse_args()
+
+    client = MongoClient('mongodb://localhost:{}'.format(args.port))
+
+    # Open data base in MongoDB server
+    db = client["291db"]
+
+    # Open tweet_info collection in database
+    infoCollection = db["tweet_info"]
+
+    # Drop any existing documents and indexes, so the load does not maintain indexes per insert
+    infoCollection.drop()
+
+    if args.workers > 0 and is_splittable(args.path):
+        # Parse byte ranges of the file in worker processes while the writer threads insert
+        load_parallel(infoCollection, args.path, args.workers, args.batch_size, args.window, progress=Progress(args.progress))
+    else:
+        # Stream the JSON file into the collection in batches, never holding more than
+        # batch_size * window documents in memory
+        with open_input(args.path) as stream:
+            load_stream(infoCollection, stream, args.batch_size, args.window, Progress(args.progress))
+
+    # Build every index in one pass over the loaded collection
+    build_indexes(infoCollection)
+
+    # Collapse the loaded tweets into the users collection used for the top users list
+    rebuild_users(infoCollection, db["users"])
+
+    # Count the hashtags of the last day of tweets for the trending list
+    rebuild_trending(infoCollection, db["trending"])
+
+if __name__ == "__main__":
+    main()
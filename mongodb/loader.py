@@ -0,0 +1,208 @@
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from pymongo.errors import BulkWriteError
+
+# The text analysis is shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.entities import hashtag_keys
+from common.harness import peak_rss_mb
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+def open_input(path):
+    """
+    Opens an NDJSON input for binary line-by-line reading.
+    A path of "-" reads from stdin. Gzip and zstd input is detected from the
+    first bytes of the stream, so compressed stdin works as well.
+
+    Args:
+        path (str): Path to the input file, or "-" for stdin.
+
+    Returns:
+        file: A binary file object that yields decompressed lines.
+    """
+    if path == '-':
+        raw = sys.stdin.buffer
+    else:
+        raw = open(path, 'rb')
+
+    magic = raw.peek(4)[:4]
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=raw, mode='rb')
+    if magic.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise RuntimeError('zstd input requires the "zstandard" package (pip install zstandard)')
+        reader = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+        return io.BufferedReader(reader)
+    return raw
+
+class Progress:
+    """
+    Keeps running counters for a load and prints throughput to stderr.
+    """
+    def __init__(self, interval=5.0, out=sys.stderr):
+        self.interval = interval
+        self.out = out
+        self.docs = 0
+        self.bytes = 0
+        self.parse_errors = 0
+        self.write_errors = 0
+        self.start = time.monotonic()
+        self.last_report = self.start
+
+    def tick(self):
+        """
+        Prints a progress line if the report interval has passed.
+        """
+        now = time.monotonic()
+        if self.interval and now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self, final=False):
+        """
+        Prints the current docs/s, MB/s and error counts.
+
+        Args:
+            final (bool): Whether this is the summary line printed at the end of the load.
+        """
+        elapsed = max(time.monotonic() - self.start, 1e-9)
+        line = '{}{} docs | {:.0f} docs/s | {:.2f} MB/s | {} parse errors | {} write errors'.format(
+            'done: ' if final else '',
+            self.docs,
+            self.docs / elapsed,
+            self.bytes / elapsed / (1024 * 1024),
+            self.parse_errors,
+            self.write_errors)
+        if final:
+            line += ' | {:.1f}s | peak RSS {:.1f} MB'.format(elapsed, peak_rss_mb())
+        print(line, file=self.out)
+
+def add_hashtags(doc):
+    """
+    Stores the normalized hashtags of a tweet's content in its "hashtags" array.
+
+    Args:
+        doc (dict): A tweet document, changed in place.
+
+    Returns:
+        dict: The same document.
+    """
+    doc["hashtags"] = hashtag_keys(doc.get("content"))
+    return doc
+
+def iter_documents(stream, progress):
+    """
+    Lazily parses an NDJSON stream one line at a time.
+    Lines that fail to decode are counted and skipped.
+
+    Args:
+        stream (file): A binary file object.
+        progress (Progress): Counters updated with bytes read and parse errors.
+
+    Yields:
+        dict: One decoded tweet document per line, with its hashtags array added.
+    """
+    for lineno, line in enumerate(stream, start=1):
+        progress.bytes += len(line)
+        if not line.strip():
+            continue
+        try:
+            doc = json.loads(line)
+        except ValueError as e:
+            progress.parse_errors += 1
+            print(f"Error decoding JSON on line {lineno}: {e}", file=sys.stderr)
+            continue
+        yield add_hashtags(doc)
+
+def iter_batches(docs, size):
+    """
+    Groups an iterable of documents into lists of at most size documents.
+
+    Args:
+        docs (iterable): Documents to group.
+        size (int): The batch size.
+
+    Yields:
+        list: A batch of documents.
+    """
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def insert_batch(collection, batch):
+    """
+    Inserts a batch with an unordered insert_many so one bad document does not stop the rest.
+
+    Args:
+        collection (Collection): The target collection.
+        batch (list): The documents to insert.
+
+    Returns:
+        tuple: (inserted count, failed count)
+    """
+    try:
+        result = collection.insert_many(batch, ordered=False)
+        return len(result.inserted_ids), 0
+    except BulkWriteError as e:
+        failed = len(e.details.get('writeErrors', []))
+        return e.details.get('nInserted', len(batch) - failed), failed
+
+def load_stream(collection, stream, batch_size=1000, window=4, progress=None):
+    """
+    Streams documents from stream into collection.
+    At most window batches are in flight at once, so memory use is bounded by
+    batch_size * window documents no matter how large the input is.
+
+    Args:
+        collection (Collection): The target collection.
+        stream (file): A binary NDJSON stream, see open_input.
+        batch_size (int): Number of documents per insert_many call.
+        window (int): Maximum number of concurrent insert_many calls.
+        progress (Progress): Optional progress counters.
+
+    Returns:
+        Progress: The final counters.
+    """
+    if progress is None:
+        progress = Progress()
+
+    def collect(done):
+        for future in done:
+            inserted, failed = future.result()
+            progress.docs += inserted
+            progress.write_errors += failed
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=window) as pool:
+        for batch in iter_batches(iter_documents(stream, progress), batch_size):
+            # Block until a slot in the in-flight window frees up
+            while len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+                for future in done:
+                    pending.remove(future)
+            pending.append(pool.submit(insert_batch, collection, batch))
+            progress.tick()
+        collect(wait(pending)[0])
+
+    progress.report(final=True)
+    return progress
@@ -0,0 +1,106 @@
+import os
+import sys
+
+import pymongo
+
+# The query cache is shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.cache import query_key
+
+class KeysetPager:
+    """
+    Pages through a query in a fixed sort order without skip().
+    Each page starts right after the last key of the previous one, so every page
+    is a bounded index range read no matter how deep into the results it is.
+    Only the boundary keys of visited pages are kept, never the documents.
+    Given a record class, each document is turned into a listing record as it is
+    read, so the decoded documents are dropped right away.
+    """
+    def __init__(self, collection, query, projection=None, keys=(("date", pymongo.DESCENDING), ("_id", pymongo.DESCENDING)), page_size=10,
+                 cache=None, tags=(), record=None):
+        """
+        Args:
+            collection (Collection): The collection to page through.
+            query (dict): The filter to apply.
+            projection (dict): The fields to return for each document.
+            keys (tuple): (field, direction) pairs giving a unique sort order; the last should be _id.
+            page_size (int): Number of documents per page.
+            cache (QueryCache): Where to keep the pages read, so going back to one costs no query; None to always query.
+            tags (tuple): Tags a write can invalidate the cached pages by.
+            record (class): Builds the listing record of each document with from_doc; None keeps the documents.
+        """
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self.keys = list(keys)
+        self.page_size = page_size
+        self.cache = cache
+        self.tags = tags
+        self.record = record
+        self.bounds = [None]
+        self.page = 0
+        self.has_next = False
+
+    def _after(self, bound):
+        """
+        Builds the filter for documents that sort strictly after bound.
+        For keys (a, b) sorted descending this is a < a0 OR (a = a0 AND b < b0).
+        """
+        clauses = []
+        for i, (field, direction) in enumerate(self.keys):
+            clause = {f: bound[f] for f, _ in self.keys[:i]}
+            clause[field] = {"$lt" if direction == pymongo.DESCENDING else "$gt": bound[field]}
+            clauses.append(clause)
+        return {"$or": clauses}
+
+    def _key(self, doc):
+        return {field: doc.get(field) for field, _ in self.keys}
+
+    def fetch(self):
+        """
+        Loads the current page.
+
+        Returns:
+            list: The documents, or records, on the current page.
+        """
+        bound = self.bounds[self.page]
+        query = self.query if bound is None else {"$and": [self.query, self._after(bound)]}
+        # Ask for one extra document to find out whether there is a next page
+        def load():
+            cursor = self.collection.find(query, self.projection).sort(self.keys).limit(self.page_size + 1)
+            return list(cursor) if self.record is None else [self.record.from_doc(doc) for doc in cursor]
+
+        if self.cache is None:
+            docs = load()
+        else:
+            key = query_key(query, self.collection.name, self.projection, self.keys, self.page_size)
+            docs = self.cache.get(key, load, self.tags)
+        self.has_next = len(docs) > self.page_size
+        docs = docs[:self.page_size]
+        if self.has_next and len(self.bounds) == self.page + 1:
+            self.bounds.append(self._key(docs[-1]))
+        return docs
+
+    def next(self):
+        """
+        Moves to the next page if there is one.
+
+        Returns:
+            bool: True if the page changed.
+        """
+        if not self.has_next:
+            return False
+        self.page += 1
+        return True
+
+    def prev(self):
+        """
+        Moves to the previous page if there is one.
+
+        Returns:
+            bool: True if the page changed.
+        """
+        if self.page == 0:
+            return False
+        self.page -= 1
+        return True
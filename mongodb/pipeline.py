@@ -0,0 +1,180 @@
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from loader import Progress, insert_batch, add_hashtags, GZIP_MAGIC, ZSTD_MAGIC
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Size of the byte ranges handed to each parse worker
+CHUNK_SIZE = 16 * 1024 * 1024
+
+def is_splittable(path):
+    """
+    Checks whether an input can be split into byte ranges.
+    Only plain, uncompressed files on disk can be; stdin and compressed dumps
+    have to go through the streaming loader.
+
+    Args:
+        path (str): Path to the input file, or "-" for stdin.
+
+    Returns:
+        bool: True if the file can be read with split_ranges.
+    """
+    if path == '-' or not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    return not (magic.startswith(GZIP_MAGIC) or magic.startswith(ZSTD_MAGIC))
+
+def split_ranges(path, chunk_size=CHUNK_SIZE):
+    """
+    Splits an NDJSON file into byte ranges that each end on a line boundary.
+
+    Args:
+        path (str): Path to the input file.
+        chunk_size (int): Approximate size of each range in bytes.
+
+    Yields:
+        tuple: (start, end) byte offsets, end exclusive.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        start = 0
+        while start < size:
+            end = min(start + chunk_size, size)
+            if end < size:
+                # Move the end forward to just after the next newline
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            yield start, end
+            start = end
+
+def parse_range(path, start, end, batch_size, fast=True):
+    """
+    Parses one byte range of an NDJSON file in a worker process.
+    Hashtags are extracted and documents encoded to BSON here so the parent only receives bytes,
+    which are cheap to send between processes and are inserted as-is.
+
+    Args:
+        path (str): Path to the input file.
+        start (int): Start offset of the range.
+        end (int): End offset of the range, exclusive.
+        batch_size (int): Number of documents per returned batch.
+        fast (bool): Use orjson when it is installed.
+
+    Returns:
+        tuple: (list of batches of BSON bytes, bytes read, parse errors)
+    """
+    loads = orjson.loads if (fast and orjson is not None) else json.loads
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    batches = []
+    batch = []
+    errors = 0
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        try:
+            batch.append(bson.encode(add_hashtags(loads(line))))
+        except ValueError:
+            errors += 1
+            continue
+        if len(batch) >= batch_size:
+            batches.append(batch)
+            batch = []
+    if batch:
+        batches.append(batch)
+    return batches, len(data), errors
+
+def load_parallel(collection, path, workers, batch_size=1000, writers=4, fast=True, progress=None):
+    """
+    Loads an NDJSON file with a pool of parse processes feeding a pool of writer threads.
+    Parsing (CPU-bound) and inserting (I/O-bound) overlap instead of waiting on each other.
+    Both stages are bounded, so only a few chunks are held in memory at a time.
+
+    Args:
+        collection (Collection): The target collection.
+        path (str): Path to a plain NDJSON file, see is_splittable.
+        workers (int): Number of parse processes.
+        batch_size (int): Number of documents per insert_many call.
+        writers (int): Number of concurrent insert_many calls.
+        fast (bool): Use orjson in the parse workers when it is installed.
+        progress (Progress): Optional progress counters.
+
+    Returns:
+        Progress: The final counters.
+    """
+    if progress is None:
+        progress = Progress()
+
+    parsing = deque()
+    writing = deque()
+
+    def drain_writes(limit):
+        while len(writing) > limit:
+            done, _ = wait(writing, return_when=FIRST_COMPLETED)
+            for future in done:
+                inserted, failed = future.result()
+                progress.docs += inserted
+                progress.write_errors += failed
+                writing.remove(future)
+            progress.tick()
+
+    def hand_off(future):
+        batches, nbytes, errors = future.result()
+        progress.bytes += nbytes
+        progress.parse_errors += errors
+        for batch in batches:
+            drain_writes(writers * 2)
+            docs = [RawBSONDocument(raw) for raw in batch]
+            writing.append(write_pool.submit(insert_batch, collection, docs))
+
+    with ProcessPoolExecutor(max_workers=workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=writers) as write_pool:
+        for start, end in split_ranges(path):
+            # Keep every worker busy with one chunk queued behind it, but no more
+            while len(parsing) >= workers * 2:
+                hand_off(parsing.popleft())
+            parsing.append(parse_pool.submit(parse_range, path, start, end, batch_size, fast))
+        while parsing:
+            hand_off(parsing.popleft())
+        drain_writes(0)
+
+    progress.report(final=True)
+    return progress
+
+def serial_load(collection, path, batch_size=1000):
+    """
+    The original load-json.py loop: parse the whole file into a list, then insert it in batches.
+    Kept as the baseline for the load benchmark.
+
+    Args:
+        collection (Collection): The target collection.
+        path (str): Path to a plain NDJSON file.
+        batch_size (int): Number of documents per insert_many call.
+
+    Returns:
+        int: The number of documents inserted.
+    """
+    tweets = []
+    with open(path, "r") as file:
+        for line in file:
+            try:
+                tweets.append(json.loads(line))
+            except json.JSONDecodeError as e:
+                print(f"Error decoding JSON: {e}", file=sys.stderr)
+    for i in range(0, len(tweets), batch_size):
+        collection.insert_many(tweets[i:i + batch_size])
+    return len(tweets)
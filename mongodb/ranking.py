@@ -0,0 +1,97 @@
+import os
+import sys
+
+import pymongo
+
+from records import Tweet
+
+# The query cache is shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.cache import query_key
+
+# Index backing each metric the top tweets can be ranked by, see indexes.py
+METRIC_INDEXES = {
+    "retweetCount": "retweetCount_id",
+    "likeCount": "likeCount_id",
+    "quoteCount": "quoteCount_id",
+}
+
+# Fields shown in the top tweets listing
+LIST_PROJECTION = {"renderedContent": 1, "id": 1, "date": 1, "user.username": 1}
+
+def rank_tweets(collection, criteria, n):
+    """
+    Reads the _ids of the top n tweets by criteria straight from the metric index.
+    Only fields stored in the index are projected, so no documents are fetched.
+
+    Args:
+        collection (Collection): The tweet collection.
+        criteria (str): The metric to rank by, a key of METRIC_INDEXES.
+        n (int): Number of tweets to rank.
+
+    Returns:
+        list: The _ids of the top tweets, best first.
+    """
+    cursor = (collection.find({}, {"_id": 1, criteria: 1})
+              .sort([(criteria, pymongo.DESCENDING), ("_id", pymongo.ASCENDING)])
+              .hint(METRIC_INDEXES[criteria])
+              .limit(n))
+    return [doc["_id"] for doc in cursor]
+
+def load_rows(collection, ids):
+    """
+    Loads the listing fields of the given tweets, keeping the order of ids.
+
+    Args:
+        collection (Collection): The tweet collection.
+        ids (list): The _ids to load.
+
+    Returns:
+        list: The tweets as Tweet records, in the same order as ids.
+    """
+    by_id = {doc["_id"]: Tweet.from_doc(doc) for doc in collection.find({"_id": {"$in": ids}}, LIST_PROJECTION)}
+    return [by_id[_id] for _id in ids if _id in by_id]
+
+def top_tweets(collection, criteria, n, cache=None):
+    """
+    Returns the listing rows of the top n tweets by criteria.
+    With a cache, returning to the listing from a detail page does not query the
+    database again until the TTL runs out or the 'ranking' tag is invalidated.
+
+    Args:
+        collection (Collection): The tweet collection.
+        criteria (str): The metric to rank by, a key of METRIC_INDEXES.
+        n (int): Number of tweets to list.
+        cache (QueryCache): Where to keep the rows, or None to always query.
+
+    Returns:
+        list: The tweets as Tweet records, best first.
+    """
+    def load():
+        return load_rows(collection, rank_tweets(collection, criteria, n))
+
+    if cache is None:
+        return load()
+    return cache.get(query_key("top_tweets", collection.name, criteria, n), load, [("ranking",)])
+
+def explain_rank(collection, criteria, n):
+    """
+    Runs the ranking query with explain and returns its execution stats.
+
+    Args:
+        collection (Collection): The tweet collection.
+        criteria (str): The metric to rank by.
+        n (int): Number of tweets to rank.
+
+    Returns:
+        dict: The executionStats section of the explain output.
+    """
+    command = {
+        "find": collection.name,
+        "filter": {},
+        "projection": {"_id": 1, criteria: 1},
+        "sort": {criteria: pymongo.DESCENDING, "_id": pymongo.ASCENDING},
+        "hint": METRIC_INDEXES[criteria],
+        "limit": n,
+    }
+    return collection.database.command("explain", command, verbosity="executionStats")["executionStats"]
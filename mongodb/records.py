@@ -0,0 +1,73 @@
+class Record:
+    """
+    A listing row built from a projected document, holding only the fields the
+    listing shows. Its attributes are named after the document fields, and there is
+    no per-row dict, so a page of records takes a fraction of the memory of the
+    decoded documents. Subclasses list their fields in __slots__.
+    """
+    __slots__ = ()
+
+    def get(self, field, default=None):
+        """
+        Returns a field by its document name, as KeysetPager reads the sort keys of a page.
+        """
+        return getattr(self, field, default)
+
+    def _asdict(self):
+        """
+        Returns:
+            dict: The fields, for printing as JSON.
+        """
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return "{}({})".format(type(self).__name__, ", ".join(
+            "{}={!r}".format(field, getattr(self, field)) for field in self.__slots__))
+
+class Tweet(Record):
+    """
+    A tweet in the search and top tweets listings. Use service.fetch_tweet for the full document.
+    """
+    __slots__ = ("_id", "id", "date", "content", "renderedContent", "username")
+
+    def __init__(self, _id, id, date, content, renderedContent, username):
+        self._id = _id
+        self.id = id
+        self.date = date
+        self.content = content
+        self.renderedContent = renderedContent
+        self.username = username
+
+    @classmethod
+    def from_doc(cls, doc):
+        """
+        Builds a Tweet from a document projected to the listing fields, decoded or raw; fields left out are None.
+        Only the fields the record takes are read, so a raw document decodes nothing else.
+        """
+        user = doc.get("user")
+        return cls(doc["_id"], doc.get("id"), doc.get("date"), doc.get("content"), doc.get("renderedContent"),
+                   user.get("username") if user else None)
+
+class User(Record):
+    """
+    A user in the search and top users listings, from the users collection, whose
+    _id is the username. Use service.fetch_user for the full profile.
+    """
+    __slots__ = ("_id", "displayname", "location", "followersCount")
+
+    def __init__(self, _id, displayname, location, followersCount):
+        self._id = _id
+        self.displayname = displayname
+        self.location = location
+        self.followersCount = followersCount
+
+    @property
+    def username(self):
+        return self._id
+
+    @classmethod
+    def from_doc(cls, doc):
+        """
+        Builds a User from a document projected to the listing fields, decoded or raw; fields left out are None.
+        """
+        return cls(doc["_id"], doc.get("displayname"), doc.get("location"), doc.get("followersCount"))
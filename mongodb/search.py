@@ -0,0 +1,139 @@
+import os
+import re
+import sys
+
+from pymongo import UpdateOne
+
+from paging import KeysetPager
+from records import Tweet
+
+# The text analysis is shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.entities import hashtag_keys, normalize_hashtag
+from common.cache import query_key
+
+# Fields shown in the tweet search listing, which is ordered by date
+PAGE_PROJECTION = {"id": 1, "date": 1, "content": 1, "user.username": 1}
+
+def keyword_filters(keywords):
+    """
+    Builds the case-insensitive substring filters for each keyword.
+    Keywords are escaped, so they always match literally.
+
+    Args:
+        keywords (list): The keywords to match.
+
+    Returns:
+        list: One content $regex filter per keyword.
+    """
+    return [{"content": {"$regex": re.escape(keyword), "$options": "i"}} for keyword in keywords]
+
+def split_keywords(keywords):
+    """
+    Separates hashtag keywords from plain words.
+
+    Args:
+        keywords (list): The keywords as typed.
+
+    Returns:
+        tuple: (normalized hashtags without '#', plain words)
+    """
+    tags = [normalize_hashtag(keyword) for keyword in keywords if keyword.startswith('#') and len(keyword) > 1]
+    words = [keyword for keyword in keywords if not (keyword.startswith('#') and len(keyword) > 1)]
+    return tags, words
+
+def text_search_query(keywords):
+    """
+    Builds a query that finds candidates through the indexes.
+    Hashtag keywords are looked up in the multikey hashtags index. Plain words go
+    through the content text index and are then checked as substrings; the
+    $text clause is evaluated with the index, so the regex filters only run on
+    documents that already contain at least one of the words.
+
+    Args:
+        keywords (list): The keywords to match.
+
+    Returns:
+        dict: The MongoDB query.
+    """
+    tags, words = split_keywords(keywords)
+    query = {}
+    if words:
+        query["$text"] = {"$search": " ".join(words)}
+        query["$and"] = keyword_filters(words)
+    if tags:
+        query["hashtags"] = {"$all": tags}
+    return query
+
+def regex_search_query(keywords):
+    """
+    Builds the original full-scan query, one unanchored $regex per keyword.
+    Kept for keywords that are only fragments of words, when asked for, and for benchmarking.
+
+    Args:
+        keywords (list): The keywords to match.
+
+    Returns:
+        dict: The MongoDB query.
+    """
+    return {"$and": keyword_filters(keywords)}
+
+def tweet_pager(collection, keywords, page_size=10, text=True, cache=None):
+    """
+    Creates a pager over the tweets containing every keyword, newest first.
+    Pages are read with keyset pagination over (date, _id), so only one page of
+    projected documents is ever held by the client, as Tweet records.
+
+    Args:
+        collection (Collection): The tweet collection.
+        keywords (list): The keywords to match.
+        page_size (int): Number of tweets per page.
+        text (bool): Find candidates through the text index; False uses the regex scan.
+        cache (QueryCache): Where to keep the pages read, if anywhere; new tweets invalidate the 'tweets' tag.
+
+    Returns:
+        KeysetPager: The pager, positioned on the first page.
+    """
+    query = text_search_query(keywords) if text else regex_search_query(keywords)
+    return KeysetPager(collection, query, PAGE_PROJECTION, page_size=page_size, cache=cache, tags=(("tweets",),),
+                       record=Tweet)
+
+def fetch_tweet(collection, _id, cache=None):
+    """
+    Loads the full document of a tweet picked from a listing.
+
+    Args:
+        collection (Collection): The tweet collection.
+        _id (ObjectId): The _id of the tweet.
+        cache (QueryCache): Where to keep the document, if anywhere; tweets are not changed once written.
+
+    Returns:
+        dict: The full tweet document, or None if it no longer exists.
+    """
+    if cache is None:
+        return collection.find_one({"_id": _id})
+    return cache.get(query_key("fetch_tweet", collection.name, _id), lambda: collection.find_one({"_id": _id}))
+
+def ensure_hashtags(collection, batch_size=1000):
+    """
+    Fills in the hashtags array of tweets loaded before it existed.
+    Missing arrays are found through the hashtags index, so once every tweet
+    has one this is a single empty index lookup.
+
+    Args:
+        collection (Collection): The tweet collection.
+        batch_size (int): Number of updates per bulk_write.
+
+    Returns:
+        int: The number of tweets updated.
+    """
+    updated = 0
+    ops = []
+    for doc in collection.find({"hashtags": None}, {"content": 1}):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"hashtags": hashtag_keys(doc.get("content"))}}))
+        if len(ops) >= batch_size:
+            updated += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += collection.bulk_write(ops, ordered=False).modified_count
+    return updated
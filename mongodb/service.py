@@ -0,0 +1,324 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+import pymongo
+
+from indexes import ensure_indexes
+import search
+import users
+import ranking
+import trending
+from writebuffer import WriteBuffer
+from ids import Snowflake, lease_worker_id
+from instrument import InstrumentedCollection
+from lazy import lazy_collection, inflate
+
+# The text analysis and caches are shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.entities import extract_entities, hashtag_keys
+from common.trending import Trending
+from common.cache import QueryCache
+
+# The user composed tweets are written as; the application has no logins
+COMPOSE_USERNAME = "291user"
+
+class Database:
+    """
+    One tweetbook database and what the menus and command scripts share:
+    the collections, the write-behind buffer for composed tweets, the trending
+    counts and the query cache. Opening it creates whatever indexes and derived
+    collections are missing.
+    The listings and lookups read through tweet_reads and user_reads, which with
+    lazy decoding return raw BSON documents: the listings decode only the fields
+    their records take, and a tweet or profile is decoded in full when it is shown.
+    """
+    def __init__(self, port, name="291db", cache_mb=32, cache_ttl=30.0, query_stats=None, lazy=True):
+        """
+        Args:
+            port (str): Port of the MongoDB server on localhost.
+            name (str): Name of the database.
+            cache_mb (float): Memory cap of the query cache in MB, 0 to turn it off.
+            cache_ttl (float): Seconds a cached result is served for.
+            query_stats (QueryStats): Where the collections record their calls, or None to measure nothing.
+            lazy (bool): Decode the documents read by the listings and lookups only as their fields are used.
+        """
+        self.client = pymongo.MongoClient('mongodb://localhost:{}'.format(port))
+        self.db = self.client[name]
+        self.tweets = self.db["tweet_info"]
+        self.users = self.db["users"]
+        self.trending_buckets = self.db["trending"]
+
+        # The same collections as read by the listings and lookups
+        self.lazy = lazy
+        self.tweet_reads = lazy_collection(self.tweets) if lazy else self.tweets
+        self.user_reads = lazy_collection(self.users) if lazy else self.users
+
+        # The collections are only wrapped when they are measured, so plain ones cost nothing extra
+        self.query_stats = query_stats
+        if query_stats is not None:
+            self.tweets = InstrumentedCollection(self.tweets, query_stats)
+            self.users = InstrumentedCollection(self.users, query_stats)
+            self.trending_buckets = InstrumentedCollection(self.trending_buckets, query_stats)
+            self.tweet_reads = InstrumentedCollection(self.tweet_reads, query_stats)
+            self.user_reads = InstrumentedCollection(self.user_reads, query_stats)
+
+        # Composed tweets are written in batches by a write-behind buffer
+        self.write_buffer = WriteBuffer(self.tweets, self.users)
+
+        # Hashtag counts over the last day, updated and saved whenever the buffer writes tweets
+        self.trending = Trending()
+        self.write_buffer.after_flush.append(
+            lambda docs: trending.refresh_trending(self.trending_buckets, self.trending, docs))
+
+        # Listing and lookup results, dropped when the buffer writes tweets that change them
+        self.cache = QueryCache(int(cache_mb * 1024 * 1024), cache_ttl)
+        self.write_buffer.after_flush.append(self.invalidate_cache)
+
+        # Tweet IDs in the same Snowflake format as the loaded tweets
+        self.tweet_ids = Snowflake(lease_worker_id(self.db["counters"]))
+
+        # Create any indexes missing from the collection, existing ones are left as they are
+        ensure_indexes(self.tweets)
+        search.ensure_hashtags(self.tweets)
+        users.ensure_users(self.tweets, self.users)
+        trending.ensure_trending(self.tweets, self.trending_buckets, self.trending)
+
+    def invalidate_cache(self, docs):
+        """
+        Drops the cached results the tweets the buffer just wrote could change.
+
+        Args:
+            docs (list): The tweets that were just inserted.
+
+        Returns:
+            None
+        """
+        self.cache.invalidate(("tweets",), ("users",), ("ranking",),
+                              *{("user", doc["user"]["username"]) for doc in docs if doc.get("user")})
+
+    def flush(self):
+        """
+        Writes the buffered tweets now.
+        """
+        self.write_buffer.flush()
+
+    def close(self):
+        """
+        Writes out any tweets still waiting in the buffer and stops its flush thread.
+        """
+        self.write_buffer.close()
+
+def tweet_pager(database, keywords, scan=False):
+    """
+    Creates a pager over the tweets containing every keyword, newest first.
+    The text index only matches whole words; keywords that are parts of words
+    are only found with scan, which reads the whole collection.
+
+    Args:
+        database (Database): The database.
+        keywords (list): The keywords; '#word' matches the hashtag.
+        scan (bool): Look for the keywords inside words with the regex scan instead of the indexes.
+
+    Returns:
+        tuple: (the pager, the Tweet records on its first page).
+    """
+    pager = search.tweet_pager(database.tweet_reads, keywords, text=not scan, cache=database.cache)
+    return pager, pager.fetch()
+
+def user_pager(database, keyword):
+    """
+    Creates a pager over the users whose display name or location contains keyword.
+
+    Args:
+        database (Database): The database.
+        keyword (str): The word or phrase to look for.
+
+    Returns:
+        tuple: (the pager, the User records on its first page).
+    """
+    pager = users.user_pager(database.user_reads, keyword, cache=database.cache)
+    return pager, pager.fetch()
+
+def page_of(pager, first, page_num):
+    """
+    Moves a pager from its first page to page_num, reading the pages in between.
+
+    Returns:
+        list: The records on the page, empty past the last one.
+    """
+    docs = first
+    for _ in range(page_num - 1):
+        if not pager.next():
+            return []
+        docs = pager.fetch()
+    return docs
+
+def search_tweets(database, keywords, page_num=1, scan=False):
+    """
+    Reads one page of the tweets containing every keyword, newest first.
+
+    Args:
+        database (Database): The database.
+        keywords (list): The keywords; '#word' matches the hashtag.
+        page_num (int): The page number, starting at 1.
+        scan (bool): Look for the keywords inside words with the regex scan, see tweet_pager.
+
+    Returns:
+        list: The tweets on the page as Tweet records.
+    """
+    return page_of(*tweet_pager(database, keywords, scan), page_num)
+
+def search_users(database, keyword, page_num=1):
+    """
+    Reads one page of the users whose display name or location contains keyword.
+
+    Args:
+        database (Database): The database.
+        keyword (str): The word or phrase to look for.
+        page_num (int): The page number, starting at 1.
+
+    Returns:
+        list: The users on the page as User records.
+    """
+    return page_of(*user_pager(database, keyword), page_num)
+
+def fetch_tweet(database, _id):
+    """
+    Loads the full document of a tweet picked from a listing.
+    With lazy decoding the cache keeps the raw document and it is decoded here, for display.
+
+    Args:
+        database (Database): The database.
+        _id (ObjectId): The _id of the tweet.
+
+    Returns:
+        dict: The tweet, or None if it does not exist.
+    """
+    return inflate(search.fetch_tweet(database.tweet_reads, _id, cache=database.cache))
+
+def fetch_user(database, username):
+    """
+    Loads the full profile of a user picked from a listing.
+    With lazy decoding the cache keeps the raw profile and it is decoded here, for display.
+
+    Args:
+        database (Database): The database.
+        username (str): The username.
+
+    Returns:
+        dict: The user subdocument, or None if the user does not exist.
+    """
+    return inflate(users.fetch_user(database.user_reads, username, cache=database.cache))
+
+def top_tweets(database, criteria, n):
+    """
+    Lists the top n tweets by a metric, read from the metric's index.
+
+    Args:
+        database (Database): The database.
+        criteria (str): 'retweetCount', 'likeCount' or 'quoteCount'.
+        n (int): Number of tweets.
+
+    Returns:
+        list: The tweets as Tweet records, best first.
+    """
+    if criteria not in ranking.METRIC_INDEXES:
+        raise ValueError('criteria must be one of {}'.format(', '.join(ranking.METRIC_INDEXES)))
+    return ranking.top_tweets(database.tweet_reads, criteria, n, cache=database.cache)
+
+def top_users(database, n):
+    """
+    Lists the n users with the most followers.
+
+    Args:
+        database (Database): The database.
+        n (int): Number of users.
+
+    Returns:
+        list: The users as User records, most followed first.
+    """
+    return users.top_users(database.user_reads, n, cache=database.cache)
+
+def trending_hashtags(database, n=10):
+    """
+    Lists the hashtags used most over the last day, read from the in-memory counts.
+
+    Args:
+        database (Database): The database.
+        n (int): Number of hashtags.
+
+    Returns:
+        list: (hashtag, estimated count) pairs, most used first.
+    """
+    return database.trending.top(n)
+
+def compose(database, text, username=COMPOSE_USERNAME):
+    """
+    Composes a tweet; the buffer inserts it with its next batch, within a second.
+
+    Args:
+        database (Database): The database.
+        text (str): The text of the tweet.
+        username (str): The user writing it.
+
+    Returns:
+        dict: The tweet document.
+    """
+    # Converting time with timezone to ISO 8601 format without microseconds
+    dtime = datetime.now(timezone.utc).replace(microsecond=0)
+    dtimezone = dtime.astimezone().isoformat()
+
+    # Hashtags, @mentions and links in the text
+    entities = extract_entities(text)
+
+    tweet = {
+        "url": None,
+        "date": dtimezone,
+        "content": text,
+        "renderedContent": None,
+        "id": database.tweet_ids.next_id(),
+        "user": {
+            "username": username,
+            "displayname": None,
+            "id": None,
+            "description": None,
+            "rawDescription": None,
+            "descriptionUrls": [],
+            "verified": None,
+            "created": None,
+            "followersCount": None,
+            "friendsCount": None,
+            "statusesCount": None,
+            "favouritesCount": None,
+            "listedCount": None,
+            "mediaCount": None,
+            "location": None,
+            "protected": None,
+            "linkUrl": None,
+            "linkTcourl": None,
+            "profileImageUrl": None,
+            "profileBannerUrl": None,
+            "url": None
+        },
+        "outlinks": entities.urls,
+        "tcooutlinks": None,
+        "replyCount": None,
+        "retweetCount": None,
+        "likeCount": None,
+        "quoteCount": None,
+        "conversationId": None,
+        "lang": None,
+        "source": None,
+        "sourceUrl": None,
+        "sourceLabel": None,
+        "media": None,
+        "retweetedTweet": None,
+        "quotedTweet": None,
+        "mentionedUsers": [{"username": mention} for mention in entities.mentions] or None,
+        "hashtags": hashtag_keys(text),
+    }
+
+    # Queue the tweet, the buffer inserts it with the next batch
+    database.write_buffer.add(tweet)
+    return tweet
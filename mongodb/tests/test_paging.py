@@ -0,0 +1,120 @@
+import importlib.util
+import os
+
+import pytest
+
+# Only the sort direction constants are used; the collection below stands in for the server
+pymongo = pytest.importorskip('pymongo')
+
+_spec = importlib.util.spec_from_file_location(
+    'mongodb_paging', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'paging.py'))
+paging = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(paging)
+
+from common.cache import QueryCache
+
+def matches(doc, query):
+    """
+    Evaluates the subset of the filter language the pager builds: $and, $or, $lt, $gt and equality.
+    """
+    for field, condition in query.items():
+        if field == '$and':
+            if not all(matches(doc, part) for part in condition):
+                return False
+        elif field == '$or':
+            if not any(matches(doc, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            for op, value in condition.items():
+                if not (doc[field] < value if op == '$lt' else doc[field] > value):
+                    return False
+        elif doc.get(field) != condition:
+            return False
+    return True
+
+class Cursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.docs.sort(key=lambda doc: doc[field], reverse=direction == pymongo.DESCENDING)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    def __iter__(self):
+        return iter(self.docs)
+
+class Collection:
+    """
+    Stands in for a collection: find with a filter, then sort and limit, and counts the queries.
+    """
+    name = 'tweets'
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = 0
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        return Cursor([dict(doc) for doc in self.docs if matches(doc, query)])
+
+def tweets(n):
+    # Three tweets share each date, so the pages have to be split on _id as well
+    return [{'_id': i, 'date': '2021-03-{:02}'.format(1 + i // 3), 'lang': 'en' if i % 4 else 'fr'} for i in range(n)]
+
+def read_all(pager):
+    pages = [pager.fetch()]
+    while pager.next():
+        pages.append(pager.fetch())
+    return pages
+
+def test_pages_cover_every_document_once_in_order():
+    docs = tweets(23)
+    pager = paging.KeysetPager(Collection(docs), {}, page_size=5)
+    pages = read_all(pager)
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    expected = sorted(docs, key=lambda doc: (doc['date'], doc['_id']), reverse=True)
+    assert [doc['_id'] for page in pages for doc in page] == [doc['_id'] for doc in expected]
+    assert not pager.next()
+
+def test_filter_is_kept_on_every_page():
+    pager = paging.KeysetPager(Collection(tweets(40)), {'lang': 'en'}, page_size=4)
+    found = [doc for page in read_all(pager) for doc in page]
+    assert len(found) == 30 and all(doc['lang'] == 'en' for doc in found)
+
+def test_prev_returns_the_same_page():
+    pager = paging.KeysetPager(Collection(tweets(12)), {}, page_size=5)
+    first = pager.fetch()
+    pager.next()
+    second = pager.fetch()
+    assert pager.prev() and pager.fetch() == first
+    assert not pager.prev()
+    assert pager.next() and pager.fetch() == second
+
+def test_new_document_does_not_shift_later_pages():
+    docs = tweets(10)
+    pager = paging.KeysetPager(Collection(docs), {}, page_size=4)
+    first = pager.fetch()
+    docs.append({'_id': 100, 'date': '2021-04-01', 'lang': 'en'})
+    pager.next()
+    second = pager.fetch()
+    assert not {doc['_id'] for doc in first} & {doc['_id'] for doc in second}
+    assert second[0]['_id'] == 5
+
+def test_cached_pages_are_read_once_until_invalidated():
+    collection = Collection(tweets(12))
+    queries = QueryCache()
+    pager = paging.KeysetPager(collection, {}, page_size=5, cache=queries, tags=(('tweets',),))
+    pager.fetch()
+    pager.next()
+    pager.fetch()
+    pager.prev()
+    pager.fetch()
+    assert collection.queries == 2
+    queries.invalidate(('tweets',))
+    pager.fetch()
+    assert collection.queries == 3
@@ -0,0 +1,68 @@
+import importlib.util
+import os
+import types
+
+import pytest
+
+# Loaded by path: the SQL side has an ids module of its own, and both suites run in one session
+_spec = importlib.util.spec_from_file_location(
+    'mongodb_ids', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ids.py'))
+ids = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(ids)
+
+class Counters:
+    """
+    Stands in for the counters collection: find_one_and_update with $inc and upsert.
+    """
+    def __init__(self):
+        self.docs = {}
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=False):
+        doc = self.docs.setdefault(query['_id'], {'_id': query['_id']})
+        for field, step in update['$inc'].items():
+            doc[field] = doc.get(field, 0) + step
+        return dict(doc)
+
+def frozen_clock(monkeypatch, times):
+    """
+    Makes time.time in ids return the given seconds in turn, then keep returning the last one.
+    """
+    times = list(times)
+
+    def now():
+        return times.pop(0) if len(times) > 1 else times[0]
+    monkeypatch.setattr(ids, 'time', types.SimpleNamespace(time=now))
+
+def test_leased_worker_ids_differ(monkeypatch):
+    monkeypatch.delenv('TWEETBOOK_WORKER_ID', raising=False)
+    counters = Counters()
+    assert [ids.lease_worker_id(counters) for _ in range(3)] == [0, 1, 2]
+
+def test_worker_id_from_environment(monkeypatch):
+    monkeypatch.setenv('TWEETBOOK_WORKER_ID', '17')
+    counters = Counters()
+    assert ids.lease_worker_id(counters) == 17
+    assert counters.docs == {}
+
+def test_worker_id_out_of_range():
+    with pytest.raises(ValueError):
+        ids.Snowflake(1024)
+    with pytest.raises(ValueError):
+        ids.Snowflake(-1)
+
+def test_two_generators_never_collide(monkeypatch):
+    # Both hand out IDs in the same millisecond, past the 4096 a millisecond holds
+    frozen_clock(monkeypatch, [1700000000.0])
+    counters = Counters()
+    first = ids.Snowflake(ids.lease_worker_id(counters))
+    second = ids.Snowflake(ids.lease_worker_id(counters))
+    made = [first.next_id() for _ in range(5000)] + [second.next_id() for _ in range(5000)]
+    assert len(set(made)) == len(made)
+
+def test_ids_keep_growing_when_the_clock_goes_back(monkeypatch):
+    frozen_clock(monkeypatch, [1700000000.000, 1700000000.005, 1699999999.000, 1699999999.500, 1700000000.010])
+    generator = ids.Snowflake(3)
+    made = [generator.next_id() for _ in range(6)]
+    assert made == sorted(made)
+    assert len(set(made)) == len(made)
+    assert all(ids.id_time(tweet_id) >= 1700000000.0 for tweet_id in made)
@@ -0,0 +1,141 @@
+import os
+import sys
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+# The trending engine is shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.trending import Trending, timestamp
+
+def hourly_hashtags(since, bucket_seconds):
+    """
+    Builds the aggregation that counts the uses of each hashtag per time bucket.
+
+    Args:
+        since (str): ISO 8601 date of the oldest tweet to count. Dates are compared as
+            strings, which is right for the dumps since they are all in UTC.
+        bucket_seconds (int): Length of a bucket in seconds.
+
+    Returns:
+        list: The pipeline, giving {_id: {start, tag}, count} rows with start in seconds since the epoch.
+    """
+    millis = {"$toLong": {"$dateFromString": {"dateString": "$date"}}}
+    return [
+        {"$match": {"date": {"$gte": since}, "hashtags.0": {"$exists": True}}},
+        {"$project": {"_id": 0, "hashtags": 1, "millis": millis}},
+        {"$unwind": "$hashtags"},
+        {"$group": {
+            "_id": {
+                "start": {"$toLong": {"$divide": [
+                    {"$subtract": ["$millis", {"$mod": ["$millis", bucket_seconds * 1000]}]}, 1000]}},
+                "tag": "$hashtags",
+            },
+            "count": {"$sum": 1},
+        }},
+    ]
+
+def load_trending(trending, engine):
+    """
+    Loads the saved buckets into the engine.
+
+    Args:
+        trending (Collection): The collection of saved buckets.
+        engine (Trending): The engine to load into.
+
+    Returns:
+        Trending: The engine.
+    """
+    engine.load((doc["_id"], doc) for doc in trending.find())
+    return engine
+
+def save_trending(trending, engine):
+    """
+    Adds the counts made since the last save to the saved buckets and drops the ones that left the window.
+    Each bucket carries a version; a bucket another process saved in between is read and merged again.
+
+    Args:
+        trending (Collection): The collection of saved buckets.
+        engine (Trending): The engine.
+
+    Returns:
+        None
+    """
+    def write_bucket(start, record, previous):
+        if previous is None:
+            try:
+                trending.insert_one({"_id": start, "sketch": record["sketch"], "top": record["top"], "version": 1})
+                return True
+            except DuplicateKeyError:
+                return False
+        result = trending.replace_one(
+            {"_id": start, "version": previous["version"]},
+            {"sketch": record["sketch"], "top": record["top"], "version": previous["version"] + 1})
+        return result.matched_count == 1
+
+    if engine.save(lambda start: trending.find_one({"_id": start}), write_bucket):
+        trending.delete_many({"_id": {"$lt": engine.window_start()}})
+
+def refresh_trending(trending, engine, tweet_docs):
+    """
+    Counts the hashtags of newly written tweets and saves the counts.
+
+    Args:
+        trending (Collection): The collection of saved buckets.
+        engine (Trending): The engine.
+        tweet_docs (list): The tweets that were just inserted.
+
+    Returns:
+        None
+    """
+    for tweet in tweet_docs:
+        if tweet.get("hashtags"):
+            engine.add(tweet["hashtags"], timestamp(tweet["date"]))
+    save_trending(trending, engine)
+
+def rebuild_trending(tweets, trending, engine=None):
+    """
+    Recounts the trending window from the tweets with one aggregation.
+    The window ends at the newest tweet, found through the date index, and only
+    the tweets inside it are read; it is meant to run once after a bulk load.
+
+    Args:
+        tweets (Collection): The tweet collection.
+        trending (Collection): The collection of saved buckets.
+        engine (Trending): The engine, whose counts are replaced, or None for a new one with the default settings.
+
+    Returns:
+        Trending: The engine.
+    """
+    if engine is None:
+        engine = Trending()
+    trending.drop()
+    engine.clear()
+    newest = tweets.find_one({}, {"date": 1}, sort=[("date", -1)])
+    if newest is None:
+        return engine
+    oldest = engine.bucket_start(timestamp(newest["date"])) - (engine.window - 1) * engine.bucket_seconds
+    since = datetime.fromtimestamp(oldest, timezone.utc).isoformat()
+    for row in tweets.aggregate(hourly_hashtags(since, engine.bucket_seconds), allowDiskUse=True):
+        engine.add([row["_id"]["tag"]], row["_id"]["start"], row["count"])
+    save_trending(trending, engine)
+    return engine
+
+def ensure_trending(tweets, trending, engine):
+    """
+    Loads the saved trending counts into the engine.
+    They are counted from the tweets the first time, e.g. for databases loaded before they existed.
+
+    Args:
+        tweets (Collection): The tweet collection.
+        trending (Collection): The collection of saved buckets.
+        engine (Trending): The engine to load into.
+
+    Returns:
+        Trending: The engine.
+    """
+    if trending.estimated_document_count() == 0 and tweets.estimated_document_count() > 0:
+        rebuild_trending(tweets, trending, engine)
+    else:
+        load_trending(trending, engine)
+    return engine
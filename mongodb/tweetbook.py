@@ -1,17 +1,34 @@
-import pymongo
 import sys
 import os
-from datetime import datetime, timezone 
 
-client = pymongo.MongoClient('mongodb://localhost:{}'.format(sys.argv[1]))
-db = client["291db"]
-infoCollection = db["tweet_info"]
+import service
+
+# The query stats are shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.querystats import from_environment
+
+# Memory cap in MB (0 turns the cache off) and TTL in seconds of the query result cache
+CACHE_MB = float(os.environ.get('TWEETBOOK_CACHE_MB', 32))
+CACHE_TTL = float(os.environ.get('TWEETBOOK_CACHE_TTL', 30))
+
+# Listings decode only the fields they show and a tweet or profile is decoded when it is shown; 0 decodes every document in full
+LAZY_DOCS = os.environ.get('TWEETBOOK_LAZY_DOCS', '1') != '0'
+
+# Latency histograms, document counts, plans and slow queries of every call, written on exit
+# to the file TWEETBOOK_QUERY_STATS names; None, measuring nothing, when it is not set
+QUERY_STATS = from_environment()
+
+# The open service.Database, set by main
+database = None
 
 def clear():
     """
-    Clears the console screen.
+    Clears the console screen with ANSI escape codes, without starting a shell.
+    Nothing is written when the output is not a terminal, e.g. when it is piped to a file.
     """
-    os.system('cls' if os.name=='nt' else 'clear')
+    if sys.stdout.isatty():
+        sys.stdout.write('\033[H\033[2J\033[3J')
+        sys.stdout.flush()
 
 def landing_page(args):
     """
@@ -36,6 +53,7 @@ def landing_page(args):
         print('To search for users, press U')
         print('To list top n tweets, type LT')
         print('To list top n users, press LU')
+        print('To see trending hashtags, press H')
         print('To compose a tweet, press C')
         print('To exit, press X')
         print('************************')
@@ -50,6 +68,8 @@ def landing_page(args):
             list_tweets()
         elif (landing_input == 'lu'):
             list_users()
+        elif (landing_input == 'h'):
+            list_trending()
         elif (landing_input == 'c'):
             compose_tweets()
         elif (landing_input == 'x'):
@@ -75,40 +95,51 @@ def search_tweets():
         if not keywords:
             continue
 
-        # Building a query for MongoDB based on user input keywords
-        regex_query = [{"content": {"$regex": keyword, "$options": "i"}} for keyword in keywords]
-        query = {"$and": regex_query}
+        # Browsing the matches one page at a time, newest first
+        pager, tweets = service.tweet_pager(database, keywords)
 
-        # Searching for tweets in the database based on the query
-        found_tweets = infoCollection.find(query)
-        tweet_data = {i: tweet for i, tweet in enumerate(found_tweets, start=1)}
+        # The indexes only match whole words; looking inside words reads every tweet, so it is asked for
+        if not tweets:
+            print("No tweets found with the given keywords as whole words.")
+            if input('Search inside words instead? This reads every tweet and can be slow (y/n): ').strip().lower() == 'y':
+                pager, tweets = service.tweet_pager(database, keywords, scan=True)
 
-        if not tweet_data:
+        if not tweets:
             print("No tweets found with the given keywords.")
             input('Press any key to continue...')
             continue
 
-        # Displaying the found tweets with basic information
-        for index, tweet in tweet_data.items():
-            print(f"TWEET {index}:")
-            print("ID:", tweet['id'], "| Date:", tweet['date'], "| Content:", tweet['content'], "| Username:", tweet['user']['username'])
-            print('')
-
-        # Prompting the user to select a tweet for detailed information
-        print('Enter a tweet number to see all fields, or press "x" to return to search:')
-        selection = input('Input: ').strip()
-        if selection.lower() == 'x':
-            continue
-        if selection.isdigit() and int(selection) in tweet_data:
-            # Displaying detailed information for the selected tweet
-            selected_tweet = tweet_data[int(selection)]
+        selection = ''
+        while selection != 'x':
             clear()
-            for field, value in selected_tweet.items():
-                print(f"{field}: {value}")
-            input('Press any key to continue...')
-        else:
-            print("Invalid selection. Please try again.")
-            input('Press any key to continue...')
+            # Displaying the current page of tweets with basic information
+            for index, tweet in enumerate(tweets, start=1):
+                print(f"TWEET {index}:")
+                print("ID:", tweet.id, "| Date:", tweet.date, "| Content:", tweet.content, "| Username:", tweet.username)
+                print('')
+
+            # Prompting the user to select a tweet for detailed information
+            print(f"Page {pager.page + 1}  P: Previous <--  --> N: Next")
+            print('Enter a tweet number to see all fields, or press "x" to return to search:')
+            selection = input('Input: ').strip().lower()
+            if selection == 'x':
+                continue
+            if selection == 'n':
+                if pager.next():
+                    tweets = pager.fetch()
+            elif selection == 'p':
+                if pager.prev():
+                    tweets = pager.fetch()
+            elif selection.isdigit() and 1 <= int(selection) <= len(tweets):
+                # Loading and displaying the full document of the selected tweet
+                selected_tweet = service.fetch_tweet(database, tweets[int(selection) - 1]._id)
+                clear()
+                for field, value in selected_tweet.items():
+                    print(f"{field}: {value}")
+                input('Press any key to continue...')
+            else:
+                print("Invalid selection. Please try again.")
+                input('Press any key to continue...')
 
 def search_users(): 
     """
@@ -124,44 +155,44 @@ def search_users():
         print('Please enter a keyword to search for users')
         print('')
         su_input = input("Input:")
+        if not su_input.strip():
+            continue
 
-        # This is the query to find users that match display name and location with case insensitivity
-        query = {
-            "$or": [
-                {"user.displayname": {"$regex": r'\b' + su_input + r'\b', "$options": "i"}},
-                {"user.location": {"$regex": r'\b' + su_input + r'\b', "$options": "i"}},
-            ]
-        }
-
-        found_users = infoCollection.find(query)
-        # Removing duplicates:
-        final_users = {user["user"]["username"]: user["user"] for user in found_users}.values()
-        
-        # Data stored in dictionary with indexes for selection
-        # formatted as: {index , user}
-        data = {}
-        i = 0
-        clear()
-        print('')
-        for user in final_users:
-            data[i] = user
-            print("USER", (i+1), ":")
-            print('')
-            print("username:", user["username"], "| display name:", user["displayname"], "| location:", "N/A" if user["location"] is None else user["location"])
-            print('')
-            print('')
-            i += 1
-        print('Enter a user number to see all fields of the user')
-        print('Otherwise press x to return')
-        disp_u_input = input('Input:')
-        if (disp_u_input.isdigit() and int(disp_u_input) < (i+1)):
+        # Searching the users collection, so every user is listed once however many tweets they have
+        pager, found_users = service.user_pager(database, su_input.strip())
+
+        while True:
+            # Users on the current page as User records, numbered from 1
             clear()
-            for field in data[int(disp_u_input)-1]:
-                print("*", field, ": ", data[int(disp_u_input)-1][field])
             print('')
-            input('Press any key to continue')
-        elif (disp_u_input == 'x'):
-            return
+            for index, user in enumerate(found_users, start=1):
+                print("USER", index, ":")
+                print('')
+                print("username:", user.username, "| display name:", user.displayname, "| location:", "N/A" if user.location is None else user.location)
+                print('')
+                print('')
+            print(f"Page {pager.page + 1}  P: Previous <--  --> N: Next")
+            print('Enter a user number to see all fields of the user')
+            print('Otherwise press x to return, or any other key to search again')
+            disp_u_input = input('Input:').lower()
+            if (disp_u_input.isdigit() and 0 < int(disp_u_input) <= len(found_users)):
+                clear()
+                # Loading the full profile of the selected user
+                profile = service.fetch_user(database, found_users[int(disp_u_input)-1].username)
+                for field in profile:
+                    print("*", field, ": ", profile[field])
+                print('')
+                input('Press any key to continue')
+            elif (disp_u_input == 'n'):
+                if pager.next():
+                    found_users = pager.fetch()
+            elif (disp_u_input == 'p'):
+                if pager.prev():
+                    found_users = pager.fetch()
+            elif (disp_u_input == 'x'):
+                return
+            else:
+                break
 
 def list_tweets():
     """
@@ -213,35 +244,29 @@ def display_top_tweets(criteria, n):
     """
     disp_tt_input = ''
     while (disp_tt_input != "x"):
-        # Querying the database to get the top tweets based on the specified criteria and number
-        toptweets = infoCollection.find({}).sort(criteria, pymongo.DESCENDING).limit(int(n))
-        # Data stored in a dictionary with indexes for selection
-        # formatted as: {index , tweet}
-        data = {}
-        i = 0
+        # Ranking the top tweets from the metric index, cached for the rest of the session
+        toptweets = service.top_tweets(database, criteria, int(n))
+        # Tweet records, numbered from 1 for selection
         clear()
         print('')
-        for tweet in toptweets:
-            data[i] = tweet
-            print("TWEET", (i+1), ":")
+        for index, tweet in enumerate(toptweets, start=1):
+            print("TWEET", index, ":")
             print("-----------------------------------------------------------------------")
-            print(tweet['renderedContent'])
+            print(tweet.renderedContent)
             print("-----------------------------------------------------------------------")
-            # IGNORE BELOW, TEST PRINT
-            # print(tweet['retweetCount'],tweet['likeCount'],tweet['quoteCount'],"id:" , tweet['id'] , "| date:", tweet['date'] , "| username:",tweet['user']['username'])
-            print("id:", tweet['id'], "| date:", tweet['date'], "| username:", tweet['user']['username'])
+            print("id:", tweet.id, "| date:", tweet.date, "| username:", tweet.username)
             print('')
             print('')
             print('')
-            i += 1
         print('Enter a tweet number to see all fields of the tweet')
         print('Otherwise press x to return')
         disp_tt_input = input('Input:')
-        if (disp_tt_input.isdigit() and int(disp_tt_input) < (i+1)):
+        if (disp_tt_input.isdigit() and 0 < int(disp_tt_input) <= len(toptweets)):
             clear()
-            # Displaying detailed information for the selected tweet
-            for field in data[int(disp_tt_input)-1]:
-                print("*", field, ": ", data[int(disp_tt_input)-1][field])
+            # Loading and displaying the full document of the selected tweet
+            selected_tweet = service.fetch_tweet(database, toptweets[int(disp_tt_input)-1]._id)
+            for field in selected_tweet:
+                print("*", field, ": ", selected_tweet[field])
             print('')
             input('Press any key to continue')
         elif (disp_tt_input == 'x'):
@@ -265,52 +290,49 @@ def list_users():
         if (list_input == 'x'):
             return
         elif list_input.isdigit():
-            # MongoDB aggregation pipeline to find top users based on followersCount
-            pipeline = [
-                {"$unwind": "$user"},  # Unwind the "user" array to work with individual tweets
-                {"$group": {
-                    "_id": "$user.username",
-                    "maxFollowersCount": {"$max": "$user.followersCount"},
-                    "displayname": {"$first": "$user.displayname"},
-                    "full": {"$first": "$user"}
-                }},
-                {"$sort": {"maxFollowersCount": -1}},
-                {"$limit": int(list_input)}
-            ]
-
-            # Execute the aggregation pipeline
-            top_users = list(infoCollection.aggregate(pipeline))
-            data = []
-            i = 0
+            # Reading the top users from the followersCount index of the users collection
+            top_users = service.top_users(database, int(list_input))
             clear()
             print('')
-            for user in top_users:
-                data.append(user)
-                print("USER", (i+1), ":")
+            for index, user in enumerate(top_users, start=1):
+                print("USER", index, ":")
                 print("-----------------------------------------------------------------------")
-                print(f"Username: {user['_id']} | Display Name: {user['displayname']} | Follower Count: {user['maxFollowersCount']}")
+                print(f"Username: {user.username} | Display Name: {user.displayname} | Follower Count: {user.followersCount}")
                 print('')
                 print('')
                 print('')
-                i += 1
             print('Enter a user number to see all fields of the user')
             print('Otherwise press x to return')
             disp_tt_input = input('Input:')
-            if (disp_tt_input.isdigit() and int(disp_tt_input) < (i+1)):
+            if (disp_tt_input.isdigit() and 0 < int(disp_tt_input) <= len(top_users)):
                 clear()
 
-                # Displaying detailed information for the selected user
-                user = data[int(disp_tt_input)-1]
-                print(f"{user['full']}")
+                # Loading and displaying the full profile of the selected user
+                user = service.fetch_user(database, top_users[int(disp_tt_input)-1].username)
+                print(f"{user}")
                 input("Press any key to return")
 
             elif (disp_tt_input == 'x'):
                 return
 
+def list_trending():
+    """
+    Displays the hashtags used most over the last day of tweets.
+
+    Returns:
+        None
+    """
+    clear()
+    print('')
+    # Read from the in-memory counts, so listing costs no query
+    for rank, (tag, count) in enumerate(service.trending_hashtags(database, 10), start=1):
+        print(f"{rank}: #{tag} - {count} tweets")
+    print('')
+    input('Press any key to return')
 
 def compose_tweets():
     """
-    Composes a tweet and inserts it into the database.
+    Composes a tweet and queues it for the next write to the database.
 
     Returns:
         None
@@ -321,61 +343,12 @@ def compose_tweets():
     print('')
     tweet_input = input('Input:')
 
-    # Converting time with timezone to ISO 8601 format without microseconds
-    dtime = datetime.now(timezone.utc).replace(microsecond=0)
-    dtimezone = dtime.astimezone().isoformat()
-
-    tweet = {
-        "url": None,
-        "date": dtimezone,
-        "content": tweet_input,
-        "renderedContent": None,
-        "id": None,
-        "user": {
-            "username": "291user",
-            "displayname": None,
-            "id": None,
-            "description": None,
-            "rawDescription": None,
-            "descriptionUrls": [],
-            "verified": None,
-            "created": None,
-            "followersCount": None,
-            "friendsCount": None,
-            "statusesCount": None,
-            "favouritesCount": None,
-            "listedCount": None,
-            "mediaCount": None,
-            "location": None,
-            "protected": None,
-            "linkUrl": None,
-            "linkTcourl": None,
-            "profileImageUrl": None,
-            "profileBannerUrl": None,
-            "url": None
-        },
-        "outlinks": None,
-        "tcooutlinks": None,
-        "replyCount": None,
-        "retweetCount": None,
-        "likeCount": None,
-        "quoteCount": None,
-        "conversationId": None,
-        "lang": None,
-        "source": None,
-        "sourceUrl": None,
-        "sourceLabel": None,
-        "media": None,
-        "retweetedTweet": None,
-        "quotedTweet": None,
-        "mentionedUsers": None,
-    }
-
-    # Insert the tweet into the database
-    infoCollection.insert_one(tweet)
+    # Queue the tweet, the buffer inserts it with the next batch
+    service.compose(database, tweet_input)
     clear()
     print('')
-    print('Tweet successful!')
+    # Nothing is written yet; the buffer reports a tweet it cannot write
+    print('Tweet queued, it will be posted within a second.')
     print('')
     input('Press any key to return')
     return
@@ -387,7 +360,22 @@ def main():
     Returns:
         None
     """
-    landing_page()
+    global database
+    # Opening the database creates any indexes and derived collections that are missing
+    database = service.Database(sys.argv[1], cache_mb=CACHE_MB, cache_ttl=CACHE_TTL, query_stats=QUERY_STATS,
+                                lazy=LAZY_DOCS)
+    landing_page(sys.argv)
+
+    # Write out any tweets still waiting in the buffer
+    database.close()
+
+    # Hit and miss counts, for sizing the cache
+    if os.environ.get('TWEETBOOK_CACHE_STATS'):
+        print(database.cache.summary())
+
+    # Query timings, for finding the slow pages
+    if QUERY_STATS is not None:
+        QUERY_STATS.save()
     return
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+import os
+import re
+import sys
+
+import pymongo
+from pymongo import UpdateOne
+
+from indexes import USER_INDEX_SPECS, ensure_indexes
+from paging import KeysetPager
+from records import User
+
+# The query cache is shared with the SQL side
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.cache import query_key
+
+# Fields shown in the user search listing
+LIST_PROJECTION = {"username": 1, "displayname": 1, "location": 1}
+
+# Fields shown in the top users listing
+TOP_PROJECTION = {"displayname": 1, "followersCount": 1}
+
+# Collapses tweets into one row per username holding its highest follower count
+USER_ROLLUP = [
+    {"$group": {
+        "_id": "$user.username",
+        "followersCount": {"$max": "$user.followersCount"},
+        "displayname": {"$first": "$user.displayname"},
+        "location": {"$first": "$user.location"},
+        "user": {"$first": "$user"},
+    }},
+    {"$set": {"username": "$_id"}},
+]
+
+def rebuild_users(tweets, users):
+    """
+    Rebuilds the users collection from every tweet with one aggregation.
+    This is the only full pass over the tweets; it is meant to run once after a bulk load.
+
+    Args:
+        tweets (Collection): The tweet collection.
+        users (Collection): The materialized users collection.
+
+    Returns:
+        None
+    """
+    users.drop()
+    list(tweets.aggregate(USER_ROLLUP + [{"$merge": {"into": users.name, "whenMatched": "replace"}}], allowDiskUse=True))
+    ensure_indexes(users, USER_INDEX_SPECS)
+
+def refresh_users(users, tweet_docs):
+    """
+    Folds newly written tweets into the users collection.
+    Existing users keep their first profile and have their follower count raised if needed.
+
+    Args:
+        users (Collection): The materialized users collection.
+        tweet_docs (list): The tweets that were just inserted.
+
+    Returns:
+        None
+    """
+    ops = []
+    for tweet in tweet_docs:
+        user = tweet.get("user") or {}
+        if not user.get("username"):
+            continue
+        ops.append(UpdateOne(
+            {"_id": user["username"]},
+            {
+                "$max": {"followersCount": user.get("followersCount")},
+                "$setOnInsert": {
+                    "username": user["username"],
+                    "displayname": user.get("displayname"),
+                    "location": user.get("location"),
+                    "user": user,
+                },
+            },
+            upsert=True))
+    if ops:
+        users.bulk_write(ops, ordered=False)
+
+def ensure_users(tweets, users):
+    """
+    Makes sure the users collection exists and is indexed.
+    It is built from the tweets the first time, e.g. for databases loaded before it existed.
+
+    Args:
+        tweets (Collection): The tweet collection.
+        users (Collection): The materialized users collection.
+
+    Returns:
+        None
+    """
+    if users.estimated_document_count() == 0 and tweets.estimated_document_count() > 0:
+        rebuild_users(tweets, users)
+    else:
+        ensure_indexes(users, USER_INDEX_SPECS)
+
+def top_users(users, n, cache=None):
+    """
+    Returns the n users with the most followers, read in order from the followersCount index.
+
+    Args:
+        users (Collection): The materialized users collection.
+        n (int): Number of users to return.
+        cache (QueryCache): Where to keep the rows, if anywhere; new tweets invalidate the 'users' tag.
+
+    Returns:
+        list: The users as User records; use fetch_user for a full profile.
+    """
+    def load():
+        return [User.from_doc(doc) for doc in users.find({}, TOP_PROJECTION).sort("followersCount", -1).limit(n)]
+
+    if cache is None:
+        return load()
+    return cache.get(query_key("top_users", users.name, n), load, [("users",)])
+
+def user_search_query(keyword):
+    """
+    Builds a query for users whose display name or location contains keyword as a whole word.
+    The text index narrows the search to candidate users, then the word-boundary
+    regexes check the match the same way the old tweet scan did.
+
+    Args:
+        keyword (str): The word or phrase to look for.
+
+    Returns:
+        dict: The MongoDB query.
+    """
+    pattern = r'\b' + re.escape(keyword) + r'\b'
+    return {
+        "$text": {"$search": '"{}"'.format(keyword.replace('"', ''))},
+        "$or": [
+            {"displayname": {"$regex": pattern, "$options": "i"}},
+            {"location": {"$regex": pattern, "$options": "i"}},
+        ],
+    }
+
+def user_pager(users, keyword, page_size=10, cache=None):
+    """
+    Creates a pager over the users matching keyword, ordered by username.
+    Each user appears once however many tweets they wrote, so the work grows with
+    the number of distinct users rather than tweets. The pages hold User records.
+
+    Args:
+        users (Collection): The materialized users collection.
+        keyword (str): The word or phrase to look for.
+        page_size (int): Number of users per page.
+        cache (QueryCache): Where to keep the pages read, if anywhere; new tweets invalidate the 'users' tag.
+
+    Returns:
+        KeysetPager: The pager, positioned on the first page.
+    """
+    return KeysetPager(users, user_search_query(keyword), LIST_PROJECTION,
+                       keys=(("_id", pymongo.ASCENDING),), page_size=page_size, cache=cache, tags=(("users",),),
+                       record=User)
+
+def fetch_user(users, username, cache=None):
+    """
+    Loads the full profile of a user picked from a listing.
+
+    Args:
+        users (Collection): The materialized users collection.
+        username (str): The username of the user.
+        cache (QueryCache): Where to keep the profile, if anywhere; new tweets by the user invalidate ('user', username).
+
+    Returns:
+        dict: The user subdocument, or None if the user does not exist.
+    """
+    def load():
+        row = users.find_one({"_id": username}, {"user": 1})
+        return None if row is None else row["user"]
+
+    if cache is None:
+        return load()
+    return cache.get(query_key("fetch_user", users.name, username), load, [("user", username)])
@@ -0,0 +1,140 @@
+import atexit
+import sys
+import threading
+import time
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+import users
+
+class WriteBuffer:
+    """
+    Write-behind buffer for composed tweets.
+    Tweets are collected in memory and written with one unordered insert_many,
+    followed by one users refresh and the after_flush hooks, once the buffer holds max_docs tweets or its
+    oldest tweet is max_delay seconds old. A background thread enforces the
+    time limit, and whatever is left is flushed when the program exits.
+
+    Tweets the server rejects, e.g. for a duplicate key, are reported and dropped;
+    after any other error, such as a lost connection, the tweets stay buffered for
+    the next flush. Only the tweets that were written reach the users refresh and the hooks.
+    """
+    def __init__(self, collection, users_collection=None, max_docs=500, max_delay=1.0):
+        """
+        Args:
+            collection (Collection): The tweet collection.
+            users_collection (Collection): The materialized users collection to keep up to date, if any.
+            max_docs (int): Number of buffered tweets that triggers a flush.
+            max_delay (float): Age in seconds of the oldest buffered tweet that triggers a flush.
+        """
+        self.collection = collection
+        self.users_collection = users_collection
+        self.max_docs = max_docs
+        self.max_delay = max_delay
+        self.docs = []
+        self.oldest = None
+        self.flushed = 0
+        # Functions called as f(docs) with the tweets of each flush, after they are written
+        self.after_flush = []
+        self.lock = threading.Lock()
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def add(self, tweet):
+        """
+        Queues a tweet, flushing right away if the buffer is full.
+
+        Args:
+            tweet (dict): The tweet document.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            if self.oldest is None:
+                self.oldest = time.monotonic()
+            self.docs.append(tweet)
+            full = len(self.docs) >= self.max_docs
+        if full:
+            try:
+                self.flush()
+            except PyMongoError as e:
+                print('Composed tweets not written yet, will retry: {}'.format(e), file=sys.stderr)
+
+    def flush(self):
+        """
+        Writes every buffered tweet.
+
+        Returns:
+            int: The number of tweets written.
+        """
+        with self.lock:
+            docs, oldest, self.docs, self.oldest = self.docs, self.oldest, [], None
+        if not docs:
+            return 0
+        try:
+            self.collection.insert_many(docs, ordered=False)
+            written = docs
+        except BulkWriteError as e:
+            written = self.written_docs(docs, e.details.get('writeErrors', []))
+        except PyMongoError:
+            # Nothing is known to be written; the retry skips the tweets that were, by their _id
+            with self.lock:
+                self.docs = docs + self.docs
+                self.oldest = oldest if self.oldest is None else min(oldest, self.oldest)
+            raise
+        if written:
+            if self.users_collection is not None:
+                users.refresh_users(self.users_collection, written)
+            for hook in self.after_flush:
+                hook(written)
+        self.flushed += len(written)
+        return len(written)
+
+    def written_docs(self, docs, errors):
+        """
+        Picks out the tweets of an unordered insert_many that are in the collection, and reports the rest.
+
+        Args:
+            docs (list): The tweets sent, in order.
+            errors (list): The writeErrors of the BulkWriteError.
+
+        Returns:
+            list: The tweets that were written.
+        """
+        failed = set()
+        for error in errors:
+            # A duplicate _id is a tweet written by an earlier try whose reply was lost
+            if error.get('code') == 11000 and '_id' in (error.get('keyPattern') or {}):
+                continue
+            failed.add(error['index'])
+            print('Tweet {} was not written: {}'.format(docs[error['index']].get('id'), error.get('errmsg')),
+                  file=sys.stderr)
+        return [doc for index, doc in enumerate(docs) if index not in failed]
+
+    def _run(self):
+        """
+        Background loop that flushes tweets that have waited max_delay seconds.
+        """
+        while not self.closed.wait(self.max_delay / 2):
+            with self.lock:
+                due = self.oldest is not None and time.monotonic() - self.oldest >= self.max_delay
+            if due:
+                # Any error is reported and the loop goes on, or later tweets would wait for a full buffer
+                try:
+                    self.flush()
+                except Exception as e:
+                    print('Composed tweets not written yet, will retry: {}'.format(e), file=sys.stderr)
+
+    def close(self):
+        """
+        Stops the background thread and flushes whatever is left.
+
+        Returns:
+            None
+        """
+        self.closed.set()
+        self.thread.join()
+        self.flush()